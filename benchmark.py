@@ -0,0 +1,127 @@
+import numpy as np
+import argparse
+import contextlib
+import io
+import os
+import os.path
+import shutil
+import tempfile
+import time
+import rf_support as rfs
+import extraction as ex
+import synthetic
+
+# Throughput benchmark for the extraction pipeline, on synthetic measurements with known RLGC (see synthetic.py)
+# Times every stage on its own (CSV parse, DB/DEG -> RI, S -> ABCD, pad extraction, de-embedding, distributed
+# extraction, output writing) and the whole extract_rlgc run, reports points per second (structures x frequency
+# points), and checks the extracted R/L/G/C against the values the data was generated from.
+#	python benchmark.py --points 20001 --samples 4
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--points", type=int, default=20001, help="Frequency points per file. Default is 20001")
+	parser.add_argument("--samples", type=int, default=2, help="Copies of every length/width (3 lengths x 2 widths each). Default is 2")
+	parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is reported. Default is 3")
+	parser.add_argument("--work_dir", default=None, help="Directory for the synthetic data and outputs, kept afterwards. Default is a temporary directory")
+	args = parser.parse_args()
+
+	samples = [ str(idx+1) for idx in range(args.samples) ]
+	(timings, max_rel_err) = run_benchmark(args.points, samples=samples, repeat=args.repeat, work_dir=args.work_dir)
+	print_report(timings, max_rel_err)
+
+
+def time_stage(func, repeat=1):
+	# (fastest wall time in s, result of the last call)
+	best = None
+	for idx in range(repeat):
+		start = time.perf_counter()
+		result = func()
+		elapsed = time.perf_counter() - start
+		if (best is None) or (elapsed < best):
+			best = elapsed
+
+	return (best, result)
+
+
+def run_benchmark(num_points=20001, lengths_um=(500, 1000, 2000), widths_um=(3, 5), samples=("1",), repeat=3, work_dir=None):
+	# Returns (timings, max_rel_err)
+	# timings: list of (stage name, seconds, points processed); max_rel_err: {"R": ..., "L": ..., "G": ..., "C": ...}
+	# The pad L/2L files are the first length and a structure twice as long, which must be among lengths_um
+	if work_dir is None:
+		tmp_dir = tempfile.mkdtemp(prefix="rlgc_benchmark_")
+	else:
+		tmp_dir = work_dir
+	try:
+		data_dir = os.path.join(tmp_dir, "data")
+		output_dir = os.path.join(tmp_dir, "extract")
+		filename_list = synthetic.write_measurement_set(data_dir, num_points, lengths_um, widths_um, samples)
+		length_um_vec = np.array( [ ex.parse_structure_filename(filename)[0] for filename in filename_list ] )
+		pad_L_idx = filename_list.index( os.path.join(data_dir, "{0:d}_{1:d}um_{2:s}.csv".format(lengths_um[0], widths_um[0], samples[0])) )
+		pad_2L_idx = filename_list.index( os.path.join(data_dir, "{0:d}_{1:d}um_{2:s}.csv".format(2*lengths_um[0], widths_um[0], samples[0])) )
+
+		num_structures = len(filename_list)
+		stack_points = num_structures * num_points
+		timings = []
+
+		def parse_all():
+			parsed = [ rfs.get_sdb_from_vna_csv(filename) for filename in filename_list ]
+			return ( np.array( [ p[0] for p in parsed ] ), np.array( [ p[1] for p in parsed ] ), np.array( [ p[2] for p in parsed ] ) )
+		(elapsed, (freq_mat, Sdb, Sdeg)) = time_stage(parse_all, repeat)
+		timings.append( ("CSV parse", elapsed, stack_points) )
+
+		(elapsed, Sri) = time_stage( lambda: rfs.sdb2sri(Sdb, Sdeg), repeat)
+		timings.append( ("DB/DEG -> RI", elapsed, stack_points) )
+
+		(elapsed, abcd) = time_stage( lambda: rfs.s2abcd(Sri, 50.0), repeat)
+		timings.append( ("S -> ABCD", elapsed, stack_points) )
+
+		freq = freq_mat[0]
+		(elapsed, pad_result) = time_stage( lambda: ex.get_pad_abcd_from_sdb(freq, Sdb[pad_L_idx], Sdeg[pad_L_idx], Sdb[pad_2L_idx], Sdeg[pad_2L_idx]), repeat)
+		abcd_pad_inv = pad_result[2]
+		timings.append( ("Pad extraction", elapsed, num_points) )
+
+		(elapsed, abcd_dut) = time_stage( lambda: ex.deembed_abcd(abcd_pad_inv, abcd), repeat)
+		timings.append( ("De-embedding", elapsed, stack_points) )
+
+		length_m_col = np.reshape(length_um_vec*1e-6, (-1, 1))
+		(elapsed, rlgc_result) = time_stage( lambda: ex.distributed_rlgc_from_abcd(length_m_col, freq_mat, abcd_dut), repeat)
+		(R_mat, L_mat, G_mat, C_mat) = rlgc_result[1:5]
+		timings.append( ("Distributed extraction", elapsed, stack_points) )
+
+		name_vec = [ os.path.splitext( os.path.basename(filename) )[0] for filename in filename_list ]
+		if not os.path.exists(output_dir):
+			os.makedirs(output_dir)
+		def write_all():
+			for idx in range(num_structures):
+				ex.write_rlgc(freq, R_mat[idx], L_mat[idx], G_mat[idx], C_mat[idx], "rlgc_" + name_vec[idx] + ".csv", output_dir)
+			for (data_name, data_mat) in [ ("R", R_mat), ("L", L_mat), ("C", C_mat), ("G", G_mat) ]:
+				ex.write_data(freq, data_mat, name_vec, data_name + ".csv", output_dir)
+		(elapsed, result) = time_stage(write_all, repeat)
+		timings.append( ("Output writing", elapsed, stack_points) )
+
+		def run_extract_rlgc():
+			with contextlib.redirect_stdout( io.StringIO() ):
+				ex.extract_rlgc(filename_list[pad_L_idx], filename_list[pad_2L_idx], skip_plots=True, struct_csv_name=os.path.join(data_dir, "*.csv"), output_dir=output_dir)
+		(elapsed, result) = time_stage(run_extract_rlgc, repeat)
+		timings.append( ("extract_rlgc (end to end)", elapsed, stack_points) )
+
+		max_rel_err = {}
+		for (data_name, data_mat, value) in zip( ["R", "L", "G", "C"], [R_mat, L_mat, G_mat, C_mat], synthetic.default_rlgc ):
+			max_rel_err[data_name] = float( np.max( np.abs(data_mat - value) ) / abs(value) )
+	finally:
+		if work_dir is None:
+			shutil.rmtree(tmp_dir, ignore_errors=True)
+
+	return (timings, max_rel_err)
+
+
+def print_report(timings, max_rel_err):
+	print("{0:28s} {1:>10s} {2:>12s} {3:>14s}".format("Stage", "Time (ms)", "Points", "Points/s") )
+	for (stage, elapsed, points) in timings:
+		print("{0:28s} {1:10.2f} {2:12d} {3:14.4g}".format(stage, elapsed*1e3, points, points/max(elapsed, 1e-12)) )
+	print("Max relative error vs. generating RLGC: " + ", ".join( [ "{0:s} {1:.2g}".format(name, max_rel_err[name]) for name in ["R", "L", "G", "C"] ] ) )
+
+
+if (__name__ == "__main__"):
+	main()
@@ -0,0 +1,250 @@
+import argparse
+import datetime
+import json
+import os
+import os.path
+import re
+import sqlite3
+import rf_support as rfs
+import result_cache
+
+# SQLite index of measurement files across wafers and runs, so structures are selected by query instead of globbing
+#	python catalog.py scan /data/wafers
+#	python catalog.py query "width=3 dirs=20"
+#	python extraction.py 500_3um_1.csv 1000_3um_1.csv --catalog_query "width=3 dirs=20"
+# Every $LENGTH_$WIDTHum_$SAMPLE.csv/.sNp file under the scanned roots gets a row with its path, directory, parsed
+# length/width/sample, size, mtime, sha1, frequency range, point and port count. Rescanning only reads files whose size
+# or mtime changed, and drops rows of files that are gone. extract_rlgc only queries 2-port files, and records every run it makes with a catalog:
+# pad files (with their hashes) or pad model, settings, output directory, and the structures that went in.
+#
+# Queries are space separated key=value terms, values comma separated (any of them matches), all terms must hold:
+#	length=500,1000  width=3  sample=1  ports=2  points=401  path=*/wafer1*/*  dirs=20
+# path is a glob on the absolute path (* matches across directories), dirs=N keeps the N directories holding the
+# most recently modified matches.
+# The catalog file is --catalog, or $RLGC_CATALOG, or ~/.rlgc_catalog.sqlite.
+
+structure_name_re = re.compile(r"^\d+_\d+um_.+\.(csv|s\d+p)$", re.IGNORECASE)
+
+schema = """
+CREATE TABLE IF NOT EXISTS measurements (
+	path TEXT PRIMARY KEY,
+	directory TEXT NOT NULL,
+	length_um INTEGER NOT NULL,
+	width_um INTEGER NOT NULL,
+	sample TEXT NOT NULL,
+	size INTEGER NOT NULL,
+	mtime REAL NOT NULL,
+	sha1 TEXT NOT NULL,
+	freq_min REAL,
+	freq_max REAL,
+	num_points INTEGER,
+	num_ports INTEGER,
+	scanned TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS measurements_width ON measurements (width_um, length_um);
+CREATE INDEX IF NOT EXISTS measurements_directory ON measurements (directory);
+CREATE INDEX IF NOT EXISTS measurements_sha1 ON measurements (sha1);
+CREATE TABLE IF NOT EXISTS runs (
+	run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+	created TEXT NOT NULL,
+	output_dir TEXT NOT NULL,
+	pad_L TEXT,
+	pad_2L TEXT,
+	pad_L_sha1 TEXT,
+	pad_2L_sha1 TEXT,
+	pad_model TEXT,
+	settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_structures (
+	run_id INTEGER NOT NULL REFERENCES runs (run_id),
+	path TEXT NOT NULL,
+	sha1 TEXT,
+	output TEXT
+);
+CREATE INDEX IF NOT EXISTS run_structures_path ON run_structures (path);
+"""
+
+query_columns = { "length": "length_um", "width": "width_um", "sample": "sample", "ports": "num_ports", "points": "num_points" }
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--catalog", default=None, help="Catalog file. Default is $RLGC_CATALOG, or ~/.rlgc_catalog.sqlite")
+	subparsers = parser.add_subparsers(dest="command", required=True)
+
+	scan_parser = subparsers.add_parser("scan", help="Add new and changed measurement files under the given directories")
+	scan_parser.add_argument("roots", nargs="+", help="Directories to scan recursively")
+	scan_parser.add_argument("--cache_dir", default=None, help="Directory for cached parsed measurements, filled while scanning so later extractions skip text parsing")
+
+	query_parser = subparsers.add_parser("query", help="Print the paths matching a query")
+	query_parser.add_argument("query", nargs="?", default="", help="Query terms, e.g. \"width=3 length=500,1000 dirs=20\". Default is every file")
+
+	runs_parser = subparsers.add_parser("runs", help="List recorded extraction runs")
+	runs_parser.add_argument("--path", default=None, help="Only runs that used this measurement file")
+	args = parser.parse_args()
+
+	if args.command == "scan":
+		(num_new, num_changed, num_unchanged, num_removed) = scan(args.catalog, args.roots, args.cache_dir)
+		print("{0:d} new, {1:d} changed, {2:d} unchanged, {3:d} removed".format(num_new, num_changed, num_unchanged, num_removed) )
+	elif args.command == "query":
+		for path in query_files(args.catalog, args.query):
+			print(path)
+	else:
+		for run in list_runs(args.catalog, args.path):
+			print("{0:6d}  {1:s}  {2:4d} structures  {3:s}  pads {4:s}  {5:s}".format(run["run_id"], run["created"], run["num_structures"], run["output_dir"], run["pad_model"] or "{0:s}, {1:s}".format(str(run["pad_L"]), str(run["pad_2L"])), run["settings"]) )
+
+
+def catalog_path(catalog=None):
+	if catalog is None:
+		catalog = os.environ.get("RLGC_CATALOG", os.path.join("~", ".rlgc_catalog.sqlite"))
+	return os.path.expanduser(catalog)
+
+
+def connect(catalog=None):
+	# Connection to the catalog, created (with its parent directory) if it doesn't exist yet
+	filename = catalog_path(catalog)
+	catalog_dir = os.path.dirname(filename)
+	if catalog_dir and not os.path.exists(catalog_dir):
+		os.makedirs(catalog_dir, exist_ok=True)
+	connection = sqlite3.connect(filename, timeout=30)
+	connection.row_factory = sqlite3.Row
+	connection.executescript(schema)
+
+	return connection
+
+
+def scan(catalog, roots, cache_dir=None):
+	# Brings the catalog up to date with the structure files under roots: (num_new, num_changed, num_unchanged, num_removed)
+	# Files whose size and mtime match their row are not opened; the others are hashed and parsed once.
+	import extraction as ex
+	counts = [0, 0, 0, 0]
+	scanned = datetime.datetime.now().isoformat(timespec="seconds")
+	with connect(catalog) as connection:
+		for root in roots:
+			root = os.path.abspath(root)
+			prefix = root.rstrip(os.sep) + os.sep
+			known = {}
+			for row in connection.execute("SELECT path, size, mtime FROM measurements WHERE substr(path, 1, ?) = ?", (len(prefix), prefix) ):
+				known[ row["path"] ] = (row["size"], row["mtime"])
+
+			seen = set()
+			for (dirpath, dirnames, filenames) in os.walk(root):
+				dirnames.sort()
+				for name in sorted(filenames):
+					if not structure_name_re.match(name):
+						continue
+					path = os.path.join(dirpath, name)
+					try:
+						stat = os.stat(path)
+					except OSError:
+						continue
+					seen.add(path)
+					if known.get(path) == (stat.st_size, stat.st_mtime):
+						counts[2] += 1
+						continue
+
+					(length_um, width_um, sample) = ex.parse_structure_filename(path)
+					try:
+						(freq_hz, Sdb, Sdeg) = rfs.get_sdb_nport_from_file(path, cache_dir)
+						freq_info = (float(freq_hz[0]), float(freq_hz[-1]), len(freq_hz), Sdb.shape[-1])
+					except (OSError, ValueError, IndexError) as error:
+						print("{0:s}: {1:s}".format(path, str(error)) )
+						freq_info = (None, None, None, None)
+					connection.execute("INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (path, dirpath, length_um, width_um, sample, stat.st_size, stat.st_mtime, result_cache.file_digest(path)) + freq_info + (scanned,) )
+					counts[1 if path in known else 0] += 1
+
+			removed = [ (path,) for path in known if path not in seen ]
+			connection.executemany("DELETE FROM measurements WHERE path = ?", removed)
+			counts[3] += len(removed)
+	connection.close()
+
+	return tuple(counts)
+
+
+def parse_query(query):
+	# "width=3 length=500,1000" -> {"width": ["3"], "length": ["500", "1000"]}
+	terms = {}
+	for term in query.split():
+		(key, sep, value) = term.partition("=")
+		if (not sep) or (key not in list(query_columns) + ["path", "dirs"]):
+			raise ValueError("Bad catalog query term {0:s} (expected KEY=VALUE with KEY one of {1:s})".format(term, ", ".join( list(query_columns) + ["path", "dirs"] )) )
+		terms.setdefault(key, []).extend( value.split(",") )
+
+	return terms
+
+
+def query_files(catalog, query="", num_ports=None):
+	# Paths matching query (see parse_query), sorted
+	# num_ports: only files with this many ports (e.g. 2 for extract_rlgc, which can't read N-port files); a ports term
+	# asking for any other count is an error
+	terms = dict( parse_query(query) if isinstance(query, str) else query )
+	if num_ports is not None:
+		if any( [ int(value) != num_ports for value in terms.get("ports", []) ] ):
+			raise ValueError("Catalog query \"{0:s}\" asks for other than {1:d}-port files".format(str(query), num_ports) )
+		terms["ports"] = [ str(num_ports) ]
+	where_list = []
+	params = []
+	for (key, column) in query_columns.items():
+		if key in terms:
+			where_list.append( "{0:s} IN ({1:s})".format(column, ", ".join( ["?"] * len(terms[key]) )) )
+			params.extend( terms[key] if key == "sample" else [ int(value) for value in terms[key] ] )
+	if "path" in terms:
+		where_list.append( "(" + " OR ".join( ["path GLOB ?"] * len(terms["path"]) ) + ")" )
+		params.extend( terms["path"] )
+	where_str = " AND ".join(where_list) if where_list else "1"
+	if "dirs" in terms:
+		where_str = "{0:s} AND directory IN (SELECT directory FROM measurements WHERE {0:s} GROUP BY directory ORDER BY MAX(mtime) DESC LIMIT ?)".format(where_str)
+		params = params + params + [ int(terms["dirs"][-1]) ]
+
+	with connect(catalog) as connection:
+		path_list = [ row["path"] for row in connection.execute("SELECT path FROM measurements WHERE " + where_str + " ORDER BY path", params) ]
+	connection.close()
+
+	return path_list
+
+
+def lookup(catalog, paths):
+	# {path: row dict} for the cataloged ones among paths
+	with connect(catalog) as connection:
+		rows = {}
+		for path in paths:
+			row = connection.execute("SELECT * FROM measurements WHERE path = ?", (os.path.abspath(path),) ).fetchone()
+			if row is not None:
+				rows[ row["path"] ] = dict(row)
+	connection.close()
+
+	return rows
+
+
+def record_run(catalog, file_list, output_names, output_dir, settings, pad_L_csv_filename=None, pad_2L_csv_filename=None, pad_model=None):
+	# Provenance of one extraction: pads (hashed) or pad model, settings (a JSON-able dict), the structures and their
+	# output files. Returns the run id
+	def digest(filename):
+		return result_cache.file_digest(filename) if (filename and os.path.isfile(filename)) else None
+	abs_files = [ os.path.abspath(filename) for filename in file_list ]
+	known_rows = lookup(catalog, abs_files)
+
+	with connect(catalog) as connection:
+		cursor = connection.execute("INSERT INTO runs (created, output_dir, pad_L, pad_2L, pad_L_sha1, pad_2L_sha1, pad_model, settings) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (datetime.datetime.now().isoformat(timespec="seconds"), os.path.abspath(output_dir), os.path.abspath(pad_L_csv_filename) if pad_L_csv_filename else None, os.path.abspath(pad_2L_csv_filename) if pad_2L_csv_filename else None, digest(pad_L_csv_filename), digest(pad_2L_csv_filename), pad_model, json.dumps(settings, sort_keys=True, default=str)) )
+		run_id = cursor.lastrowid
+		connection.executemany("INSERT INTO run_structures VALUES (?, ?, ?, ?)", [ (run_id, path, known_rows[path]["sha1"] if path in known_rows else None, output) for (path, output) in zip(abs_files, output_names) ] )
+	connection.close()
+
+	return run_id
+
+
+def list_runs(catalog, path=None):
+	# Recorded runs (newest first) as dicts with num_structures; only those that used path, if given
+	with connect(catalog) as connection:
+		if path is None:
+			rows = connection.execute("SELECT runs.*, COUNT(run_structures.path) AS num_structures FROM runs LEFT JOIN run_structures USING (run_id) GROUP BY run_id ORDER BY run_id DESC").fetchall()
+		else:
+			rows = connection.execute("SELECT runs.*, COUNT(run_structures.path) AS num_structures FROM runs JOIN run_structures USING (run_id) WHERE run_id IN (SELECT run_id FROM run_structures WHERE path = ?) GROUP BY run_id ORDER BY run_id DESC", (os.path.abspath(path),) ).fetchall()
+		run_list = [ dict(row) for row in rows ]
+	connection.close()
+
+	return run_list
+
+
+if (__name__ == "__main__"):
+	main()
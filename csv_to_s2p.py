@@ -1,59 +1,105 @@
 import re
 import glob
+import argparse
+import itertools
+import os
+import os.path
+import rf_support as rfs
 
-infile_list = glob.glob("*.csv")
+# Converts VNA CSV exports (freq, S11, S12, S21, S22 in DB/DEG) to Touchstone .s2p files
+#	python csv_to_s2p.py "*.csv" --port_impedance 50 --jobs 4
+# Files are streamed block_lines rows at a time, so memory doesn't depend on the file size.
+# Comment lines ("!") ahead of the data are copied, the frequency unit is taken from the Freq column header
+# and the port impedance is written into the option line.
 
-begin_data_re = re.compile("^BEGIN CH\d+_DATA")
-end_data_re = re.compile("^END")
 
-port_impedance_str = "50"
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("csv_files", nargs="*", default=["*.csv"], help="CSV files to convert. Accepts globs and directories (all *.csv in them). Default is *.csv")
+	parser.add_argument("--output_dir", default=None, help="Directory to store the .s2p files. Default is next to each CSV")
+	parser.add_argument("--port_impedance", type=float, default=50.0, help="Reference impedance of the measurement in Ohms. Default is 50")
+	parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes used to convert files in parallel. Default is 1")
+	parser.add_argument("--block_lines", type=int, default=65536, help="Number of rows read and converted at a time. Default is 65536")
+	args = parser.parse_args()
 
+	filename_list = []
+	for pattern in args.csv_files:
+		if os.path.isdir(pattern):
+			pattern = os.path.join(pattern, "*.csv")
+		filename_list += sorted( glob.glob(pattern) )
 
-for infile_name in infile_list:
-	infile_name_arr = infile_name.split(".")
-	outfile_name = infile_name_arr[0] + ".s2p"
-	infile = open(infile_name, 'r')
-	outfile = open(outfile_name,'w')
+	print("Converting {0:d} files...".format(len(filename_list)) )
+	convert_csv_files(filename_list, args.output_dir, args.port_impedance, args.jobs, args.block_lines)
 
 
-	header_found = False
-	header_data_gathered = False
-	freq_unit_str = "HZ" # default freq units
-	column_index_dict = {}
-	for line in infile:
+# Touchstone wants S11, S21, S12, S22; the VNA CSV has S11, S12, S21, S22
+s2p_column_order = [0, 1, 2, 5, 6, 3, 4, 7, 8]
+freq_unit_re = re.compile("Freq\\s*\\(\\s*([KMG]?HZ)\\s*\\)", re.IGNORECASE)
 
-		if not header_found:
-			m = begin_data_re.search(line)
-			if (m):
-				header_found = True
-			else:
-				if line[0] == "!": # preserve any comments
-					outfile.write(line)
 
-		else: # header found
-			if not header_data_gathered: # this line will have header data
-				# [FIX] For now assume everything has the same format
-				#	Freq(Hz),S11(DB),S11(DEG),S12(DB),S12(DEG),S21(DB),S21(DEG),S22(DB),S22(DEG)
-				freq_unit_str = "HZ"
-				s_param_format = "DB"
-				port_impedance_str = "50"
-						
+def s2p_path(csv_filename, output_dir=None):
+	if output_dir is None:
+		output_dir = os.path.dirname(csv_filename)
+	base_name = os.path.splitext( os.path.basename(csv_filename) )[0]
+	return os.path.join(output_dir, base_name + ".s2p")
 
-				header_str = "# {0:s} S {1:s} R {2:s}\n".format(freq_unit_str, s_param_format, port_impedance_str)
-				outfile.write(header_str)
-				header_data_gathered = True
-			else: # go ahead and write all the data
-				# need to remap things a bit, since S2P format requires certain order for S params
-				# in S2P, it must be S11, S21, S12, S22
-				nline = line.strip()
-				line_arr = nline.split(",")
-				if (len(line_arr) == 9):
-					index_order = [0, 1, 2, 5, 6, 3, 4, 7, 8]
-					line_arr_reord = [line_arr[idx] for idx in index_order]
 
-					new_line = " ".join(line_arr_reord)
-					outfile.write(new_line + "\n")
-				
+def convert_csv_files(filename_list, output_dir=None, port_impedance=50.0, jobs=1, block_lines=65536):
+	# Converts every file, spread over jobs worker processes. Returns the .s2p filenames.
+	if (output_dir is not None) and not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+	s2p_list = [ s2p_path(filename, output_dir) for filename in filename_list ]
 
+	num_files = len(filename_list)
+	if (jobs > 1) and (num_files > 1):
+		from concurrent.futures import ProcessPoolExecutor
+		with ProcessPoolExecutor(max_workers=jobs) as pool:
+			s2p_list = list( pool.map(csv_to_s2p, filename_list, s2p_list, [port_impedance]*num_files, [block_lines]*num_files) )
+	else:
+		s2p_list = [ csv_to_s2p(filename, s2p_filename, port_impedance, block_lines) for (filename, s2p_filename) in zip(filename_list, s2p_list) ]
 
+	return s2p_list
 
+
+def csv_to_s2p(csv_filename, s2p_filename=None, port_impedance=50.0, block_lines=65536):
+	# Converts one VNA CSV to Touchstone, returns the .s2p filename
+	if s2p_filename is None:
+		s2p_filename = s2p_path(csv_filename)
+
+	with open(csv_filename, 'r') as infile, open(s2p_filename, 'w') as outfile:
+		# Copy comments up to the header row (the first one whose first column mentions Freq)
+		freq_unit_str = "HZ"
+		for line in infile:
+			if re.search("Freq", line.split(",", 1)[0]):
+				m = freq_unit_re.search(line)
+				if m:
+					freq_unit_str = m.group(1).upper()
+				break
+			if line[0] == "!": # preserve any comments
+				outfile.write(line)
+
+		outfile.write("# {0:s} S DB R {1:g}\n".format(freq_unit_str, port_impedance) )
+
+		while True:
+			lines = list( itertools.islice(infile, block_lines) )
+			if len(lines) == 0:
+				break
+			data_lines = [ line.rstrip("\r\n") for line in lines if line.count(",") == 8 ]
+			data = rfs.parse_csv_block(data_lines, 9)
+			write_s2p_block(outfile, data[:, s2p_column_order])
+
+	return s2p_filename
+
+
+def write_s2p_block(outfile, data, fmt="%.12g"):
+	# Space separated rows, formatted with a single string operation for the whole block
+	if data.size == 0:
+		return
+
+	row_fmt = " ".join( [fmt] * data.shape[1] )
+	block_fmt = "\n".join( [row_fmt] * data.shape[0] ) + "\n"
+	outfile.write( block_fmt % tuple( data.ravel().tolist() ) )
+
+
+if (__name__ == "__main__"):
+	main()
@@ -1,6 +1,9 @@
 import numpy as np
-import scipy.linalg as la
-import matplotlib.pyplot as pl
+import plot_render
+import result_store
+import result_cache
+import profiling
+import pad_library
 import math
 import glob
 import argparse
@@ -11,37 +14,166 @@ import os.path
 
 def main():
 	parser = argparse.ArgumentParser()
-	parser.add_argument("pad_L_csv_file", help="Filename for L structure measurement to be used for pad extraction")
-	parser.add_argument("pad_2L_csv_file", help="Filename for 2L structure measurement to be used for pad extraction")
-	parser.add_argument("--struct_csv_name", default="*.csv", help="Filename for structure to convert. If this argument is presented, ONLY file names conforming to this naming scheme will be processed. Accepts globs (i.e. input *_foo.s2p to process all files ending with _foo.s2p). Default is *.s2p (all s2p files)")
+	parser.add_argument("pad_L_csv_file", nargs="?", default=None, help="Filename for L structure measurement to be used for pad extraction. Not needed with --pad_model")
+	parser.add_argument("pad_2L_csv_file", nargs="?", default=None, help="Filename for 2L structure measurement to be used for pad extraction. Not needed with --pad_model")
+	parser.add_argument("--struct_csv_name", default="*.csv", help="Filename for structure to convert. If this argument is presented, ONLY file names conforming to this naming scheme will be processed. VNA CSV and Touchstone .s2p files are both read. Accepts globs (i.e. input *_foo.s2p to process all files ending with _foo.s2p). Default is *.csv (all csv files)")
 	parser.add_argument("--skip_deembed", default=False, action='store_true', help="Use this flag to skip pad deembedding. You will still need to input the pad L/2L filenames, but they will not be used")	
 	parser.add_argument("--z0_real", type=float, default=50, help="Real portion of probe impedance. Default is 50 Ohms")
 	parser.add_argument("--z0_imag", type=float, default=0, help="Imaginary portion of probe impedance. Default is 0 Ohms (Default impedance is 50 + 0j)")
 	parser.add_argument("--skip_plots", action="store_true", default=False, help="Skip plotting for faster data extraction")
+	parser.add_argument("--defer_plots", action="store_true", default=False, help="Save plot data under OUTPUT_DIR/plot_data but don't render it. Render later with plot_render.py")
+	parser.add_argument("--plot_jobs", type=int, default=1, help="Number of worker processes used to render plots once extraction is done. Default is 1")
 	parser.add_argument("--method", default="distributed", choices=["distributed", "lumped"], help="Type of RLGC extraction to perform. distributed (default) -- treats structure as transmission line and extracts from S in DB/DEG form. lumped -- treats structure as lumped element.") 
+	parser.add_argument("--branch", default="principal", choices=["principal", "unwrap"], help="Branch of arccosh used for gamma*length in distributed extraction. principal (default) -- beta*length folded into (-pi, pi], fine while the lines are under half a wavelength long. unwrap -- gamma*length tracked continuously over the sweep, for electrically long lines (needs the phase to change by less than pi between frequency points)")
 	parser.add_argument("--tag", default="", help="Output file tag")
 	parser.add_argument("--output_dir", default="extract", help="Directory to store outputs")
+	parser.add_argument("--cache_dir", default=None, help="Directory for cached parsed measurements. Re-running over unchanged CSVs skips text parsing. Default is no caching")
+	parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes used to extract structures in parallel. Default is 1 (no pool)")
+	parser.add_argument("--result_cache_dir", default=None, help="Directory for cached extraction results, keyed by the contents of each structure file, the pad files and the extraction settings. Only new or changed structures are extracted. Default is no result cache")
+	parser.add_argument("--result_cache_max_mb", type=float, default=1024, help="Size limit for the result cache in MB; least recently used results are removed past it. Default is 1024")
+	parser.add_argument("--format", default="csv", choices=["csv"] + result_store.store_formats, help="Output format for the extracted RLGC. csv (default) -- rlgc_*.csv per structure plus R/L/G/C.csv. npz -- every structure and the run settings in one rlgc.npz. columnar -- same, as one .npy per column under rlgc.cols/. The averaged R file is written as CSV in all cases")
+	parser.add_argument("--joint", action="store_true", default=False, help="Fit one RLGC set per width across all lengths of that width (least squares over length at each frequency) instead of extracting every structure separately. Writes rlgc_joint_W*um.csv")
+	parser.add_argument("--joint_offset", action="store_true", default=False, help="With --joint, also fit a length-independent offset, absorbing pad de-embedding error")
+	parser.add_argument("--profile", default=None, help="Write a JSON summary of wall/CPU time per stage and per file, points processed and peak memory to this file, and print the stage table")
+	parser.add_argument("--cprofile", default=None, help="Also run the extraction under cProfile and dump the stats to this file (read with python -m pstats)")
+	parser.add_argument("--stream_chunk", type=int, default=0, help="Stream the measurements through extraction this many frequency points at a time, so memory doesn't grow with the sweep length. Writes the csv outputs only, without plots. Default is 0 (load whole files)")
+	parser.add_argument("--pad_model", default=None, help="De-embed with a stored pad model (see pad_library.py) instead of extracting the pads from the L/2L files. A model name in the pad library, or a path to a .pad.npz file")
+	parser.add_argument("--save_pad_model", default=None, help="Extract the pads from the L/2L files, store them in the pad library under this name (or at this .pad.npz path) and de-embed with them")
+	parser.add_argument("--pad_library", default=None, help="Pad library directory. Default is $RLGC_PAD_LIBRARY, or ~/.rlgc_pad_library")
+	parser.add_argument("--catalog", default=None, help="Measurement catalog (see catalog.py) to select structures from with --catalog_query, and to record this run's pads, settings and outputs in. Default is no catalog, or $RLGC_CATALOG / ~/.rlgc_catalog.sqlite with --catalog_query")
+	parser.add_argument("--catalog_query", default=None, help="Extract the cataloged structures matching this query (e.g. \"width=3 dirs=20\", see catalog.py) instead of globbing --struct_csv_name")
+	parser.add_argument("--z0_sweep", type=complex, nargs="+", default=None, help="Extract at each of these probe impedances in one pass (e.g. 45 50 55 50+2j) instead of at --z0_real/--z0_imag. Writes R/L/G/C$TAG_z0_$Z0.csv per impedance and the R/L spread across lengths of each one to z0_sweep$TAG.csv")
+	parser.add_argument("--z0_select", action="store_true", default=False, help="With --z0_sweep, also write the regular R/L/G/C outputs at the swept impedance with the lowest R/L spread across lengths")
 	args = parser.parse_args()
 	
 	z0_probe = complex(args.z0_real, args.z0_imag)
-	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, args.skip_plots, args.struct_csv_name, args.skip_deembed, args.tag, args.output_dir)
-
-	
-
-def extract_rlgc(pad_L_csv_filename, pad_2L_csv_filename, z0_probe=complex(50.0,0), method="distributed", skip_plots=False, struct_csv_name="*.csv", skip_deembed=False, output_tag = "", output_dir="extract"):
-
-	file_list = glob.glob(struct_csv_name)
+	if (args.pad_model is None) and ((args.pad_L_csv_file is None) or (args.pad_2L_csv_file is None)):
+		parser.error("the pad L/2L files are required unless --pad_model is given")
+	if args.save_pad_model is not None:
+		(freq_pad, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = get_pad_abcd(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.cache_dir)
+		args.pad_model = pad_library.save_pad_model(args.save_pad_model, freq_pad, abcd_pad, abcd_pad_inv, z0_probe, args.pad_L_csv_file, args.pad_2L_csv_file, args.pad_library)
+		print("Saved pad model to {0:s}".format(args.pad_model) )
+	if args.z0_sweep is not None:
+		if args.pad_model is not None:
+			parser.error("--z0_sweep extracts the pads at every impedance from the L/2L files and can't use a pad model")
+		if args.stream_chunk > 0:
+			parser.error("--z0_sweep loads whole files and can't be streamed")
+		extract_rlgc_z0_sweep(args.pad_L_csv_file, args.pad_2L_csv_file, args.z0_sweep, args.method, args.struct_csv_name, args.skip_deembed, args.tag, args.output_dir, args.cache_dir, branch=args.branch, select=args.z0_select)
+		return
+	if args.stream_chunk > 0:
+		if args.branch != "principal":
+			parser.error("--stream_chunk extracts every chunk on its own and can't unwrap across the sweep")
+		if args.pad_model is not None:
+			parser.error("--stream_chunk reads the pads from the L/2L files alongside the structures and can't use a pad model")
+		import streaming
+		streaming.extract_rlgc_streaming(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, args.struct_csv_name, args.skip_deembed, args.tag, args.output_dir, args.stream_chunk)
+		return
+	if args.joint:
+		extract_rlgc_joint(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.struct_csv_name, args.skip_deembed, args.tag, args.output_dir, args.cache_dir, fit_offset=args.joint_offset, pad_model=args.pad_model, pad_library_dir=args.pad_library, branch=args.branch)
+		return
+	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, args.skip_plots, args.struct_csv_name, args.skip_deembed, args.tag, args.output_dir, args.cache_dir, args.jobs, defer_plots=args.defer_plots, plot_jobs=args.plot_jobs, output_format=args.format, result_cache_dir=args.result_cache_dir, result_cache_max_mb=args.result_cache_max_mb, profile_json=args.profile, cprofile_stats=args.cprofile, pad_model=args.pad_model, pad_library_dir=args.pad_library, branch=args.branch, catalog=args.catalog, catalog_query=args.catalog_query)
+
+	
+
+def extract_rlgc(pad_L_csv_filename, pad_2L_csv_filename, z0_probe=complex(50.0,0), method="distributed", skip_plots=False, struct_csv_name="*.csv", skip_deembed=False, output_tag = "", output_dir="extract", cache_dir=None, jobs=1, measurements=None, defer_plots=False, plot_jobs=1, output_format="csv", result_cache_dir=None, result_cache_max_mb=1024, profile=None, profile_json=None, cprofile_stats=None, pad_model=None, pad_library_dir=None, branch="principal", catalog=None, catalog_query=None):
+	# jobs > 1 spreads the per-structure work (parse, de-embed, extract, write) over a process pool.
+	# Results are collected in file order, so the aggregate outputs don't depend on jobs.
+	# measurements: optional MeasurementSet (see measurement_set.py). When given, its structures are used
+	# instead of globbing struct_csv_name, and nothing is re-read from disk.
+	# Without a pool, structures that share a frequency grid are stacked and extracted together (extract_rlgc_stacked).
+	# Plots are not made during extraction: each structure's results are saved under output_dir/plot_data and the
+	# PDFs are rendered (over plot_jobs processes) after all data files are written, or not at all with defer_plots.
+	# output_format: "csv", or one of the result_store formats ("npz", "columnar") to write everything in one file.
+	# result_cache_dir: optional persistent cache of per-structure results (see result_cache.py). Only structures whose
+	# inputs changed are parsed and extracted; all outputs are still rebuilt from cached plus fresh results.
+	# The cache is trimmed back to result_cache_max_mb (least recently used first) at the end of the run.
+	# profile: optional profiling.Profile that records time, points and memory per stage and per file (see profiling.py).
+	# profile_json: write that summary (a fresh Profile if none is given) to this JSON file at the end of the run.
+	# cprofile_stats: run under cProfile and dump the stats to this file.
+	# pad_model: name (in pad_library_dir) or path of a stored pad model (see pad_library.py) to de-embed with;
+	# the pad L/2L files are then not read at all.
+	# branch: "principal" or "unwrap", how distributed extraction picks the branch of gamma*length (see unwrap_gamma_l).
+	# catalog_query: select the structures from the measurement catalog (see catalog.py) instead of globbing struct_csv_name.
+	# Only 2-port files match; N-port ones in the same tree are for multiport.py.
+	# catalog: catalog file to query (None for the default one) and to record the run in. The run is recorded whenever
+	# either is given.
+	
+	if (profile is None) and (profile_json is not None):
+		profile = profiling.Profile()
+	with profiling.activate(profile), profiling.cprofile_run(cprofile_stats):
+		result = extract_rlgc_stages(pad_L_csv_filename, pad_2L_csv_filename, z0_probe, method, skip_plots, struct_csv_name, skip_deembed, output_tag, output_dir, cache_dir, jobs, measurements, defer_plots, plot_jobs, output_format, result_cache_dir, result_cache_max_mb, pad_model, pad_library_dir, branch, catalog, catalog_query)
+	
+	if profile_json is not None:
+		profile.write_json(profile_json)
+		print(profile.report())
+	
+	return result
+
+
+def extract_rlgc_stages(pad_L_csv_filename, pad_2L_csv_filename, z0_probe, method, skip_plots, struct_csv_name, skip_deembed, output_tag, output_dir, cache_dir, jobs, measurements, defer_plots, plot_jobs, output_format, result_cache_dir, result_cache_max_mb, pad_model, pad_library_dir, branch, catalog, catalog_query):
+	# The body of extract_rlgc, run inside its profiling context
+
+	if measurements is not None:
+		file_list = measurements.filenames
+	elif catalog_query is not None:
+		import catalog as measurement_catalog
+		with profiling.stage("catalog query"):
+			file_list = measurement_catalog.query_files(catalog, catalog_query, num_ports=2)
+		print("Catalog query \"{0:s}\": {1:d} structures".format(catalog_query, len(file_list)) )
+	else:
+		file_list = glob.glob(struct_csv_name)
 	if not os.path.exists(output_dir):
 		os.makedirs(output_dir)
 	
-	
-	print("Pad Deembedding file (L):  {0:s}".format(pad_L_csv_filename) )
-	print("Pad Deembedding file (2L): {0:s}".format(pad_2L_csv_filename) )
-	# Get pad deembedding parameters
-	if not skip_deembed:
-		(freq, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = get_pad_abcd(pad_L_csv_filename, pad_2L_csv_filename, z0_probe)
+	# Look everything up in the result cache first; only the misses need any work
+	cached_results = [None] * len(file_list)
+	cache_keys = [None] * len(file_list)
+	if result_cache_dir:
+		with profiling.stage("result cache lookup"):
+			if (pad_model is not None) and not skip_deembed:
+				pad_key = "pad_model" + result_cache.file_digest( pad_library.pad_model_path(pad_model, pad_library_dir) )
+			else:
+				pad_key = result_cache.pad_digest(pad_L_csv_filename, pad_2L_csv_filename, skip_deembed)
+			cache_keys = [ result_cache.structure_key(filename, pad_key, z0_probe, method, skip_deembed, branch) for filename in file_list ]
+			cached_results = [ result_cache.load_result(result_cache_dir, key) for key in cache_keys ]
+		print("Result cache: {0:d} of {1:d} structures already extracted".format( len(file_list) - cached_results.count(None), len(file_list) ) )
+	todo_inds = [ idx for idx in range(len(file_list)) if cached_results[idx] is None ]
+	
+	# Structures are extracted on the sweep they were measured on, stacked per sweep; only the aggregate outputs
+	# resample them onto a common grid. Result cache entries thus never depend on the other files of a run
+	measurement_groups = []
+	if measurements is not None:
+		if len(todo_inds) < len(file_list):
+			measurements = measurements.take(todo_inds)
+		measurement_groups = measurements.group_by_grid()
+	elif (jobs <= 1) and (len(todo_inds) > 0):
+		from measurement_set import MeasurementSet
+		with profiling.stage("parse") as info:
+			measurement_groups = MeasurementSet.from_files_by_grid( [ file_list[idx] for idx in todo_inds ], cache_dir=cache_dir)
+			info["points"] = sum( [ np.size(group.freq_hz) for (inds, group) in measurement_groups ] )
+	pad_measurements = measurement_groups[0][1] if len(measurement_groups) > 0 else None
+	
+	if pad_model is not None:
+		print("Pad model: {0:s}".format( pad_library.pad_model_path(pad_model, pad_library_dir) ) )
 	else:
+		print("Pad Deembedding file (L):  {0:s}".format(pad_L_csv_filename) )
+		print("Pad Deembedding file (2L): {0:s}".format(pad_2L_csv_filename) )
+	# Get pad deembedding parameters
+	freq_pad = None
+	if skip_deembed or (len(todo_inds) == 0):
 		abcd_pad_inv = [] # dummy value needed for extract_rlcg_from_measurement call below
+	elif pad_model is not None:
+		with profiling.stage("pad model load") as info:
+			(freq_pad, abcd_pad, abcd_pad_inv, model_z0, model_meta) = pad_library.load_pad_model(pad_model, pad_library_dir, z0_probe)
+			info["points"] = len(freq_pad)
+	elif pad_measurements is not None:
+		with profiling.stage("pad extraction") as info:
+			(freq_pad, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = pad_measurements.get_pad_abcd(pad_L_csv_filename, pad_2L_csv_filename, z0_probe, cache_dir)
+			info["points"] = len(freq_pad)
+	else:
+		with profiling.stage("pad extraction") as info:
+			(freq_pad, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = get_pad_abcd(pad_L_csv_filename, pad_2L_csv_filename, z0_probe, cache_dir)
+			info["points"] = len(freq_pad)
 	
 	print("Extracting RLGC using {0:s} method...".format(method))
 	freq_mat = []
@@ -52,20 +184,10 @@ def extract_rlgc(pad_L_csv_filename, pad_2L_csv_filename, z0_probe=complex(50.0,
 	length_vec = []
 	width_vec = []
 	name_vec = []
+	sample_vec = []
+	output_names = []
 	for filename in file_list:
-		# First strip out any stuff from the path
-		nfilename_arr = filename.split("\\")
-		nfilename = nfilename_arr[-1]
-		
-		# now process the actual filename
-		filename_arr = nfilename.split("_")
-		trace_length_um = int(filename_arr[0])
-		length_m = trace_length_um * 1e-6
-		
-		trace_width_name = filename_arr[1]
-		trace_width_um = int( trace_width_name[0:-2] ) # get rid of the "um" in the width section
-		data_final_arr = "_".join(filename_arr[2:]).split(".")
-		data_final_str = data_final_arr[0]
+		(trace_length_um, trace_width_um, data_final_str) = parse_structure_filename(filename)
 		print("\tL: {0:d}um \t W: {1:d}um \t Sample: {2:s}".format(trace_length_um, trace_width_um, data_final_str) )
 		
 		# Construct output filename for each input file
@@ -75,59 +197,408 @@ def extract_rlgc(pad_L_csv_filename, pad_2L_csv_filename, z0_probe=complex(50.0,
 		# $WIDTH is the structure width in microns
 		# and $WHATEVER is whatever's left over,  typically a sample number and maybe some other info
 		structure_string = "L{0:d}um_W{1:d}um_{2:s}".format(trace_length_um, trace_width_um, data_final_str)
-		rlgc_filename = "rlgc_" + structure_string + output_tag +  ".csv"
+		if output_format == "csv":
+			rlgc_filename = "rlgc_" + structure_string + output_tag +  ".csv"
+		else:
+			rlgc_filename = None # everything goes in the result store instead
 
-		(freq_hz, S, Z, T, Sdb, Sdeg) = rfs.get_rf_params_from_vna_csv(filename)
-		Sdb_dut = Sdb
-		Sdeg_dut = Sdeg
-		abcd_dut = T
+		name_vec.append(structure_string)
+		sample_vec.append(data_final_str)
+		length_vec.append(trace_length_um)
+		width_vec.append(trace_width_um)
+		output_names.append( (rlgc_filename, structure_string + output_tag) )
+	
+	job_list = []
+	for (todo_idx, file_idx) in enumerate(todo_inds):
+		measurement = None
+		structure_cache_dir = result_cache_dir
+		if measurements is not None:
+			measurement = measurements.get_measurement(todo_idx)
+			# a structure resampled in a passed in set isn't what its file alone gives, so it isn't cached
+			if not measurements.as_measured(todo_idx):
+				structure_cache_dir = None
+		(rlgc_filename, plot_name) = output_names[file_idx]
+		job_list.append( (file_list[file_idx], length_vec[file_idx]*1e-6, z0_probe, method, skip_deembed, skip_plots, rlgc_filename, plot_name, output_dir, cache_dir, measurement, structure_cache_dir, cache_keys[file_idx], freq_pad, branch) )
+	
+	if (jobs > 1) and (len(job_list) > 1):
+		with profiling.stage("structure jobs (pool)"):
+			todo_results = run_structure_jobs(job_list, abcd_pad_inv, jobs)
+	elif (len(measurement_groups) > 0) and (len(job_list) > 0):
+		todo_results = [None] * len(job_list)
+		for (group_inds, group) in measurement_groups:
+			todo_lengths_m = np.array( [ job_list[idx][1] for idx in group_inds ] )
+			(freq_hz, Sdb, Sdeg, abcd_meas) = (group.freq_hz, group.Sdb, group.Sdeg, group.abcd)
+			group_pad_inv = abcd_pad_inv
+			if (freq_pad is not None) and not rfs.grids_match(freq_pad, freq_hz[0]):
+				with profiling.stage("grid alignment"):
+					mask = pad_range_mask(freq_pad, freq_hz[0])
+					(freq_hz, Sdb, Sdeg, abcd_meas) = (freq_hz[:, mask], Sdb[:, mask], Sdeg[:, mask], abcd_meas[:, mask])
+					group_pad_inv = align_pad_to_grid(freq_pad, abcd_pad_inv, freq_hz[0])
+			(freq_stack, R_stack, L_stack, G_stack, C_stack) = extract_rlgc_stacked(freq_hz, todo_lengths_m, group_pad_inv, abcd_meas, z0_probe, method, skip_deembed, branch)
+			for (stack_idx, idx) in enumerate(group_inds):
+				(freq, R, L, G, C) = (freq_stack[stack_idx], R_stack[stack_idx], L_stack[stack_idx], G_stack[stack_idx], C_stack[stack_idx])
+				todo_results[idx] = (freq, R, L, G, C)
+				(rlgc_filename, plot_name) = job_list[idx][6:8]
+				write_structure_outputs(freq, R, L, G, C, Sdb[stack_idx], Sdeg[stack_idx], rlgc_filename, plot_name, output_dir, skip_plots)
+				if job_list[idx][11]:
+					result_cache.store_result(job_list[idx][11], job_list[idx][12], freq, R, L, G, C, Sdb[stack_idx], Sdeg[stack_idx])
+	else:
+		todo_results = [ extract_structure(abcd_pad_inv, *job) for job in job_list ]
+	
+	# Cached structures still get their per-structure outputs, since output_dir may be new
+	result_list = list(cached_results)
+	for (todo_idx, file_idx) in enumerate(todo_inds):
+		result_list[file_idx] = todo_results[todo_idx]
+	for file_idx in range(len(file_list)):
+		if cached_results[file_idx] is not None:
+			(freq, R, L, G, C, Sdb, Sdeg) = cached_results[file_idx]
+			(rlgc_filename, plot_name) = output_names[file_idx]
+			write_structure_outputs(freq, R, L, G, C, Sdb, Sdeg, rlgc_filename, plot_name, output_dir, skip_plots)
+			result_list[file_idx] = (freq, R, L, G, C)
+	
+	for (freq, R, L, G, C) in result_list:
+		freq_mat.append(freq)
+		R_mat.append(R)
+		L_mat.append(L)
+		G_mat.append(G)
+		C_mat.append(C)
+	
+	# The aggregate outputs have one frequency column; structures measured (or cached) on other sweeps are resampled onto a common one
+	if not all( [ rfs.grids_match(freq, freq_mat[0]) for freq in freq_mat ] ):
+		with profiling.stage("grid alignment"):
+			(freq_mat, R_mat, L_mat, G_mat, C_mat) = align_results_to_grid(freq_mat, R_mat, L_mat, G_mat, C_mat)
+	
+	metadata = { "z0_real": complex(z0_probe).real, "z0_imag": complex(z0_probe).imag, "method": method, "branch": branch, "skip_deembed": skip_deembed, "pad_L": pad_L_csv_filename, "pad_2L": pad_2L_csv_filename, "pad_model": pad_model, "output_tag": output_tag }
+	with profiling.stage("aggregate outputs", points=sum( [ np.size(freq) for freq in freq_mat ] )):
+		write_aggregate_outputs(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec, sample_vec, output_tag, output_dir, output_format, metadata)
+	
+	if not (skip_plots or defer_plots):
+		print("Rendering plots...")
+		plot_data_list = [ plot_render.plot_data_path(plot_name, output_dir) for (rlgc_filename, plot_name) in output_names ]
+		with profiling.stage("plots"):
+			plot_render.render_plot_files(plot_data_list, output_dir, plot_jobs)
+	
+	if result_cache_dir:
+		result_cache.evict_results(result_cache_dir, result_cache_max_mb * 1e6)
+	
+	if (catalog is not None) or (catalog_query is not None):
+		import catalog as measurement_catalog
+		if output_format == "csv":
+			output_list = [ os.path.join(output_dir, rlgc_filename) for (rlgc_filename, plot_name) in output_names ]
+		else:
+			output_list = [ result_store.result_store_path(output_format, output_tag, output_dir) ] * len(file_list)
+		settings = dict(metadata, output_format=output_format, catalog_query=catalog_query)
+		measurement_catalog.record_run(catalog, file_list, output_list, output_dir, settings, None if pad_model else pad_L_csv_filename, None if pad_model else pad_2L_csv_filename, pad_model)
+			
+	return (freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec)
+	
+
+def write_aggregate_outputs(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec, sample_vec, output_tag="", output_dir="extract", output_format="csv", metadata=None):
+	# Outputs covering every structure: R/L/G/C.csv (or a result store) and the averaged R file
+	if output_format == "csv":
+		write_data(freq_mat[0], R_mat, name_vec, "R" + output_tag + ".csv", output_dir)
+		write_data(freq_mat[0], L_mat, name_vec, "L" + output_tag + ".csv", output_dir)
+		write_data(freq_mat[0], C_mat, name_vec, "C" + output_tag + ".csv", output_dir)
+		write_data(freq_mat[0], G_mat, name_vec, "G" + output_tag + ".csv", output_dir)
+	else:
+		store_filename = result_store.result_store_path(output_format, output_tag, output_dir)
+		result_store.write_result_store(store_filename, output_format, freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec, sample_vec, metadata)
+
+	R_avg_vec = average_freq_range(freq_mat[0], avg_freq_min, avg_freq_max, R_mat)
+	write_averaged_R_outputs(length_vec, R_avg_vec, output_tag, output_dir)
+
+
+# Frequency range used for the averaged R output
+avg_freq_min = 1e10
+avg_freq_max = 2e20
+
+def write_averaged_R_outputs(length_vec, R_avg_vec, output_tag="", output_dir="extract"):
+	# $FOLDER_R$TAG_avg.csv in output_dir, plus the copy for the shared project folder
+	path_split = os.path.split(os.getcwd())
+	cur_folder = path_split[-1]
+	header_tag = cur_folder + output_tag
+	write_averaged_data(length_vec, R_avg_vec, cur_folder + "_R" + output_tag + "_avg" + ".csv", output_dir, header_tag)
+
+	# Extra copy of the averages for the shared project folder, when it's reachable from this machine
+	shared_output_dir = "C:\\Users\\William\\Dropbox\\Research\\Groups\\I3DS\\Projects\\Wire Measurements\\Will_Xuchen\\R_avg"
+	if os.path.isdir(shared_output_dir):
+		write_averaged_data(length_vec, R_avg_vec, cur_folder + "_R" + output_tag + "_avg" + ".csv", shared_output_dir, header_tag)
+
+
+def extract_rlgc_joint(pad_L_csv_filename, pad_2L_csv_filename, z0_probe=complex(50.0,0), struct_csv_name="*.csv", skip_deembed=False, output_tag="", output_dir="extract", cache_dir=None, measurements=None, fit_offset=False, pad_model=None, pad_library_dir=None, branch="principal"):
+	# Joint extraction: one RLGC set per width, fitted across every length of that width (see joint_rlgc_from_abcd)
+	# instead of extracting each structure on its own and averaging afterwards.
+	# Writes rlgc_joint_W$WIDTHum$TAG.csv per width: freq, R, L, G, C and the RMS arccosh(D) residual over the lengths.
+	# Returns (width_vec, freq_mat, R_mat, L_mat, G_mat, C_mat, residual_list), rows in width order;
+	# residual_list holds the (N, F) residuals of each width, structures in measurements order
+	# pad_model: stored pad model to de-embed with instead of the pad L/2L files (see extract_rlgc)
+	# branch: arccosh branch, see joint_rlgc_from_abcd
+	
+	if measurements is None:
+		measurements = load_measurement_stack( sorted( glob.glob(struct_csv_name) ), cache_dir)
+		if measurements is None:
+			raise ValueError("Joint extraction needs every structure on the same frequency grid")
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+	
+	if skip_deembed:
+		abcd_dut = measurements.abcd
+	else:
+		if pad_model is not None:
+			(freq_pad, abcd_pad, abcd_pad_inv, model_z0, model_meta) = pad_library.load_pad_model(pad_model, pad_library_dir, z0_probe)
+		else:
+			(freq_pad, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = measurements.get_pad_abcd(pad_L_csv_filename, pad_2L_csv_filename, z0_probe, cache_dir)
+		if not rfs.grids_match(freq_pad, measurements.freq_hz[0]):
+			measurements = measurements.take_freqs( pad_range_mask(freq_pad, measurements.freq_hz[0]) )
+		abcd_dut = deembed_abcd( align_pad_to_grid(freq_pad, abcd_pad_inv, measurements.freq_hz[0]), measurements.abcd)
+	
+	width_vec = sorted( set( measurements.widths_um.tolist() ) )
+	freq_mat = []
+	R_mat = []
+	L_mat = []
+	G_mat = []
+	C_mat = []
+	residual_list = []
+	for width_um in width_vec:
+		inds = np.nonzero(measurements.widths_um == width_um)[0]
+		lengths_um = measurements.lengths_um[inds]
+		print("\tW: {0:d}um \t L: {1:s}um".format(width_um, ", ".join( [ str(length) for length in lengths_um ] ) ) )
+		
+		freq_hz = measurements.freq_hz[inds[0]]
+		(freq, R, L, G, C, gamma, Zc, residual) = joint_rlgc_from_abcd(lengths_um*1e-6, freq_hz, abcd_dut[inds], fit_offset, branch)
+		residual_rms = np.sqrt( np.mean( np.abs(residual)**2, axis=0 ) )
+		
+		filename = os.path.join(output_dir, "rlgc_joint_W{0:d}um{1:s}.csv".format(width_um, output_tag))
+		with open(filename, 'w') as outfile:
+			write_csv_block(outfile, np.column_stack( (freq, R, L, G, C, residual_rms) ) )
 		
-		(freq, R, L, G, C) = extract_rlcg_from_measurement( freq_hz, length_m, abcd_pad_inv, abcd_dut, z0_probe, method, skip_deembed)
 		freq_mat.append(freq)
 		R_mat.append(R)
 		L_mat.append(L)
 		G_mat.append(G)
 		C_mat.append(C)
-		name_vec.append(structure_string)
-		length_vec.append(trace_length_um)
-		width_vec.append(trace_width_um)
+		residual_list.append(residual)
+	
+	return (width_vec, freq_mat, R_mat, L_mat, G_mat, C_mat, residual_list)
+
+
+# Upper bound on z0 candidates x structures x frequency points extracted at once by extract_rlgc_z0_sweep
+z0_sweep_block_elements = 1 << 22
+
+def extract_rlgc_z0_sweep(pad_L_csv_filename, pad_2L_csv_filename, z0_vec, method="distributed", struct_csv_name="*.csv", skip_deembed=False, output_tag="", output_dir="extract", cache_dir=None, measurements=None, branch="principal", select=False):
+	# extract_rlgc at every probe impedance in z0_vec in one broadcast pass, instead of one run per z0.
+	# z0 enters where it does in extract_rlgc: the pad L/2L conversion to ABCD, so the de-embedded pads.
+	# The conversions broadcast over a (K, 1) z0 column, giving (K, F, 2, 2) pads that de-embed the (N, F, 2, 2)
+	# structures into (K, N, F, 2, 2) at once; candidates are taken in blocks of z0_sweep_block_elements points.
+	# Every candidate gets a relative R and L spread across the lengths of each width (std / |mean| over the structures,
+	# averaged over the sweep and the widths), which pad de-embedding at the wrong z0 inflates.
+	# Writes z0_sweep$TAG.csv (z0 and spreads per candidate) and R/L/G/C$TAG_z0_$Z0.csv per candidate. With select,
+	# the candidate with the lowest R + L spread is also written as the regular aggregate outputs (R$TAG.csv, ...).
+	# Returns (freq, R_sweep, L_sweep, G_sweep, C_sweep, name_vec, spread, best_idx): (K, N, F) results, (K, 2) R/L
+	# spreads, and the index of the lowest spread candidate (None without select)
+
+	z0_vec = np.atleast_1d( np.asarray(z0_vec, dtype=complex) )
+	if measurements is None:
+		measurements = load_measurement_stack( sorted( glob.glob(struct_csv_name) ), cache_dir)
+		if measurements is None:
+			raise ValueError("A z0 sweep needs every structure on the same frequency grid")
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
 
-		write_rlgc(freq, R, L, G, C, rlgc_filename, output_dir)
+	abcd_pad_inv = []
+	if not skip_deembed:
+		with profiling.stage("pad extraction") as info:
+			# Touchstone pads are read once at the set's reference impedance and every candidate z0 is applied to that
+			(freq_L, Sdb_L, Sdeg_L) = measurements.get_sdb(pad_L_csv_filename, cache_dir)
+			(freq_2L, Sdb_2L, Sdeg_2L) = measurements.get_sdb(pad_2L_csv_filename, cache_dir)
+			(freq_pad, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = get_pad_abcd_from_sdb(freq_L, Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, z0_vec[:, None])
+			info["points"] = np.size(abcd_pad_inv) // 4
+		if not rfs.grids_match(freq_pad, measurements.freq_hz[0]):
+			measurements = measurements.take_freqs( pad_range_mask(freq_pad, measurements.freq_hz[0]) )
+			abcd_pad_inv = align_pad_to_grid(freq_pad, abcd_pad_inv, measurements.freq_hz[0])
+
+	length_m_vec = measurements.lengths_um * 1e-6
+	num_z0 = len(z0_vec)
+	result_shape = (num_z0,) + measurements.freq_hz.shape
+	(R_sweep, L_sweep, G_sweep, C_sweep) = [ np.zeros(result_shape) for idx in range(4) ]
+	block_z0 = max(1, z0_sweep_block_elements // max(1, np.size(measurements.freq_hz)) )
+	print("Extracting RLGC at {0:d} probe impedances using {1:s} method...".format(num_z0, method))
+	for start in range(0, num_z0, block_z0):
+		block = slice(start, min(start + block_z0, num_z0))
+		pad_inv_block = [] if skip_deembed else abcd_pad_inv[block, None]
+		(freq, R, L, G, C) = extract_rlgc_stacked(measurements.freq_hz, length_m_vec, pad_inv_block, measurements.abcd, z0_vec[block, None, None], method, skip_deembed, branch)
+		for (sweep, data) in zip( [R_sweep, L_sweep, G_sweep, C_sweep], [R, L, G, C] ):
+			sweep[block] = np.broadcast_to( data, sweep[block].shape )
+	freq = measurements.freq_hz[0]
+
+	# Relative spread across the lengths of each width; widths with a single structure say nothing about it
+	spread_list = []
+	for width_um in sorted( set( measurements.widths_um.tolist() ) ):
+		inds = np.nonzero(measurements.widths_um == width_um)[0]
+		if len( np.unique(measurements.lengths_um[inds]) ) < 2:
+			continue
+		spread_list.append( [ np.mean( np.std(sweep[:, inds], axis=1) / np.abs( np.mean(sweep[:, inds], axis=1) ), axis=-1 ) for sweep in [R_sweep, L_sweep] ] )
+	if len(spread_list) == 0:
+		raise ValueError("The R/L spread needs at least two lengths of the same width")
+	spread = np.mean( np.array(spread_list), axis=0 ).T
+
+	name_vec = [ "L{0:d}um_W{1:d}um_{2:s}".format(length_um, width_um, sample) for (length_um, width_um, sample) in zip(measurements.lengths_um, measurements.widths_um, measurements.samples) ]
+	with open( os.path.join(output_dir, "z0_sweep" + output_tag + ".csv"), 'w') as outfile:
+		outfile.write("z0 real (Ohm),z0 imag (Ohm),R spread,L spread\n")
+		write_csv_block(outfile, np.column_stack( (z0_vec.real, z0_vec.imag, spread) ) )
+	for (z0_idx, z0) in enumerate(z0_vec):
+		z0_tag = "{0:s}_z0_{1:g}{2:+g}j".format(output_tag, z0.real, z0.imag)
+		for (name, sweep) in zip( ["R", "L", "G", "C"], [R_sweep, L_sweep, G_sweep, C_sweep] ):
+			write_data(freq, sweep[z0_idx], name_vec, name + z0_tag + ".csv", output_dir)
+
+	best_idx = None
+	if select:
+		best_idx = int( np.argmin( np.sum(spread, axis=1) ) )
+		print("Lowest R/L spread at z0 = {0:g}{1:+g}j Ohm (R {2:.3g}, L {3:.3g})".format(z0_vec[best_idx].real, z0_vec[best_idx].imag, spread[best_idx, 0], spread[best_idx, 1]) )
+		write_aggregate_outputs([freq], R_sweep[best_idx], L_sweep[best_idx], G_sweep[best_idx], C_sweep[best_idx], name_vec, measurements.lengths_um.tolist(), measurements.widths_um.tolist(), measurements.samples, output_tag, output_dir)
+
+	return (freq, R_sweep, L_sweep, G_sweep, C_sweep, name_vec, spread, best_idx)
+
+
+def extract_structure(abcd_pad_inv, filename, length_m, z0_probe, method, skip_deembed, skip_plots, rlgc_filename, plot_name, output_dir, cache_dir=None, measurement=None, result_cache_dir=None, result_cache_key=None, freq_pad=None, branch="principal"):
+	# Everything extract_rlgc does for a single structure file: parse, de-embed, extract, write (and save plot data)
+	# (freq, R, L, G, C) = extract_structure(abcd_pad_inv, filename, length_m, ...)
+	# measurement: optional (freq_hz, Sdb, Sdeg, abcd) already loaded for filename; the file is only read if this is None
+	# result_cache_dir/result_cache_key: where to store the result for later runs (see result_cache.py)
+	# freq_pad: sweep abcd_pad_inv was measured on; the pad is resampled onto the structure's sweep if they differ
+	
+	if measurement is None:
+		with profiling.stage("parse", filename=plot_name) as info:
+			(freq_hz, S, Z, T, Sdb, Sdeg) = rfs.get_rf_params_from_vna_csv(filename, cache_dir=cache_dir)
+			info["points"] = len(freq_hz)
+		measurement = (freq_hz, Sdb, Sdeg, T)
+	(freq_hz, Sdb_dut, Sdeg_dut, abcd_dut) = measurement
+	
+	if (freq_pad is not None) and not skip_deembed and not rfs.grids_match(freq_pad, freq_hz):
+		mask = pad_range_mask(freq_pad, freq_hz)
+		(freq_hz, Sdb_dut, Sdeg_dut, abcd_dut) = (freq_hz[mask], Sdb_dut[mask], Sdeg_dut[mask], abcd_dut[mask])
+		abcd_pad_inv = align_pad_to_grid(freq_pad, abcd_pad_inv, freq_hz)
+	
+	(freq, R, L, G, C) = extract_rlcg_from_measurement( freq_hz, length_m, abcd_pad_inv, abcd_dut, z0_probe, method, skip_deembed, branch)
+	
+	write_structure_outputs(freq, R, L, G, C, Sdb_dut, Sdeg_dut, rlgc_filename, plot_name, output_dir, skip_plots)
+	if result_cache_dir:
+		result_cache.store_result(result_cache_dir, result_cache_key, freq, R, L, G, C, Sdb_dut, Sdeg_dut)
+	
+	return (freq, R, L, G, C)
+
+
+def write_structure_outputs(freq, R, L, G, C, Sdb_dut, Sdeg_dut, rlgc_filename, plot_name, output_dir, skip_plots=False):
+	# Per-structure RLGC file (unless rlgc_filename is None) and (optionally) the data plot_render needs to draw it later
+	with profiling.stage("structure outputs", points=np.size(freq), filename=plot_name):
+		if rlgc_filename is not None:
+			write_rlgc(freq, R, L, G, C, rlgc_filename, output_dir)
 		
 		if not skip_plots:
-			plot_rlgc(freq, R, L, G, C, structure_string + output_tag, output_dir)
-			plot_s_params(freq, Sdb_dut, Sdeg_dut, structure_string + output_tag, output_dir)
+			plot_render.save_plot_data(freq, R, L, G, C, Sdb_dut, Sdeg_dut, plot_name, output_dir)
+
+
+def load_measurement_stack(file_list, cache_dir=None):
+	# MeasurementSet for file_list (in that order), with sweeps that differ from the others resampled onto a common grid
+	# (None if they still can't be stacked)
+	from measurement_set import MeasurementSet
+	with profiling.stage("parse") as info:
+		try:
+			measurements = MeasurementSet.from_files(file_list, cache_dir=cache_dir, align=True)
+		except ValueError:
+			return None
+		info["points"] = np.size(measurements.freq_hz)
 	
-	write_data(freq_mat[0], R_mat, name_vec, "R" + output_tag + ".csv", output_dir)
-	write_data(freq_mat[0], L_mat, name_vec, "L" + output_tag + ".csv", output_dir)
-	write_data(freq_mat[0], C_mat, name_vec, "C" + output_tag + ".csv", output_dir)
-	write_data(freq_mat[0], G_mat, name_vec, "G" + output_tag + ".csv", output_dir)
+	return measurements
 
-	freq_min = 1e10
-	freq_max = 2e20
 
-	path_split = os.path.split(os.getcwd())
-	cur_folder = path_split[-1]
-	header_tag = cur_folder + output_tag
-	write_averaged_data_freq_range(freq_mat[0], freq_min, freq_max, R_mat, length_vec, cur_folder + "_R" + output_tag + "_avg" + ".csv", output_dir, header_tag)
+def run_structure_jobs(job_list, abcd_pad_inv, jobs):
+	# Runs extract_structure over job_list in a pool of worker processes, returning results in job order.
+	# The pad inverse is put in shared memory once; workers map it instead of receiving a copy per job.
+	# When profiling is on, each worker profiles its jobs and the records are merged into the active profile
+	# (stage times are then summed over workers, so they can add up to more than the wall time of the pool).
+	from concurrent.futures import ProcessPoolExecutor
+	from multiprocessing import shared_memory
+	
+	shm = None
+	pad_info = None
+	if len(abcd_pad_inv) > 0:
+		abcd_pad_inv = np.ascontiguousarray(abcd_pad_inv, dtype=complex)
+		shm = shared_memory.SharedMemory(create=True, size=abcd_pad_inv.nbytes)
+		np.ndarray(abcd_pad_inv.shape, dtype=complex, buffer=shm.buf)[:] = abcd_pad_inv
+		pad_info = (shm.name, abcd_pad_inv.shape)
+	
+	try:
+		with ProcessPoolExecutor(max_workers=jobs, initializer=init_structure_worker, initargs=(pad_info, profiling.active_profile is not None)) as pool:
+			worker_results = list( pool.map(extract_structure_worker, job_list) )
+	finally:
+		if shm is not None:
+			shm.close()
+			shm.unlink()
+	
+	result_list = []
+	for (result, worker_stages, worker_files) in worker_results:
+		if (worker_stages is not None) and (profiling.active_profile is not None):
+			profiling.active_profile.merge(worker_stages, worker_files)
+		result_list.append(result)
+	
+	return result_list
 
-	output_dir = "C:\\Users\\William\\Dropbox\\Research\\Groups\\I3DS\\Projects\\Wire Measurements\\Will_Xuchen\\R_avg"
-	write_averaged_data_freq_range(freq_mat[0], freq_min, freq_max, R_mat, length_vec, cur_folder + "_R" + output_tag + "_avg" + ".csv", output_dir, header_tag)
-			
-	return (freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec)
+
+# Per-process state for run_structure_jobs workers
+worker_pad_shm = None
+worker_pad_inv = []
+worker_profile = False
+
+def init_structure_worker(pad_info, profile=False):
+	global worker_pad_shm, worker_pad_inv, worker_profile
+	worker_profile = profile
+	if pad_info is None:
+		return
 	
+	from multiprocessing import shared_memory
+	(shm_name, shape) = pad_info
+	worker_pad_shm = shared_memory.SharedMemory(name=shm_name) # the parent owns (and unlinks) the block
+	worker_pad_inv = np.ndarray(shape, dtype=complex, buffer=worker_pad_shm.buf)
+
+
+def extract_structure_worker(job):
+	# (result, profile stages, profile files); the profile parts are None unless the parent is profiling
+	if not worker_profile:
+		return (extract_structure(worker_pad_inv, *job), None, None)
+	
+	profile = profiling.Profile()
+	with profiling.activate(profile):
+		result = extract_structure(worker_pad_inv, *job)
+	
+	return (result, profile.stages, profile.files)
+
+
+
+def parse_structure_filename(filename):
+	# (trace_length_um, trace_width_um, sample_str) = parse_structure_filename(filename)
+	# Input files need to be named $LENGTH_$WIDTHum_$WHATEVER.csv (see extract_rlgc)
+	
+	# First strip out any stuff from the path (Windows or POSIX separators)
+	nfilename_arr = filename.split("\\")
+	nfilename = os.path.basename( nfilename_arr[-1] )
+	
+	# now process the actual filename
+	filename_arr = nfilename.split("_")
+	trace_length_um = int(filename_arr[0])
+	
+	trace_width_name = filename_arr[1]
+	trace_width_um = int( trace_width_name[0:-2] ) # get rid of the "um" in the width section
+	data_final_arr = "_".join(filename_arr[2:]).split(".")
+	data_final_str = data_final_arr[0]
+	
+	return (trace_length_um, trace_width_um, data_final_str)
 
 
 def deembed_pads_from_measurement(abcd_pad_inv, abcd_dut, z0_probe = 50):
 	# (abcd_dut_deembedded, Sri_dut, Sdb_dut, Sdeg_dut) = deembed_pads_from_measurement(abcd_pad_inv, abcd_dut, z0_probe = 50)
 	
-	num_freqs = len(abcd_dut)
-	abcd_dut_deembedded = np.zeros( (num_freqs, 2, 2), dtype=complex )
-	Sri_dut_deembedded = np.zeros( (num_freqs, 2, 2), dtype=complex )
-	
-	for idx, Pinv in enumerate(abcd_pad_inv):
-		abcd_dut_deembedded_f = np.dot( Pinv, np.dot( abcd_dut[idx], Pinv) )
-		abcd_dut_deembedded[idx] = abcd_dut_deembedded_f
+	abcd_dut_deembedded = deembed_abcd(abcd_pad_inv, abcd_dut)
 		
 	Sri_dut_deembedded = rfs.abcd2s(abcd_dut_deembedded, z0_probe, z0_probe)
 	(Sdb_dut_deembedded, Sdeg_dut_deembedded) = rfs.sri2sdb(Sri_dut_deembedded)
@@ -140,26 +611,74 @@ def deembed_pads_from_measurement(abcd_pad_inv, abcd_dut, z0_probe = 50):
 	
 	
 	
-def extract_rlcg_from_measurement( freq, length_m, abcd_pad_inv, abcd_meas, z0_probe = 50, method="distributed", skip_deembed=False):
+def align_pad_to_grid(freq_pad, abcd_pad_inv, freq):
+	# abcd_pad_inv as is when the pad was measured on the sweep freq, otherwise resampled onto it
+	# so e.g. a coarse pad sweep can de-embed dense structure sweeps. The pad is a lumped network, so its
+	# ABCD entries are interpolated as real/imag; freq must lie inside the pad sweep (see pad_range_mask)
+	if rfs.grids_match(freq_pad, freq):
+		return abcd_pad_inv
+	return rfs.resample_real_imag(freq_pad, abcd_pad_inv, freq)
+
+
+def pad_range_mask(freq_pad, freq):
+	# Points of freq the pad sweep covers; the pad is never extrapolated
+	tol = 1e-9 * np.max( np.abs(freq_pad) )
+	return (freq >= freq_pad[0] - tol) & (freq <= freq_pad[-1] + tol)
+
+
+def align_results_to_grid(freq_mat, R_mat, L_mat, G_mat, C_mat):
+	# Per-structure results on differing sweeps, resampled onto their common grid (rf_support.common_freq_grid)
+	freq_common = rfs.common_freq_grid(freq_mat)
+	print("Resampling results onto a common grid of {0:d} points".format(len(freq_common)) )
+	aligned = [ [ rfs.resample_real(freq, data, freq_common) for (freq, data) in zip(freq_mat, data_mat) ] for data_mat in [R_mat, L_mat, G_mat, C_mat] ]
+	
+	return ( [freq_common] * len(freq_mat), aligned[0], aligned[1], aligned[2], aligned[3] )
+
+
+def deembed_abcd(abcd_pad_inv, abcd_dut):
+	# Pinv @ M @ Pinv for every frequency point at once
+	# abcd_dut may carry extra leading axes (e.g. (N, F, 2, 2) for a stack of structures)
+	return np.matmul( abcd_pad_inv, np.matmul( abcd_dut, abcd_pad_inv ) )
+
+
+def extract_rlcg_from_measurement( freq, length_m, abcd_pad_inv, abcd_meas, z0_probe = 50, method="distributed", skip_deembed=False, branch="principal"):
 	# (freq, R, L, G, C) = extract_rlcg_from_measurement( freq, length_m, abcd_pad_inv, abcd_dut, z0_probe = 50, method="distributed")
 	# if skip_deembed = True then abcd_pad_inv is not used -- just pass an empty array (or whatever)
+	# All arguments broadcast: abcd_meas may be a (N, F, 2, 2) stack of structures with freq (N, F) and length_m (N, 1),
+	# see extract_rlgc_stacked
+	# branch: arccosh branch for the distributed method, see distributed_rlgc_from_abcd
 	
+	num_points = np.size(abcd_meas) // 4
 	if not skip_deembed:
-		(abcd_dut, Sri_dut, Sdb_dut, Sdeg_dut) = deembed_pads_from_measurement(abcd_pad_inv, abcd_meas, z0_probe)
+		with profiling.stage("de-embed", points=num_points):
+			abcd_dut = deembed_abcd(abcd_pad_inv, abcd_meas)
 	else:
-		Sri_dut = rfs.abcd2s(abcd_meas, z0_probe, z0_probe)
-		(Sdb_dut, Sdeg_dut) = rfs.sri2sdb(Sri_dut)
-	
-	if method == "distributed":		
-			(freq, R, L, G, C, gamma, attenuation, losstan, Zc) = distributed_rlgc_from_sdb(length_m, freq, Sdb_dut, Sdeg_dut, z0_probe)
-	elif method == "lumped":
-#		net_dut = rf.Network( f=freq*1e-9, s=Sri_dut, z0=z0_probe)
-#		(freq, R, L, G, C, Zdiff, Ycomm, net) = lumped_rlgc_from_Network(net_dut, z0_probe)
-		print("ERROR: NOT IMPLEMENTED")
-	else:
-		print("ERROR: NOT IMPLEMENTED")
+		abcd_dut = abcd_meas
+	
+	with profiling.stage(method + " extraction", points=num_points):
+		if method == "distributed":		
+				(freq, R, L, G, C, gamma, attenuation, losstan, Zc) = distributed_rlgc_from_abcd(length_m, freq, abcd_dut, branch)
+		elif method == "lumped":
+			(freq, R, L, G, C, Zdiff, Ycomm) = lumped_rlgc_from_abcd(freq, abcd_dut)
+		else:
+			raise ValueError("Unknown extraction method: {0:s}".format(method))
 		
 	return (freq, R, L, G, C)
+
+
+def extract_rlgc_stacked(freq, length_m_vec, abcd_pad_inv, abcd_meas, z0_probe = 50, method="distributed", skip_deembed=False, branch="principal"):
+	# Extraction for a whole set of structures in one pass
+	# freq:		(N, F) or (F)	frequency grid(s) in Hz
+	# length_m_vec:	(N)		structure lengths in m
+	# abcd_pad_inv:	(F, 2, 2)	pad inverse shared by every structure
+	# abcd_meas:	(N, F, 2, 2)	measured ABCD matrices
+	# Returns (freq, R, L, G, C) as (N, F) matrices, one row per structure (the layout write_data takes)
+	
+	abcd_meas = np.asarray(abcd_meas)
+	length_m_col = np.reshape( np.asarray(length_m_vec, dtype=float), (-1, 1) )
+	freq_mat = np.broadcast_to( freq, abcd_meas.shape[0:2] )
+	
+	return extract_rlcg_from_measurement( freq_mat, length_m_col, abcd_pad_inv, abcd_meas, z0_probe, method, skip_deembed, branch)
 	
 	
 def distributed_rlgc_from_sdb(length_m, freq, Sdb, Sdeg, z0_probe=complex(50,0)):
@@ -170,56 +689,139 @@ def distributed_rlgc_from_sdb(length_m, freq, Sdb, Sdeg, z0_probe=complex(50,0))
 	Sri = rfs.sdb2sri(Sdb, Sdeg)
 	abcd = rfs.s2abcd(Sri, z0_probe, z0_probe)
 	
-	d_vec = np.zeros( (len(abcd)), dtype=complex)
-	c_vec = np.zeros( (len(abcd)), dtype=complex)
+	return distributed_rlgc_from_abcd(length_m, freq, abcd)
+
+
+def distributed_rlgc_from_abcd(length_m, freq, abcd, branch="principal"):
+	# Same as distributed_rlgc_from_sdb, starting from the ABCD matrices (..., 2, 2)
+	# length_m and freq broadcast against abcd[..., 0, 0]; the last axis of abcd[..., 0, 0] is frequency
+	# branch: "principal" takes arccosh as is, so beta*length wraps every half wavelength and L/C jump there.
+	# "unwrap" tracks gamma*length continuously over the sweep (see unwrap_gamma_l).
 	
-	for idx, T in enumerate(abcd):	
-		d_vec[idx] = T[1][1]
-		c_vec[idx] = T[1][0] # C vector (what I think needs to be used for Zc extraction)
+	d_vec = abcd[..., 1, 1]
+	c_vec = abcd[..., 1, 0] # C vector (what I think needs to be used for Zc extraction)
 
-	gamma = 1/length_m * np.arccosh(d_vec)
+	gamma = 1/length_m * arccosh_branch(freq, d_vec, branch)
 	Zc = 1/c_vec * np.sinh(gamma * length_m)
 
-	R = ( gamma * Zc).real
-	L = 1/2/math.pi/freq * ((gamma * Zc).imag )
-	G = (gamma/Zc).real
-	C = 1/2/math.pi/freq * (gamma/Zc).imag
+	(R, L, G, C) = rlgc_from_gamma_zc(freq, gamma, Zc)
 	losstan = (gamma/Zc).real / (gamma/Zc).imag
 
 	attenuation = 20*np.log10( abs(np.exp(-gamma*length_m)) )
 
 	return ( freq, R, L, G, C, gamma, attenuation, losstan, Zc )
 
-def lumped_rlgc_from_Network(net, z0_probe=complex(50,0)):
-	# s2p_filename: (str)	s2p filename
-	# z0_probe:	(Ohms)	Impedance of network analyzer/probes. 50 Ohm default.
+def arccosh_branch(freq, d_vec, branch="principal"):
+	# gamma*length from D = cosh(gamma*length), on the requested branch (frequency along the last axis)
+	# branch may also be an array of reference gamma*length values (broadcasting against d_vec): every point then
+	# takes the branch with beta*length nearest the reference, e.g. perturbed copies following an unwrapped nominal
+	if not isinstance(branch, str):
+		gamma_l = np.arccosh(d_vec)
+		return gamma_l + 2j*math.pi * np.round( (np.imag(branch) - gamma_l.imag) / (2*math.pi) )
+	if branch == "principal":
+		return np.arccosh(d_vec)
+	elif branch == "unwrap":
+		return unwrap_gamma_l(freq, np.arccosh(d_vec))
+	raise ValueError("Unknown arccosh branch: {0:s}".format(branch))
+
+
+def unwrap_gamma_l(freq, gamma_l, guess_points=8):
+	# gamma*length made continuous along the last (frequency) axis, for every row of a (..., F) stack at once.
+	# The principal arccosh keeps alpha*length >= 0 but folds beta*length into (-pi, pi]. Unwrapping the phase along
+	# the sweep removes the 2*pi jumps, which needs beta*length to change by less than pi between neighbouring points.
+	# Left over is a whole number of turns at the first point, for sweeps that start above the first wrap: the first
+	# guess_points unwrapped points are extrapolated to DC with a straight line, where beta*length has to be 0.
+	# guess_points < 2 keeps the first point on the principal branch.
+	# sinh(gamma*length) doesn't change by whole turns, so Zc is the same on every branch.
+	
+	beta_l = np.unwrap(gamma_l.imag, axis=-1)
+	num_guess = min(guess_points, beta_l.shape[-1])
+	if num_guess >= 2:
+		freq_guess = np.broadcast_to(freq, beta_l.shape)[..., 0:num_guess]
+		beta_l_guess = beta_l[..., 0:num_guess]
+		freq_dev = freq_guess - np.mean(freq_guess, axis=-1, keepdims=True)
+		slope = np.sum( freq_dev * beta_l_guess, axis=-1, keepdims=True ) / np.sum( freq_dev**2, axis=-1, keepdims=True )
+		intercept = np.mean(beta_l_guess, axis=-1, keepdims=True) - slope * np.mean(freq_guess, axis=-1, keepdims=True)
+		beta_l = beta_l - 2*math.pi * np.round( intercept / (2*math.pi) )
+	
+	return gamma_l.real + 1j*beta_l
+
+
+def rlgc_from_gamma_zc(freq, gamma, Zc):
+	# Per unit length R, L, G, C from the propagation constant and characteristic impedance
+	R = ( gamma * Zc).real
+	L = 1/2/math.pi/freq * ((gamma * Zc).imag )
+	G = (gamma/Zc).real
+	C = 1/2/math.pi/freq * (gamma/Zc).imag
+	
+	return (R, L, G, C)
+
+
+def joint_rlgc_from_abcd(length_m_vec, freq, abcd, fit_offset=False, branch="principal"):
+	# One RLGC set fitted across structures of different lengths (same cross section)
+	# length_m_vec:	(N)		structure lengths in m
+	# freq:		(F)		frequency grid in Hz
+	# abcd:		(N, F, 2, 2)	de-embedded ABCD matrices
+	# For a uniform line D = cosh(gamma*l), so arccosh(D) is fitted as gamma*l (+ offset, with fit_offset, to soak up
+	# what the pad de-embedding left behind) by least squares over the lengths, separately at every frequency.
+	# Zc then comes from the least squares fit of C = sinh(gamma*l)/Zc. With one structure this is distributed_rlgc_from_abcd.
+	# branch: as in distributed_rlgc_from_abcd; the lengths wrap at different frequencies, so long lines need "unwrap".
+	# Returns (freq, R, L, G, C, gamma, Zc, residual), residual being the (N, F) misfit of arccosh(D)
+	
+	abcd = np.asarray(abcd)
+	length_m_col = np.reshape( np.asarray(length_m_vec, dtype=float), (-1, 1) )
+	
+	gamma_l = arccosh_branch(freq, abcd[..., 1, 1], branch)
+	if fit_offset:
+		if len( np.unique(length_m_col) ) < 2:
+			raise ValueError("Fitting an offset needs at least two different structure lengths")
+		length_dev = length_m_col - np.mean(length_m_col)
+		gamma = np.sum( length_dev * gamma_l, axis=0 ) / np.sum( length_dev**2 )
+		offset = np.mean(gamma_l, axis=0) - gamma * np.mean(length_m_col)
+	else:
+		gamma = np.sum( length_m_col * gamma_l, axis=0 ) / np.sum( length_m_col**2 )
+		offset = 0
+	residual = gamma_l - (gamma * length_m_col + offset)
+	
+	sinh_gamma_l = np.sinh(gamma * length_m_col)
+	Yc = np.sum( np.conj(sinh_gamma_l) * abcd[..., 1, 0], axis=0 ) / np.sum( np.abs(sinh_gamma_l)**2, axis=0 )
+	Zc = 1/Yc
+	
+	(R, L, G, C) = rlgc_from_gamma_zc(freq, gamma, Zc)
+	
+	return (freq, R, L, G, C, gamma, Zc, residual)
 
-	freq = net.f
 
-	Z = net.z
-	Y = net.y
+def lumped_rlgc_from_abcd(freq, abcd):
+	# Treats the structure as a lumped element: series R/L from the differential impedance, shunt G/C from the
+	# common mode admittance. Batched over the whole (..., 2, 2) stack; freq broadcasts against abcd[..., 0, 0]
+	# abcd2z gives Z in ohms, so unlike the normalized Z of the MATLAB version (extraction_lumped_HO.m) Zdiff is not
+	# scaled by z0. R, L, G, C are totals for the structure, not per unit length.
 
-	Zdiff = np.zeros( (len(Z)), dtype=complex)
-	Ycomm = np.zeros( (len(Z)), dtype=complex)
-	for idx in range(len(Zdiff)):
-		zz = Z[idx]
-		yy = Y[idx]
-		
-		Zdiff[idx] = z0_probe*(zz[0,0] - zz[0,1] - zz[1,0] + zz[1,1])
-		Ycomm[idx] = yy[0,0] + yy[0,1] + yy[1,0] + yy[1,1]
+	Z = rfs.abcd2z(abcd)
+	Y = rfs.abcd2y(abcd)
+
+	Zdiff = ( Z[..., 0, 0] - Z[..., 0, 1] - Z[..., 1, 0] + Z[..., 1, 1] )
+	Ycomm = Y[..., 0, 0] + Y[..., 0, 1] + Y[..., 1, 0] + Y[..., 1, 1]
 
 	R = Zdiff.real
 	L = 1/2/math.pi/freq *(Zdiff.imag)
 	G = Ycomm.real
 	C = 1/2/math.pi/freq * (Ycomm.imag)
 
-	return (freq, R, L, G, C, Zdiff, Ycomm, net)
+	return (freq, R, L, G, C, Zdiff, Ycomm)
 
 
-def get_pad_abcd(pad_L_s2p_filename, pad_2L_s2p_filename, z0_probe=complex(50,0)):
+def get_pad_abcd(pad_L_s2p_filename, pad_2L_s2p_filename, z0_probe=complex(50,0), cache_dir=None):
 	
-	(freq_L, Sdb_L, Sdeg_L) = rfs.get_sdb_from_vna_csv(pad_L_s2p_filename)
-	(freq_2L, Sdb_2L, Sdeg_2L) = rfs.get_sdb_from_vna_csv(pad_2L_s2p_filename)
+	(freq_L, Sdb_L, Sdeg_L) = rfs.get_sdb_from_file(pad_L_s2p_filename, cache_dir, z0_probe)
+	(freq_2L, Sdb_2L, Sdeg_2L) = rfs.get_sdb_from_file(pad_2L_s2p_filename, cache_dir, z0_probe)
+
+	return get_pad_abcd_from_sdb(freq_L, Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, z0_probe)
+
+
+def get_pad_abcd_from_sdb(freq_L, Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, z0_probe=complex(50,0)):
+	# Same as get_pad_abcd, for L/2L measurements that are already in memory
 
 	# ABCD matrices
 	S_L = rfs.sdb2sri(Sdb_L, Sdeg_L) 
@@ -228,20 +830,7 @@ def get_pad_abcd(pad_L_s2p_filename, pad_2L_s2p_filename, z0_probe=complex(50,0)
 	abcd_L = rfs.s2abcd( S_L, z0_probe)
 	abcd_2L = rfs.s2abcd( S_2L, z0_probe)
 	
-	abcd_pad = np.zeros( np.shape(abcd_L), dtype=complex) # ABCD matrix structure for pad
-	abcd_pad_inv = np.zeros( np.shape(abcd_L), dtype=complex) # inverse abcd matrix structure for pad
-	
-	# iterating across each frequency point
-	for idx, abcd_L_mat in enumerate(abcd_L):
-		abcd_2L_mat = abcd_2L[idx]
-		
-		abcd_L_inv = la.inv(abcd_L_mat)
-		abcd_P_squared = la.inv( np.dot( abcd_L_inv, np.dot( abcd_2L_mat, abcd_L_inv) ) ) # PP = ( ML^-1 * M2L * ML^-1 )^-1
-		abcd_P = la.sqrtm(abcd_P_squared) # ABCD matrix of the pad (single pad) for this frequency
-		abcd_P_inv = la.inv(abcd_P)
-		
-		abcd_pad[idx] = abcd_P
-		abcd_pad_inv[idx] = abcd_P_inv
+	(abcd_pad, abcd_pad_inv) = pad_abcd_from_abcd(abcd_L, abcd_2L)
 	
 	Sri_pad = rfs.abcd2s(abcd_pad, z0_probe, z0_probe)
 	(Sdb_pad, Sdeg_pad) = rfs.sri2sdb(Sri_pad)
@@ -249,190 +838,101 @@ def get_pad_abcd(pad_L_s2p_filename, pad_2L_s2p_filename, z0_probe=complex(50,0)
 	return (freq_L, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad)
 
 
-def write_s_db_deg( sdb, sdeg, freq, filename):
-	outfile = open(filename,'w')
-
-	freq_vec = freq
-	s_db_list = sdb
-	s_deg_list = sdeg
-
-	for idx in range(len(freq_vec)):
-		freq = freq_vec[idx]
-		s_db_mat = s_db_list[idx]
-		S11_db = s_db_mat[0][0]
-		S12_db = s_db_mat[0][1]
-		S21_db = s_db_mat[1][0]
-		S22_db = s_db_mat[1][1]
-
-		s_deg_mat = s_deg_list[idx]
-		S11_deg = s_deg_mat[0][0]
-		S12_deg = s_deg_mat[0][1]
-		S21_deg = s_deg_mat[1][0]
-		S22_deg = s_deg_mat[1][1]
+def pad_abcd_from_abcd(abcd_L, abcd_2L, matmul=np.matmul):
+	# (abcd_pad, abcd_pad_inv) from the L and 2L structure ABCD matrices
+	# All frequency points (and any leading batch axes) are handled in one batched pass
+	# matmul: product of (..., 2, 2) stacks; rf_support.matmul_2x2 is faster on big batches but rounds a little differently
+	abcd_L_inv = rfs.inv_2x2(abcd_L)
+	abcd_P_squared = rfs.inv_2x2( matmul( matmul(abcd_L_inv, abcd_2L), abcd_L_inv ) ) # PP = ( ML^-1 * M2L * ML^-1 )^-1
+	abcd_pad = rfs.sqrtm_2x2(abcd_P_squared) # ABCD matrix of the pad (single pad) at each frequency, principal branch
+	abcd_pad_inv = rfs.inv_2x2(abcd_pad) # inverse abcd matrix structure for pad
+	
+	return (abcd_pad, abcd_pad_inv)
 
-		outstr = "{0:.8g},{1:.8g},{2:.8g},{3:.8g},{4:.8g},{5:.8g},{6:.8g},{7:.8g},{8:.8g}\n".format( freq, S11_db, S11_deg, S12_db, S12_deg, S21_db, S21_deg, S22_db, S22_deg)
 
-		outfile.write(outstr)
+def write_s_db_deg( sdb, sdeg, freq, filename):
+	sdb = np.asarray(sdb)
+	sdeg = np.asarray(sdeg)
+	
+	# freq, S11 db/deg, S12 db/deg, S21 db/deg, S22 db/deg
+	columns = [freq]
+	for (row, col) in [ (0,0), (0,1), (1,0), (1,1) ]:
+		columns.append( sdb[:, row, col] )
+		columns.append( sdeg[:, row, col] )
+	
+	with open(filename, 'w') as outfile:
+		write_csv_block(outfile, np.column_stack(columns) )
 
 
 def write_rlgc(freq, R, L, G, C, filename, output_dir=""):
 	filename = os.path.join(output_dir, filename)
-	outfile = open(filename, 'w')
 	
-	for idx, f in enumerate(freq):
-		r = R[idx]
-		l = L[idx]
-		g = G[idx]
-		c = C[idx]
-		
-		outstr = "{0:.8g},{1:.8g},{2:.8g},{3:.8g},{4:.8g}\n".format(f, r, l, g, c)
-		outfile.write(outstr)
+	with open(filename, 'w') as outfile:
+		write_csv_block(outfile, np.column_stack( (freq, R, L, G, C) ) )
 		
 
 def write_data( freq, data_mat, name_mat, filename, output_dir=""):
 
 	filename = os.path.join(output_dir, filename)
-	outfile = open(filename, 'w')
-	
-	outstr = ",".join(name_mat)
-	outfile.write("{0:s},{1:s}\n".format("Freq (Hz)", outstr) )
 	
+	# one row per frequency: freq, then one column per structure
 	data_mat = np.array(data_mat)
+	
+	with open(filename, 'w') as outfile:
+		outstr = ",".join(name_mat)
+		outfile.write("{0:s},{1:s}\n".format("Freq (Hz)", outstr) )
+		write_csv_block(outfile, np.column_stack( (freq, data_mat.T) ) )
+
+
+def write_csv_block(outfile, data, fmt="%.8g"):
+	# Writes a 2-D array as comma separated rows (same output as np.savetxt(outfile, data, fmt, delimiter=",")),
+	# formatting the whole block with a single string operation instead of one per row
+	data = np.asarray(data, dtype=float)
+	if data.size == 0:
+		return
+	
+	row_fmt = ",".join( [fmt] * data.shape[1] )
+	block_fmt = "\n".join( [row_fmt] * data.shape[0] ) + "\n"
+	outfile.write( block_fmt % tuple( data.ravel().tolist() ) )
 
-	for idx, f in enumerate(freq):
-		data_str_vec = [ "{0:.8g}".format(el) for el in data_mat[:,idx] ]
-		data_str = ",".join(data_str_vec)
-		outfile.write("{0:.8g},{1:s}\n".format(f, data_str) )
 
 def write_averaged_data_freq_range(freq, freq_min, freq_max, data_mat, length_vec, filename, output_dir="", header_tag=""):
 
-	filename = os.path.join(output_dir, filename)
-	outfile = open(filename, 'w')
+	data_avg_vec = average_freq_range(freq, freq_min, freq_max, data_mat)
+	write_averaged_data(length_vec, data_avg_vec, filename, output_dir, header_tag)
+
+
+def average_freq_range(freq, freq_min, freq_max, data_mat):
+	# Average of each row of data_mat over freq_min <= freq <= freq_max
+	data_mat = np.array(data_mat)
+	freq_mask = (freq >=freq_min) & (freq <=freq_max)
+	
+	return np.average( data_mat[:, freq_mask], axis=1 )
 
-	data_avg_vec = np.zeros( (len(length_vec)), dtype=float)
 
-	for idx, length in enumerate(length_vec):
-		data_avg = np.average( data_mat[idx][ (freq >=freq_min) & (freq <=freq_max) ] )
-		data_avg_vec[idx] = data_avg
+def write_averaged_data(length_vec, data_avg_vec, filename, output_dir="", header_tag=""):
+	# One row per structure, sorted by length
+
+	filename = os.path.join(output_dir, filename)
 
 	sort_inds = np.argsort(length_vec)
-	outfile.write("Length (um),{0:s}\n".format(header_tag))
+	
+	with open(filename, 'w') as outfile:
+		outfile.write("Length (um),{0:s}\n".format(header_tag))
 
-	for idx in sort_inds:
-		outfile.write("{0:d},{1:.8g}\n".format(length_vec[idx], data_avg_vec[idx]) )
+		for idx in sort_inds:
+			outfile.write("{0:d},{1:.8g}\n".format(length_vec[idx], data_avg_vec[idx]) )
 
 		
 
 def plot_rlgc(freq, R, L, G, C, structure_string, output_dir=""):
-	freq_ghz = freq/1e9
-	
-	pl.figure(1, figsize=(9,13) )
-	pl.clf()
-	ax1 = pl.subplot(4,1,1)
-	pl.plot(freq_ghz, R, "b", linewidth=2)
-	pl.xlabel("Frequency (GHz)")
-	#pl.ylabel("Resistance (Ohms)")
-	pl.ylabel("R ($\Omega$/m)")
-	ax1.ticklabel_format(axis='y', style='sci', scilimits=(-2,2))
-	
-	ax2 = pl.subplot(4,1,2)
-	pl.plot(freq_ghz, L, "b", linewidth=2)
-	pl.xlabel("Frequency (GHz)")
-	#pl.ylabel("Inductance (H)")
-	pl.ylabel("L (H/m)")
-	ax2.ticklabel_format(axis='y', style='sci', scilimits=(-2,2))
-	
-	ax3 = pl.subplot(4,1,3)
-	pl.plot(freq_ghz, G, "b", linewidth=2)
-	pl.xlabel("Frequency (GHz)")
-	#pl.ylabel("Conductance (S)")
-	pl.ylabel("G (S/m)")
-	ax3.ticklabel_format(axis='y', style='sci', scilimits=(-2,2))
-	
-	ax4 = pl.subplot(4,1,4)
-	pl.plot(freq_ghz, C, "b", linewidth=2)
-	pl.xlabel("Frequency (GHz)")
-	#pl.ylabel("Capacitance (F)")
-	pl.ylabel("C (F/m)")
-	ax4.ticklabel_format(axis='y', style='sci', scilimits=(-2,2))
-	
-	filename = structure_string + "_RLGC.pdf"
-	filename = os.path.join(output_dir, filename)
-	pl.savefig()
-	
+	# Renders structure_string_RLGC.pdf right away (see plot_render.py)
+	plot_render.plot_rlgc(freq, R, L, G, C, structure_string, output_dir)
 	
 	
 def plot_s_params(freq, Sdb, Sdeg, structure_string, output_dir=""):
-	freq_ghz = freq/1e9
-	
-	S11_db = np.zeros( (len(Sdb)) )
-	S12_db = np.zeros( (len(Sdb)) )
-	S21_db = np.zeros( (len(Sdb)) )
-	S22_db = np.zeros( (len(Sdb)) )
-	
-	S11_deg = np.zeros( (len(Sdb)) )
-	S12_deg = np.zeros( (len(Sdb)) )
-	S21_deg = np.zeros( (len(Sdb)) )
-	S22_deg = np.zeros( (len(Sdb)) )
-	
-	for idx in range(len(Sdb)):
-		S11_db[idx] = Sdb[idx][0][0]
-		S12_db[idx] = Sdb[idx][0][1]
-		S21_db[idx] = Sdb[idx][1][0]
-		S22_db[idx] = Sdb[idx][1][1]
-		
-		S11_deg[idx] = Sdeg[idx][0][0]
-		S12_deg[idx] = Sdeg[idx][0][1]
-		S21_deg[idx] = Sdeg[idx][1][0]
-		S22_deg[idx] = Sdeg[idx][1][1]
-		
-	pl.figure(1, figsize=(8.5,11) )
-	pl.clf()
-	pl.subplot(2,1,1)
-	pl.hold(True)
-	pl.plot(freq_ghz, S11_db, 'b', linewidth=2, label="S11")
-	pl.plot(freq_ghz, S22_db, 'g', linewidth=2, label="S22")
-	pl.xlabel("Frequency (GHz)")
-	pl.ylabel("S Parameters (DB)")
-	pl.grid()
-	pl.legend()
-	
-	pl.subplot(2,1,2)
-	pl.hold(True)
-	pl.plot(freq_ghz, S12_db, 'b', linewidth=2, label="S12")
-	pl.plot(freq_ghz, S21_db, 'g', linewidth=2, label="S21")
-	pl.xlabel("Frequency (GHz)")
-	pl.ylabel("S Parameters (DB)")
-	pl.grid()
-	pl.legend()
-	
-	filename = structure_string + "_Sdb.pdf"
-	filename = os.path.join(output_dir, filename)
-	pl.savefig(filename)
-	
-	pl.figure(2)
-	pl.clf()
-	pl.subplot(2,1,1)
-	pl.hold(True)
-	pl.plot(freq_ghz, S11_deg, 'b', linewidth=2, label="S11")
-	pl.plot(freq_ghz, S22_deg, 'g', linewidth=2, label="S22")
-	pl.xlabel("Frequency (GHz)")
-	pl.ylabel("S Parameter Phase (Degrees)")
-	pl.grid()
-	pl.legend()
-	
-	pl.subplot(2,1,2)
-	pl.hold(True)
-	pl.plot(freq_ghz, S12_deg, 'b', linewidth=2, label="S12")
-	pl.plot(freq_ghz, S21_deg, 'g', linewidth=2, label="S21")
-	pl.xlabel("Frequency (GHz)")
-	pl.ylabel("S Parameter Phase (Degrees)")
-	pl.grid()
-	pl.legend()
-	
-	filename = structure_string + "_Sdeg.pdf"
-	filename = os.path.join(output_dir, filename)
-	pl.savefig(filename)
+	# Renders structure_string_Sdb.pdf and structure_string_Sdeg.pdf right away (see plot_render.py)
+	plot_render.plot_s_params(freq, Sdb, Sdeg, structure_string, output_dir)
 	
 		
 
@@ -0,0 +1,198 @@
+import numpy as np
+import glob
+import os.path
+import rf_support as rfs
+import extraction as ex
+
+
+class MeasurementSet:
+	# A group of structure measurements loaded once and held as stacked arrays
+	#
+	#	ms = MeasurementSet.load("*.csv")
+	#	ex.extract_rlgc(pad_L, pad_2L, measurements=ms.select(width=3))
+	#
+	# filenames, lengths_um, widths_um and samples describe each structure (parsed from the filename,
+	# see extraction.parse_structure_filename). freq_hz is (N, F); Sdb, Sdeg and abcd are (N, F, 2, 2).
+	# Subsets made with select() share the underlying data and the pad cache, so no further I/O happens.
+
+	def __init__(self, filenames, freq_hz, Sdb, Sdeg, abcd, z0=50.0 + 0.0j, pad_cache=None, loaded_files=None):
+		self.filenames = list(filenames)
+		self.freq_hz = freq_hz
+		self.Sdb = Sdb
+		self.Sdeg = Sdeg
+		self.abcd = abcd
+		self.z0 = z0
+
+		structure_info = [ ex.parse_structure_filename(filename) for filename in self.filenames ]
+		self.lengths_um = np.array( [ info[0] for info in structure_info ], dtype=int )
+		self.widths_um = np.array( [ info[1] for info in structure_info ], dtype=int )
+		self.samples = [ info[2] for info in structure_info ]
+
+		# (abs pad L path, abs pad 2L path, z0) -> get_pad_abcd output
+		if pad_cache is None:
+			pad_cache = {}
+		self.pad_cache = pad_cache
+
+		# abs path -> (freq_hz, Sdb, Sdeg) for every file of the originally loaded set, so pad files
+		# can be found in memory even when a subset doesn't contain them
+		if loaded_files is None:
+			loaded_files = {}
+			for (idx, filename) in enumerate(self.filenames):
+				loaded_files[ os.path.abspath(filename) ] = (self.freq_hz[idx], self.Sdb[idx], self.Sdeg[idx])
+		self.loaded_files = loaded_files
+
+	@classmethod
+	def load(cls, struct_csv_name="*.csv", z0=50.0 + 0.0j, cache_dir=None, align=False):
+		# Reads every file matching struct_csv_name (a glob, or a directory to take all *.csv from), sorted by name.
+		# Files not named like structures ($LENGTH_$WIDTHum_$SAMPLE, e.g. pad_L.csv) are left out
+		if os.path.isdir(struct_csv_name):
+			struct_csv_name = os.path.join(struct_csv_name, "*.csv")
+		filenames = [ filename for filename in sorted( glob.glob(struct_csv_name) ) if is_structure_filename(filename) ]
+
+		return cls.from_files(filenames, z0, cache_dir, align)
+
+	@classmethod
+	def from_files(cls, filenames, z0=50.0 + 0.0j, cache_dir=None, align=False):
+		# Reads the given files, keeping their order
+		# All files need the same frequency sweep so they can be stacked, unless align is set:
+		# then sweeps that differ from the others are resampled (magnitude/phase) onto a common grid,
+		# the densest sweep trimmed to the range every file covers (rf_support.common_freq_grid)
+		freq_list = []
+		Sdb_list = []
+		Sdeg_list = []
+		loaded_files = {}
+		for filename in filenames:
+			(freq_hz, Sdb, Sdeg) = rfs.get_sdb_from_file(filename, cache_dir, z0)
+			loaded_files[ os.path.abspath(filename) ] = (freq_hz, Sdb, Sdeg)
+			if (not align) and (len(freq_list) > 0) and not rfs.grids_match(freq_hz, freq_list[0]):
+				raise ValueError("{0:s} ({1:d} points, {2:.6g} - {3:.6g} Hz) is not on the frequency grid of {4:s} ({5:d} points, {6:.6g} - {7:.6g} Hz)".format(filename, len(freq_hz), freq_hz[0], freq_hz[-1], filenames[0], len(freq_list[0]), freq_list[0][0], freq_list[0][-1]) )
+			freq_list.append(freq_hz)
+			Sdb_list.append(Sdb)
+			Sdeg_list.append(Sdeg)
+		
+		if align and (len(freq_list) > 1) and not all( [ rfs.grids_match(freq, freq_list[0]) for freq in freq_list ] ):
+			freq_common = rfs.common_freq_grid(freq_list)
+			print("Resampling {0:d} sweeps onto a common grid of {1:d} points ({2:.6g} - {3:.6g} Hz)".format(len(freq_list), len(freq_common), freq_common[0], freq_common[-1]) )
+			for idx in range(len(freq_list)):
+				if not rfs.grids_match(freq_list[idx], freq_common):
+					Sri = rfs.resample_mag_phase(freq_list[idx], rfs.sdb2sri(Sdb_list[idx], Sdeg_list[idx]), freq_common)
+					(Sdb_list[idx], Sdeg_list[idx]) = rfs.sri2sdb(Sri)
+				freq_list[idx] = freq_common
+
+		if len(filenames) == 0:
+			freq_hz = np.zeros( (0, 0) )
+			Sdb = np.zeros( (0, 0, 2, 2) )
+			Sdeg = np.zeros( (0, 0, 2, 2) )
+		else:
+			freq_hz = np.array(freq_list)
+			Sdb = np.array(Sdb_list)
+			Sdeg = np.array(Sdeg_list)
+
+		# one batched conversion for the whole set
+		abcd = rfs.s2abcd( rfs.sdb2sri(Sdb, Sdeg), z0 )
+
+		# loaded_files keeps every file's own sweep, so pads are extracted on their measured grid
+		return cls(filenames, freq_hz, Sdb, Sdeg, abcd, z0, loaded_files=loaded_files)
+
+	@classmethod
+	def from_files_by_grid(cls, filenames, z0=50.0 + 0.0j, cache_dir=None):
+		# Reads the given files without resampling anything: [(inds, MeasurementSet)], one set per distinct sweep
+		# holding the files (at positions inds of filenames) measured on it. The sets share the pad cache and
+		# loaded_files, so pad files among filenames are found in memory from any of them
+		loaded_list = [ rfs.get_sdb_from_file(filename, cache_dir, z0) for filename in filenames ]
+		loaded_files = {}
+		for (filename, loaded) in zip(filenames, loaded_list):
+			loaded_files[ os.path.abspath(filename) ] = loaded
+		pad_cache = {}
+
+		group_list = []
+		for inds in group_grids( [ loaded[0] for loaded in loaded_list ] ):
+			Sdb = np.array( [ loaded_list[idx][1] for idx in inds ] )
+			Sdeg = np.array( [ loaded_list[idx][2] for idx in inds ] )
+			abcd = rfs.s2abcd( rfs.sdb2sri(Sdb, Sdeg), z0 )
+			freq_hz = np.array( [ loaded_list[idx][0] for idx in inds ] )
+			group_list.append( (inds, cls( [ filenames[idx] for idx in inds ], freq_hz, Sdb, Sdeg, abcd, z0, pad_cache, loaded_files) ) )
+
+		return group_list
+
+	def __len__(self):
+		return len(self.filenames)
+
+	def select(self, length=None, width=None, sample=None):
+		# Subset of structures matching every given criterion (each may be a single value or a list of values)
+		mask = np.ones( (len(self)), dtype=bool )
+		if length is not None:
+			mask &= np.isin(self.lengths_um, length)
+		if width is not None:
+			mask &= np.isin(self.widths_um, width)
+		if sample is not None:
+			mask &= np.isin( np.array(self.samples, dtype=object), np.atleast_1d( np.array(sample, dtype=object) ) )
+
+		return self.take( np.nonzero(mask)[0] )
+
+	def take(self, inds):
+		# Subset of the structures at positions inds, in that order
+		inds = np.asarray(inds, dtype=int)
+		return MeasurementSet( [ self.filenames[idx] for idx in inds ], self.freq_hz[inds], self.Sdb[inds], self.Sdeg[inds], self.abcd[inds], self.z0, self.pad_cache, self.loaded_files)
+
+	def take_freqs(self, mask):
+		# Same structures, keeping only the frequency points where mask (over the shared sweep) is True
+		return MeasurementSet(self.filenames, self.freq_hz[:, mask], self.Sdb[:, mask], self.Sdeg[:, mask], self.abcd[:, mask], self.z0, self.pad_cache, self.loaded_files)
+
+	def group_by_grid(self):
+		# [(inds, MeasurementSet)]: the structures split by frequency sweep (rows can differ in range with the same
+		# number of points, e.g. after take_freqs or in hand built sets), so each subset has a single grid
+		return [ (inds, self.take(inds)) for inds in group_grids(self.freq_hz) ]
+
+	def as_measured(self, idx):
+		# True if structure idx is still on the sweep its file was measured on (not resampled or trimmed)
+		loaded = self.loaded_files.get( os.path.abspath(self.filenames[idx]) )
+		return (loaded is not None) and rfs.grids_match(self.freq_hz[idx], loaded[0])
+
+	def get_measurement(self, idx):
+		# (freq_hz, Sdb, Sdeg, abcd) for structure idx, in the form extraction.extract_structure takes
+		return (self.freq_hz[idx], self.Sdb[idx], self.Sdeg[idx], self.abcd[idx])
+
+	def get_pad_abcd(self, pad_L_csv_filename, pad_2L_csv_filename, z0_probe=complex(50,0), cache_dir=None):
+		# Cached extraction.get_pad_abcd. Pad files that were loaded with the set aren't read again.
+		key = ( os.path.abspath(pad_L_csv_filename), os.path.abspath(pad_2L_csv_filename), complex(z0_probe) )
+		if key not in self.pad_cache:
+			(freq_L, Sdb_L, Sdeg_L) = self.get_sdb(pad_L_csv_filename, cache_dir, z0_probe)
+			(freq_2L, Sdb_2L, Sdeg_2L) = self.get_sdb(pad_2L_csv_filename, cache_dir, z0_probe)
+			self.pad_cache[key] = ex.get_pad_abcd_from_sdb(freq_L, Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, z0_probe)
+
+		return self.pad_cache[key]
+
+	def get_sdb(self, filename, cache_dir=None, z0=None):
+		# (freq_hz, Sdb, Sdeg) from memory when filename was loaded with the set, otherwise from disk
+		# z0: reference impedance to read Touchstone data at (see rf_support.get_sdb_from_file), None for the set's.
+		# Files in memory were read at the set's z0, so a Touchstone file wanted at another one is read again
+		if z0 is None:
+			z0 = self.z0
+		abs_filename = os.path.abspath(filename)
+		if (abs_filename in self.loaded_files) and ( (complex(z0) == complex(self.z0)) or not rfs.is_touchstone_file(filename) ):
+			return self.loaded_files[abs_filename]
+		return rfs.get_sdb_from_file(filename, cache_dir, z0)
+
+
+def group_grids(freq_list):
+	# Lists of positions in freq_list with matching sweeps (rf_support.grids_match), in order of first appearance
+	group_list = []
+	for (idx, freq) in enumerate(freq_list):
+		for inds in group_list:
+			if rfs.grids_match(freq_list[inds[0]], freq):
+				inds.append(idx)
+				break
+		else:
+			group_list.append( [idx] )
+
+	return group_list
+
+
+def is_structure_filename(filename):
+	# True if extraction.parse_structure_filename can make sense of filename
+	try:
+		ex.parse_structure_filename(filename)
+	except (ValueError, IndexError):
+		return False
+	return True
@@ -0,0 +1,166 @@
+import numpy as np
+import argparse
+import glob
+import os
+import os.path
+import rf_support as rfs
+import extraction as ex
+import profiling
+
+# Multiconductor (coupled line) RLGC extraction from 2N-port measurements, e.g. 4-port data of differential pairs
+#	python multiport.py 500_3um_1.csv 1000_3um_1.csv --struct_csv_name "*.s4p" --port_order 1 3 2 4
+# Files are VNA CSV exports with any number of ports or Touchstone .sNp files, named $LENGTH_$WIDTHum_$SAMPLE like
+# the 2-port ones. Ports 1..N must be the near ends of the N conductors and N+1..2N their far ends (--port_order
+# renumbers them otherwise). The pads come from the L/2L structures exactly as in get_pad_abcd, with 2N x 2N matrices.
+#
+# For N coupled lines of length l, with Z = R + jwL and Y = G + jwC the per unit length N x N matrices,
+#	D^T = cosh( sqrt(ZY) l ),	C = Y F(ZY),	F(x) = sinh( sqrt(x) l ) / sqrt(x)
+# so the eigendecomposition of D^T gives the modes T and modal gamma_i l = arccosh(eigenvalue_i), then
+#	Y = C T diag( gamma_i / sinh(gamma_i l) ) T^-1,	Z = T diag(gamma_i^2) T^-1 Y^-1
+# which is distributed_rlgc_from_abcd for N = 1. Every step is batched over structures and frequencies.
+#
+# Writes rlgc_mtl_$STRUCTURE$TAG.csv per structure: freq, then R11, R12, ... R_NN, L11 ... C_NN.
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("pad_L_csv_file", help="Filename for L structure measurement to be used for pad extraction")
+	parser.add_argument("pad_2L_csv_file", help="Filename for 2L structure measurement to be used for pad extraction")
+	parser.add_argument("--struct_csv_name", default="*.csv", help="Structures to extract (glob, VNA CSV or Touchstone .sNp). Default is *.csv")
+	parser.add_argument("--skip_deembed", default=False, action='store_true', help="Skip pad deembedding")
+	parser.add_argument("--z0", type=float, default=50, help="Reference impedance of every port. Default is 50 Ohms")
+	parser.add_argument("--port_order", type=int, nargs="+", default=None, help="Measured port numbers in the order near end 1..N, far end 1..N, e.g. 1 3 2 4 when the VNA puts the two ends of a line on ports 1 and 2. Default is as measured")
+	parser.add_argument("--tag", default="", help="Output file tag")
+	parser.add_argument("--output_dir", default="extract", help="Directory to store outputs")
+	parser.add_argument("--cache_dir", default=None, help="Directory for cached parsed measurements")
+	args = parser.parse_args()
+
+	port_order = None if args.port_order is None else [ port - 1 for port in args.port_order ]
+	extract_rlgc_multiport(args.pad_L_csv_file, args.pad_2L_csv_file, args.z0, args.struct_csv_name, args.skip_deembed, args.tag, args.output_dir, args.cache_dir, port_order)
+
+
+def extract_rlgc_multiport(pad_L_csv_filename, pad_2L_csv_filename, z0=50.0, struct_csv_name="*.csv", skip_deembed=False, output_tag="", output_dir="extract", cache_dir=None, port_order=None):
+	# Returns (name_vec, freq_mat, R_mat, L_mat, G_mat, C_mat): per structure, freq (F) and (F, N, N) matrices
+	# port_order: 0-based measured port for each of near end 1..N, far end 1..N (None to take them as measured)
+
+	file_list = sorted( glob.glob(struct_csv_name) )
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+
+	freq_pad = None
+	abcd_pad_inv = None
+	if not skip_deembed:
+		with profiling.stage("pad extraction"):
+			(freq_pad, abcd_L) = load_abcd_nport(pad_L_csv_filename, z0, cache_dir, port_order)
+			(freq_2L, abcd_2L) = load_abcd_nport(pad_2L_csv_filename, z0, cache_dir, port_order)
+			if not rfs.grids_match(freq_pad, freq_2L):
+				raise ValueError("{0:s} and {1:s} are not on the same frequency grid".format(pad_L_csv_filename, pad_2L_csv_filename) )
+			(abcd_pad, abcd_pad_inv) = pad_abcd_nport(abcd_L, abcd_2L)
+
+	# Structures measured on the same sweep with the same port count are extracted as one stack
+	group_dict = {}
+	loaded_list = []
+	for filename in file_list:
+		(freq, abcd) = load_abcd_nport(filename, z0, cache_dir, port_order)
+		loaded_list.append( (freq, abcd) )
+		group_key = (abcd.shape, freq[0], freq[-1])
+		group_dict.setdefault(group_key, []).append( len(loaded_list) - 1 )
+
+	result_list = [None] * len(file_list)
+	for inds in group_dict.values():
+		freq = loaded_list[inds[0]][0]
+		if not all( [ rfs.grids_match(loaded_list[idx][0], freq) for idx in inds ] ):
+			inds_list = [ [idx] for idx in inds ]
+		else:
+			inds_list = [inds]
+		for stack_inds in inds_list:
+			freq = loaded_list[stack_inds[0]][0]
+			abcd = np.array( [ loaded_list[idx][1] for idx in stack_inds ] )
+			length_m_col = np.array( [ ex.parse_structure_filename(file_list[idx])[0]*1e-6 for idx in stack_inds ] )[:, None, None]
+			if not skip_deembed:
+				pad_inv = abcd_pad_inv
+				if not rfs.grids_match(freq_pad, freq):
+					mask = ex.pad_range_mask(freq_pad, freq)
+					(freq, abcd) = (freq[mask], abcd[:, mask])
+					pad_inv = ex.align_pad_to_grid(freq_pad, abcd_pad_inv, freq)
+				with profiling.stage("de-embed", points=np.size(abcd[..., 0, 0])):
+					abcd = pad_inv @ abcd @ pad_inv
+			with profiling.stage("multiconductor extraction", points=np.size(abcd[..., 0, 0])):
+				(freq_out, R, L, G, C, gamma) = mtl_rlgc_from_abcd(length_m_col, freq, abcd)
+			for (stack_idx, file_idx) in enumerate(stack_inds):
+				result_list[file_idx] = (freq, R[stack_idx], L[stack_idx], G[stack_idx], C[stack_idx])
+
+	name_vec = []
+	print("Multiconductor RLGC extraction of {0:d} structures".format(len(file_list)) )
+	for (filename, (freq, R, L, G, C)) in zip(file_list, result_list):
+		(length_um, width_um, sample) = ex.parse_structure_filename(filename)
+		name = "L{0:d}um_W{1:d}um_{2:s}".format(length_um, width_um, sample)
+		print("\tL: {0:d}um \t W: {1:d}um \t Sample: {2:s} \t {3:d} conductors".format(length_um, width_um, sample, R.shape[-1]) )
+		write_rlgc_matrices(freq, R, L, G, C, "rlgc_mtl_" + name + output_tag + ".csv", output_dir)
+		name_vec.append(name)
+
+	return ( name_vec, [ result[0] for result in result_list ], [ result[1] for result in result_list ], [ result[2] for result in result_list ], [ result[3] for result in result_list ], [ result[4] for result in result_list ] )
+
+
+def load_abcd_nport(filename, z0=50.0, cache_dir=None, port_order=None):
+	# (freq_hz, (F, 2N, 2N) ABCD matrices) of a multiport measurement
+	with profiling.stage("parse", filename=filename) as info:
+		(freq_hz, Sdb, Sdeg) = rfs.get_sdb_nport_from_file(filename, cache_dir, z0)
+		info["points"] = len(freq_hz)
+	if Sdb.shape[-1] % 2 != 0:
+		raise ValueError("{0:s} has {1:d} ports; multiconductor extraction needs an even number".format(filename, Sdb.shape[-1]) )
+	Sri = rfs.sdb2sri(Sdb, Sdeg)
+	if port_order is not None:
+		Sri = rfs.reorder_ports(Sri, port_order)
+
+	return (freq_hz, rfs.s2abcd_nport(Sri, z0))
+
+
+def pad_abcd_nport(abcd_L, abcd_2L):
+	# get_pad_abcd with (..., 2N, 2N) matrices: (abcd_pad, abcd_pad_inv)
+	abcd_L_inv = np.linalg.inv(abcd_L)
+	abcd_P_squared = np.linalg.inv( abcd_L_inv @ abcd_2L @ abcd_L_inv ) # PP = ( ML^-1 * M2L * ML^-1 )^-1
+	abcd_pad = rfs.sqrtm_nport(abcd_P_squared)
+
+	return (abcd_pad, np.linalg.inv(abcd_pad))
+
+
+def mtl_rlgc_from_abcd(length_m, freq, abcd):
+	# Per unit length R, L, G, C matrices (..., F, N, N) of N coupled lines from (..., F, 2N, 2N) ABCD matrices
+	# length_m broadcasts against abcd[..., 0, 0] (e.g. (S, 1, 1) for a stack of S structures), freq is (F)
+	# Returns (freq, R, L, G, C, gamma) with gamma the (..., F, N) modal propagation constants
+
+	(A, B, C_block, D) = rfs.split_blocks( np.asarray(abcd, dtype=complex) )
+	length_m = np.asarray(length_m, dtype=float)
+
+	(eig_vals, T) = np.linalg.eig( np.swapaxes(D, -1, -2) )
+	gamma_l = np.arccosh(eig_vals)
+	gamma = gamma_l / length_m
+	T_inv = np.linalg.inv(T)
+
+	Y = C_block @ (T * (gamma / np.sinh(gamma_l))[..., None, :]) @ T_inv
+	Z = (T * (gamma**2)[..., None, :]) @ T_inv @ np.linalg.inv(Y)
+
+	omega = 2*np.pi*np.asarray(freq, dtype=float)[..., None, None]
+	R = Z.real
+	L = Z.imag / omega
+	G = Y.real
+	C = Y.imag / omega
+
+	return (freq, R, L, G, C, gamma)
+
+
+def write_rlgc_matrices(freq, R, L, G, C, filename, output_dir=""):
+	# freq, then every element of R, L, G, C (row by row) per frequency
+	filename = os.path.join(output_dir, filename)
+	num_lines = R.shape[-1]
+	header_list = [ "{0:s}{1:d}{2:d}".format(name, row+1, col+1) for name in ["R", "L", "G", "C"] for row in range(num_lines) for col in range(num_lines) ]
+	num_freqs = len(freq)
+
+	with open(filename, 'w') as outfile:
+		outfile.write("Freq (Hz)," + ",".join(header_list) + "\n")
+		ex.write_csv_block(outfile, np.column_stack( [freq] + [ data.reshape(num_freqs, -1) for data in [R, L, G, C] ] ) )
+
+
+if (__name__ == "__main__"):
+	main()
@@ -0,0 +1,108 @@
+import numpy as np
+import argparse
+import json
+import os
+import os.path
+import time
+
+# Library of extracted pad models, so the pad L/2L measurements of a probe setup are parsed and inverted once
+#	python pad_library.py save gsg100_wafer3 500_3um_1.csv 1000_3um_1.csv
+#	python extraction.py --pad_model gsg100_wafer3
+# A model is one .pad.npz file holding the sweep, abcd_pad, abcd_pad_inv, the probe z0 and where it came from.
+# Models are found by name in the library directory (--library_dir, or $RLGC_PAD_LIBRARY, or ~/.rlgc_pad_library),
+# or given directly as a path to the .pad.npz file.
+
+model_suffix = ".pad.npz"
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--library_dir", default=None, help="Pad library directory. Default is $RLGC_PAD_LIBRARY, or ~/.rlgc_pad_library")
+	subparsers = parser.add_subparsers(dest="command", required=True)
+
+	save_parser = subparsers.add_parser("save", help="Extract a pad model from L/2L measurements and store it")
+	save_parser.add_argument("name", help="Model name (or a path ending in .pad.npz)")
+	save_parser.add_argument("pad_L_csv_file", help="Filename for L structure measurement to be used for pad extraction")
+	save_parser.add_argument("pad_2L_csv_file", help="Filename for 2L structure measurement to be used for pad extraction")
+	save_parser.add_argument("--z0_real", type=float, default=50, help="Real portion of probe impedance. Default is 50 Ohms")
+	save_parser.add_argument("--z0_imag", type=float, default=0, help="Imaginary portion of probe impedance. Default is 0 Ohms")
+
+	subparsers.add_parser("list", help="List the stored pad models")
+	args = parser.parse_args()
+
+	if args.command == "save":
+		import extraction as ex
+		z0_probe = complex(args.z0_real, args.z0_imag)
+		(freq_hz, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = ex.get_pad_abcd(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe)
+		filename = save_pad_model(args.name, freq_hz, abcd_pad, abcd_pad_inv, z0_probe, args.pad_L_csv_file, args.pad_2L_csv_file, args.library_dir)
+		print("Saved pad model ({0:d} points) to {1:s}".format(len(freq_hz), filename) )
+	else:
+		for (name, meta) in list_pad_models(args.library_dir):
+			print("{0:24s} {1:8d} points  {2:.6g} - {3:.6g} Hz  z0 {4:g}{5:+g}j  from {6:s}, {7:s}".format(name, meta["num_points"], meta["freq_min"], meta["freq_max"], meta["z0_real"], meta["z0_imag"], meta["pad_L"], meta["pad_2L"]) )
+
+
+def library_path(library_dir=None):
+	if library_dir is None:
+		library_dir = os.environ.get("RLGC_PAD_LIBRARY", os.path.join("~", ".rlgc_pad_library"))
+	return os.path.expanduser(library_dir)
+
+
+def pad_model_path(name, library_dir=None):
+	# A path to a .pad.npz file (or any existing file) is used as is; anything else is a name in the library
+	if name.endswith(model_suffix) or os.path.isfile(name):
+		return name
+	return os.path.join(library_path(library_dir), name + model_suffix)
+
+
+def save_pad_model(name, freq_hz, abcd_pad, abcd_pad_inv, z0_probe, pad_L_csv_filename="", pad_2L_csv_filename="", library_dir=None):
+	# Stores a get_pad_abcd result, returns the model filename
+	filename = pad_model_path(name, library_dir)
+	model_dir = os.path.dirname(filename)
+	if model_dir and not os.path.exists(model_dir):
+		os.makedirs(model_dir, exist_ok=True)
+
+	freq_hz = np.asarray(freq_hz, dtype=float)
+	meta = { "name": os.path.basename(filename)[0:-len(model_suffix)] if filename.endswith(model_suffix) else name, "z0_real": complex(z0_probe).real, "z0_imag": complex(z0_probe).imag, "pad_L": os.path.abspath(pad_L_csv_filename) if pad_L_csv_filename else "", "pad_2L": os.path.abspath(pad_2L_csv_filename) if pad_2L_csv_filename else "", "num_points": len(freq_hz), "freq_min": float(freq_hz[0]), "freq_max": float(freq_hz[-1]), "created": time.strftime("%Y-%m-%d %H:%M:%S") }
+
+	# write to a temporary file first so a concurrent reader never sees a partial model
+	tmp_filename = "{0:s}.{1:d}.tmp".format(filename, os.getpid())
+	with open(tmp_filename, 'wb') as outfile:
+		np.savez(outfile, freq_hz=freq_hz, abcd_pad=np.asarray(abcd_pad, dtype=complex), abcd_pad_inv=np.asarray(abcd_pad_inv, dtype=complex), meta=json.dumps(meta))
+	os.replace(tmp_filename, filename)
+
+	return filename
+
+
+def load_pad_model(name, library_dir=None, z0_probe=None):
+	# (freq_hz, abcd_pad, abcd_pad_inv, z0_probe, meta) for a stored model
+	# If z0_probe is given, a model extracted with a different probe impedance is rejected
+	filename = pad_model_path(name, library_dir)
+	if not os.path.isfile(filename):
+		raise FileNotFoundError("No pad model {0:s} (looked for {1:s})".format(name, filename))
+
+	with np.load(filename) as data:
+		meta = json.loads( str(data["meta"]) )
+		model_z0 = complex(meta["z0_real"], meta["z0_imag"])
+		if (z0_probe is not None) and (complex(z0_probe) != model_z0):
+			raise ValueError("Pad model {0:s} was extracted with z0 = {1:s}, not {2:s}".format(filename, str(model_z0), str(complex(z0_probe))) )
+		return (data["freq_hz"], data["abcd_pad"], data["abcd_pad_inv"], model_z0, meta)
+
+
+def list_pad_models(library_dir=None):
+	# [(name, meta)] for every model in the library, sorted by name
+	library_dir = library_path(library_dir)
+	if not os.path.isdir(library_dir):
+		return []
+
+	model_list = []
+	for model_name in sorted( os.listdir(library_dir) ):
+		if not model_name.endswith(model_suffix):
+			continue
+		with np.load( os.path.join(library_dir, model_name) ) as data:
+			model_list.append( (model_name[0:-len(model_suffix)], json.loads( str(data["meta"]) )) )
+
+	return model_list
+
+
+if (__name__ == "__main__"):
+	main()
@@ -0,0 +1,123 @@
+import numpy as np
+import glob
+import argparse
+import os
+import os.path
+
+# Headless plot renderer for extraction results
+# Figures are built with the object-oriented API (no pyplot, no global figure state) and written
+# through the non-interactive Agg/PDF canvases, so any number can be rendered in parallel processes.
+# matplotlib is only imported by the functions that draw, so importing this module (as extraction.py does) is cheap.
+#
+# extract_rlgc saves each structure's results with save_plot_data; the PDFs are rendered afterwards
+# (render_plot_files), or later from the saved files:
+#	python plot_render.py extract/plot_data --jobs 4
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("plot_data_dir", nargs="?", default=os.path.join("extract", "plot_data"), help="Directory of saved plot data (*_plotdata.npz) written by extraction.py. Default is extract/plot_data")
+	parser.add_argument("--output_dir", default=None, help="Directory to store the PDFs. Default is the parent of plot_data_dir")
+	parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes used for rendering. Default is 1")
+	args = parser.parse_args()
+
+	filename_list = sorted( glob.glob( os.path.join(args.plot_data_dir, "*" + plot_data_suffix) ) )
+	print("Rendering plots for {0:d} structures...".format(len(filename_list)) )
+	render_plot_files(filename_list, args.output_dir, args.jobs)
+
+
+plot_data_suffix = "_plotdata.npz"
+
+
+def plot_data_path(plot_name, output_dir=""):
+	return os.path.join(output_dir, "plot_data", plot_name + plot_data_suffix)
+
+
+def save_plot_data(freq, R, L, G, C, Sdb, Sdeg, plot_name, output_dir=""):
+	# Saves everything plot_rlgc and plot_s_params need for one structure, returns the filename
+	filename = plot_data_path(plot_name, output_dir)
+	plot_data_dir = os.path.dirname(filename)
+	if not os.path.exists(plot_data_dir):
+		os.makedirs(plot_data_dir, exist_ok=True)
+
+	np.savez(filename, freq=freq, R=R, L=L, G=G, C=C, Sdb=Sdb, Sdeg=Sdeg, plot_name=plot_name)
+
+	return filename
+
+
+def render_plot_data(filename, output_dir=None):
+	# Renders the RLGC and S parameter PDFs for one file written by save_plot_data
+	# PDFs go next to the plot_data directory unless output_dir is given
+	if output_dir is None:
+		output_dir = os.path.dirname( os.path.dirname( os.path.abspath(filename) ) )
+
+	with np.load(filename) as data:
+		plot_name = str(data["plot_name"])
+		plot_rlgc(data["freq"], data["R"], data["L"], data["G"], data["C"], plot_name, output_dir)
+		plot_s_params(data["freq"], data["Sdb"], data["Sdeg"], plot_name, output_dir)
+
+	return plot_name
+
+
+def render_plot_files(filename_list, output_dir=None, jobs=1):
+	# Renders every saved plot data file, spread over jobs worker processes
+	if (jobs > 1) and (len(filename_list) > 1):
+		from concurrent.futures import ProcessPoolExecutor
+		with ProcessPoolExecutor(max_workers=jobs) as pool:
+			plot_names = list( pool.map(render_plot_data, filename_list, [output_dir]*len(filename_list)) )
+	else:
+		plot_names = [ render_plot_data(filename, output_dir) for filename in filename_list ]
+
+	return plot_names
+
+
+def plot_rlgc(freq, R, L, G, C, structure_string, output_dir=""):
+	from matplotlib.figure import Figure
+	freq_ghz = freq/1e9
+
+	fig = Figure( figsize=(9,13) )
+	for (idx, (data, label)) in enumerate( [ (R, "R ($\\Omega$/m)"), (L, "L (H/m)"), (G, "G (S/m)"), (C, "C (F/m)") ] ):
+		ax = fig.add_subplot(4, 1, idx+1)
+		ax.plot(freq_ghz, data, "b", linewidth=2)
+		ax.set_xlabel("Frequency (GHz)")
+		ax.set_ylabel(label)
+		ax.ticklabel_format(axis='y', style='sci', scilimits=(-2,2))
+
+	filename = structure_string + "_RLGC.pdf"
+	filename = os.path.join(output_dir, filename)
+	fig.savefig(filename)
+
+
+def plot_s_params(freq, Sdb, Sdeg, structure_string, output_dir=""):
+	freq_ghz = freq/1e9
+
+	plot_s_pair(freq_ghz, Sdb, "S Parameters (DB)", os.path.join(output_dir, structure_string + "_Sdb.pdf"), figsize=(8.5,11) )
+	plot_s_pair(freq_ghz, Sdeg, "S Parameter Phase (Degrees)", os.path.join(output_dir, structure_string + "_Sdeg.pdf") )
+
+
+def plot_s_pair(freq_ghz, S_mat, ylabel, filename, figsize=None):
+	# Reflection (S11/S22) on top, transmission (S12/S21) below
+	from matplotlib.figure import Figure
+	fig = Figure(figsize=figsize)
+
+	ax = fig.add_subplot(2, 1, 1)
+	ax.plot(freq_ghz, S_mat[:, 0, 0], 'b', linewidth=2, label="S11")
+	ax.plot(freq_ghz, S_mat[:, 1, 1], 'g', linewidth=2, label="S22")
+	ax.set_xlabel("Frequency (GHz)")
+	ax.set_ylabel(ylabel)
+	ax.grid()
+	ax.legend()
+
+	ax = fig.add_subplot(2, 1, 2)
+	ax.plot(freq_ghz, S_mat[:, 0, 1], 'b', linewidth=2, label="S12")
+	ax.plot(freq_ghz, S_mat[:, 1, 0], 'g', linewidth=2, label="S21")
+	ax.set_xlabel("Frequency (GHz)")
+	ax.set_ylabel(ylabel)
+	ax.grid()
+	ax.legend()
+
+	fig.savefig(filename)
+
+
+if (__name__ == "__main__"):
+	main()
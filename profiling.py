@@ -0,0 +1,135 @@
+import time
+import json
+import os
+import sys
+import contextlib
+
+# Per-stage timing for extract_rlgc
+# Code marks its stages with
+#	with profiling.stage("de-embed", points=num_points, filename=filename):
+#		...
+# (the with target is a dict whose "points" can be set inside the block, when the count is only known there)
+# which costs next to nothing unless a Profile is active (profiling.activate, or extract_rlgc's profile arguments).
+# An active Profile accumulates wall and CPU time, call counts and points per stage, wall time per stage for every
+# file, and reports peak memory; summary() returns it all as a JSON-ready dict.
+#
+#	python extraction.py pad_L.csv pad_2L.csv --profile extract/profile.json --cprofile extract/extract.prof
+
+try:
+	import resource
+except ImportError: # not available on Windows
+	resource = None
+
+
+class Profile:
+
+	def __init__(self):
+		self.stages = {} # name -> {"wall_s", "cpu_s", "calls", "points"}
+		self.files = {} # structure (extract_rlgc uses the output name, e.g. L500um_W3um_1) -> {stage name -> wall_s}
+		self.start_wall = time.perf_counter()
+		self.start_cpu = time.process_time()
+
+	@contextlib.contextmanager
+	def stage(self, name, points=0, filename=None):
+		info = { "points": points }
+		start_wall = time.perf_counter()
+		start_cpu = time.process_time()
+		try:
+			yield info
+		finally:
+			wall = time.perf_counter() - start_wall
+			cpu = time.process_time() - start_cpu
+			record = self.stages.setdefault(name, { "wall_s": 0.0, "cpu_s": 0.0, "calls": 0, "points": 0 })
+			record["wall_s"] += wall
+			record["cpu_s"] += cpu
+			record["calls"] += 1
+			record["points"] += int(info["points"])
+			if filename is not None:
+				file_record = self.files.setdefault(filename, {})
+				file_record[name] = file_record.get(name, 0.0) + wall
+
+	def merge(self, stages, files):
+		# Adds stage and file records from another Profile (e.g. one kept by a worker process)
+		for (name, other) in stages.items():
+			record = self.stages.setdefault(name, { "wall_s": 0.0, "cpu_s": 0.0, "calls": 0, "points": 0 })
+			for key in record:
+				record[key] += other[key]
+		for (filename, other) in files.items():
+			file_record = self.files.setdefault(filename, {})
+			for (name, wall) in other.items():
+				file_record[name] = file_record.get(name, 0.0) + wall
+
+	def summary(self):
+		stages = {}
+		for (name, record) in self.stages.items():
+			stages[name] = dict(record)
+			stages[name]["points_per_s"] = record["points"] / record["wall_s"] if record["wall_s"] > 0 else None
+
+		return { "wall_s": time.perf_counter() - self.start_wall, "cpu_s": time.process_time() - self.start_cpu, "peak_rss_mb": peak_rss_mb(), "peak_rss_children_mb": peak_rss_mb(children=True), "stages": stages, "files": self.files }
+
+	def write_json(self, filename):
+		output_dir = os.path.dirname(filename)
+		if output_dir and not os.path.exists(output_dir):
+			os.makedirs(output_dir)
+		with open(filename, 'w') as outfile:
+			json.dump(self.summary(), outfile, indent=1)
+
+	def report(self):
+		# Human readable stage table, slowest first
+		summary = self.summary()
+		lines = [ "{0:24s} {1:>10s} {2:>10s} {3:>7s} {4:>12s}".format("Stage", "Wall (s)", "CPU (s)", "Calls", "Points/s") ]
+		for (name, record) in sorted( summary["stages"].items(), key=lambda item: -item[1]["wall_s"] ):
+			rate_str = "{0:12.4g}".format(record["points_per_s"]) if (record["points"] > 0) and record["points_per_s"] else "{0:>12s}".format("-")
+			lines.append( "{0:24s} {1:10.3f} {2:10.3f} {3:7d} {4:s}".format(name, record["wall_s"], record["cpu_s"], record["calls"], rate_str) )
+		lines.append( "Total wall {0:.3f} s, CPU {1:.3f} s, peak RSS {2:s} MB".format(summary["wall_s"], summary["cpu_s"], "{0:.1f}".format(summary["peak_rss_mb"]) if summary["peak_rss_mb"] is not None else "n/a") )
+
+		return "\n".join(lines)
+
+
+def peak_rss_mb(children=False):
+	# Peak resident memory of this process (or of its finished child processes) in MB, None where unavailable
+	if resource is None:
+		return None
+	usage = resource.getrusage( resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF )
+	scale = 1.0 if sys.platform == "darwin" else 1024.0 # ru_maxrss is bytes on macOS, KB on Linux
+	return usage.ru_maxrss * scale / 1e6
+
+
+# The Profile stages are recorded into; None when profiling is off
+active_profile = None
+null_stage = contextlib.nullcontext( {} )
+
+
+def stage(name, points=0, filename=None):
+	if active_profile is None:
+		return null_stage
+	return active_profile.stage(name, points, filename)
+
+
+@contextlib.contextmanager
+def activate(profile):
+	# Records stages into profile (a Profile, or None to leave profiling off) inside the with block
+	global active_profile
+	previous = active_profile
+	active_profile = profile
+	try:
+		yield profile
+	finally:
+		active_profile = previous
+
+
+@contextlib.contextmanager
+def cprofile_run(stats_filename=None):
+	# Runs the with block under cProfile and dumps the stats to stats_filename (nothing happens when it's None)
+	# Read the stats with: python -m pstats stats_filename
+	if stats_filename is None:
+		yield
+		return
+	import cProfile
+	profiler = cProfile.Profile()
+	profiler.enable()
+	try:
+		yield
+	finally:
+		profiler.disable()
+		profiler.dump_stats(stats_filename)
@@ -1,8 +1,8 @@
 import extraction as ex
+from measurement_set import MeasurementSet
 import argparse
 import os
 import os.path
-import matplotlib.pyplot as pl
 
 
 def main():
@@ -25,25 +25,30 @@ def main():
 	curdir = os.path.split(os.getcwd())
 	outdir = "extract_" + curdir[1]
 
-	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, skip_plots=True, struct_csv_name="*_3um_*.csv", skip_deembed=True, output_tag="_3um_no_deembed", output_dir=outdir + "_3um_no_deembed")
+	# Parse each width once; the de-embedded and raw variants share it. Sweeps that differ within a width are aligned
+	measurements_3um = MeasurementSet.load("*_3um_*.csv", align=True)
+	measurements_5um = MeasurementSet.load("*_5um_*.csv", align=True)
+
+	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, skip_plots=True, measurements=measurements_3um, skip_deembed=True, output_tag="_3um_no_deembed", output_dir=outdir + "_3um_no_deembed")
 	create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_3um_no_deembed.pdf", output_dir = outdir + "_3um_no_deembed")
 
-	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, skip_plots=True, struct_csv_name="*_5um_*.csv", skip_deembed=True, output_tag="_5um_no_deembed", output_dir=outdir + "_5um_no_deembed")
+	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, skip_plots=True, measurements=measurements_5um, skip_deembed=True, output_tag="_5um_no_deembed", output_dir=outdir + "_5um_no_deembed")
 	create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_5um_no_deembed.pdf", output_dir = outdir + "_5um_no_deembed")
 
-	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, skip_plots=True, struct_csv_name="*_3um_*.csv", skip_deembed=False, output_tag="_3um", output_dir=outdir + "_3um")
+	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, skip_plots=True, measurements=measurements_3um, skip_deembed=False, output_tag="_3um", output_dir=outdir + "_3um")
 	create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_3um.pdf", output_dir = outdir + "_3um")
 
-	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, skip_plots=True, struct_csv_name="*_5um_*.csv", skip_deembed=False, output_tag="_5um", output_dir=outdir + "_5um")
+	(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, skip_plots=True, measurements=measurements_5um, skip_deembed=False, output_tag="_5um", output_dir=outdir + "_5um")
 	create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_5um.pdf", output_dir = outdir + "_5um")
 	
 
 
 def create_plot(freq_mat, data_mat, length_vec, color_keys, plot_name, output_dir=""):
+	# matplotlib is only needed here, so it's imported here (keeps startup fast)
+	from matplotlib.figure import Figure
 	print("Creating plot: {0:s}".format(plot_name) )
-	pl.figure(1)
-	pl.clf()
-	pl.hold(True)
+	fig = Figure()
+	ax = fig.add_subplot(1, 1, 1)
 	
 	for idx, freq in enumerate(freq_mat):
 		data = data_mat[idx]
@@ -57,14 +62,14 @@ def create_plot(freq_mat, data_mat, length_vec, color_keys, plot_name, output_di
 			if el < 0:
 				num_neg +=1
 		if num_pos > 0:
-			pl.semilogy(freq/1e9, data, color_keys[length])
+			ax.semilogy(freq/1e9, data, color_keys[length])
 		if num_neg > 0:
-			pl.semilogy(freq/1e9, -data, color_keys[length] + ":")
-		pl.xlabel('Frequency (GHz)')
-		pl.ylabel("PUL R ($\Omega$/m)")
+			ax.semilogy(freq/1e9, -data, color_keys[length] + ":")
+		ax.set_xlabel('Frequency (GHz)')
+		ax.set_ylabel("PUL R ($\\Omega$/m)")
 		
 	output_name = os.path.join(output_dir, plot_name)
-	pl.savefig(output_name)
+	fig.savefig(output_name)
 
 
 if (__name__ == "__main__"):
@@ -1,68 +1,591 @@
-# Simple test script
-import matplotlib.pyplot as pl
+# End to end tests of extract_rlgc on synthetic measurements (see synthetic.py)
+# The structures are generated from known pads and RLGC, so the extraction has to give those values back.
+# Run with pytest, or directly with python.
+import numpy as np
+import contextlib
+import io
+import json
+import os.path
+import shutil
+import sys
+import tempfile
 import extraction as ex
+import csv_to_s2p
+import rf_support as rfs
+import pad_library
+import plot_render
+import result_cache
+import result_store
+import streaming
+import synthetic
+import uncertainty
+import multiport
+import catalog
+import quick_extract
+from measurement_set import MeasurementSet
+import service
+import urllib.request
 
-#pl.ion() # interactive plotting on to avoid blocking
-
-def create_plot(freq_mat, data_mat, length_vec, color_keys, plot_name):
-	print("Creating plot: {0:s}".format(plot_name) )
-	pl.figure(1)
-	pl.clf()
-	pl.hold(True)
-	
-	for idx, freq in enumerate(freq_mat):
-		data = data_mat[idx]
-		length = length_vec[idx]
-		
-		pl.semilogy(freq, data, color_keys[length])
-		pl.semilogy(freq, -data, color_keys[length] + ":")
-		
-		pl.savefig(plot_name)
-
-#pad_l_s2p_file= "test/500_5um_4.s2p"
-#pad_2l_s2p_file= "test/1000_5um_4B.s2p"
-
-base_dir = "test"
-base_dir = base_dir + "/"
-
-pad_l_s2p_file= "500_3um_1.csv"
-pad_2l_s2p_file= "1000_3um_1.csv"
-
-pad_l_s2p_file= base_dir + pad_l_s2p_file
-pad_2l_s2p_file= base_dir + pad_2l_s2p_file
-
-z0= 50
-method_extract = "distributed"
-
-freq_mat = []
-R_mat = []
-L_mat = []
-G_mat = []
-C_mat = []
-
-color_keys = { 2000:'k', 1000:'b', 500:'c', 100:'g', 50:'r' }
-
-(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_l_s2p_file, pad_2l_s2p_file, z0_probe=z0, method=method_extract, skip_plots=True, struct_csv_name=base_dir + "*_3um_*.csv", output_tag="_3um")
-create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_3um.pdf")
-
-(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_l_s2p_file, pad_2l_s2p_file, z0_probe=z0, method=method_extract, skip_plots=True, struct_csv_name=base_dir + "*_3um_*.csv", skip_deembed=True, output_tag="_3um_no_deembed")
-create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_3um_no_deembed.pdf")
-
-#(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_l_s2p_file, pad_2l_s2p_file, z0_probe=z0, method=method_extract, skip_plots=True, struct_s2p_name=base_dir + "*_5um_*.s2p", output_tag="_5um")
-#create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_5um.pdf")
-#
-#(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_l_s2p_file, pad_2l_s2p_file, z0_probe=z0, method=method_extract, skip_plots=True, struct_s2p_name=base_dir + "*.s2p", output_tag="_all")
-#create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_all.pdf")
-#
-#(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_l_s2p_file, pad_2l_s2p_file, z0_probe=z0, method=method_extract, skip_plots=True, struct_s2p_name=base_dir + "*_3um_*.s2p", skip_deembed=True, output_tag="_3um_no_deembed")
-#create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_3um_no_deembed.pdf")
-#
-#(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_l_s2p_file, pad_2l_s2p_file, z0_probe=z0, method=method_extract, skip_plots=True, struct_s2p_name=base_dir + "*_5um_*.s2p", skip_deembed=True, output_tag="_5um_no_deembed")
-#create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_5um_no_deembed.pdf")
-#
-#(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_l_s2p_file, pad_2l_s2p_file, z0_probe=z0, method=method_extract, skip_plots=True, struct_s2p_name=base_dir + "*.s2p", skip_deembed=True, output_tag="_all_no_deembed")
-#create_plot(freq_mat, R_mat, length_vec, color_keys, "R_plot_all_no_deembed.pdf")
-#
-#	
-#	
-#
+rel_tol = 1e-4
+
+
+def assert_rlgc_close(R, L, G, C, rtol=rel_tol):
+	for (data, value) in zip( [R, L, G, C], synthetic.default_rlgc ):
+		np.testing.assert_allclose( data, value, rtol=rtol)
+
+
+def test_extract_rlgc_recovers_synthetic_line():
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=201)
+		with contextlib.redirect_stdout( io.StringIO() ):
+			(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "extract") )
+		assert len(name_vec) == 6
+		assert_rlgc_close(R_mat, L_mat, G_mat, C_mat)
+
+
+def test_parallel_jobs_match_serial():
+	# the process pool writes the same files, byte for byte, as a serial run
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=101)
+		for jobs in [1, 3]:
+			with contextlib.redirect_stdout( io.StringIO() ):
+				ex.extract_rlgc( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "jobs{0:d}".format(jobs)), jobs=jobs)
+		name_list = sorted( os.listdir( os.path.join(tmp_dir, "jobs1") ) )
+		assert name_list == sorted( os.listdir( os.path.join(tmp_dir, "jobs3") ) )
+		for name in name_list:
+			with open( os.path.join(tmp_dir, "jobs1", name), 'rb') as serial_file, open( os.path.join(tmp_dir, "jobs3", name), 'rb') as parallel_file:
+				assert serial_file.read() == parallel_file.read(), name
+
+
+def test_plot_rendering():
+	# deferred plot data renders to the same set of PDFs as a direct run, in parallel processes, on the Agg backend
+	import matplotlib
+	matplotlib.use("Agg")
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=51, widths_um=[3])
+		pdf_suffixes = ["_RLGC.pdf", "_Sdb.pdf", "_Sdeg.pdf"]
+		for defer_plots in [True, False]:
+			output_dir = os.path.join(tmp_dir, "deferred" if defer_plots else "direct")
+			with contextlib.redirect_stdout( io.StringIO() ):
+				(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=output_dir, defer_plots=defer_plots, plot_jobs=2)
+			plot_data_list = [ plot_render.plot_data_path(name, output_dir) for name in name_vec ]
+			assert all( [ os.path.isfile(filename) for filename in plot_data_list ] )
+			if defer_plots:
+				assert [ name for name in os.listdir(output_dir) if name.endswith(".pdf") ] == []
+				assert sorted( plot_render.render_plot_files(plot_data_list, jobs=2) ) == sorted(name_vec)
+			for name in name_vec:
+				for suffix in pdf_suffixes:
+					with open( os.path.join(output_dir, name + suffix), 'rb') as infile:
+						assert infile.read(5) == b"%PDF-"
+
+
+def test_streaming_matches_extract_rlgc():
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=301, widths_um=[3])
+		pad_L = os.path.join(tmp_dir, "500_3um_1.csv")
+		pad_2L = os.path.join(tmp_dir, "1000_3um_1.csv")
+		with contextlib.redirect_stdout( io.StringIO() ):
+			ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "full") )
+			streaming.extract_rlgc_streaming(pad_L, pad_2L, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "stream"), chunk_points=64)
+		for name in ["R.csv", "L.csv", "G.csv", "C.csv", "rlgc_L2000um_W3um_1.csv"]:
+			with open( os.path.join(tmp_dir, "full", name) ) as full_file, open( os.path.join(tmp_dir, "stream", name) ) as stream_file:
+				assert full_file.read() == stream_file.read()
+
+
+def test_streaming_open_files_bounded():
+	# the number of files open at once doesn't grow with the number of structures
+	if not os.path.isdir("/proc/self/fd"):
+		return
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=101, lengths_um=(500, 1000, 1500, 2000, 2500, 3000, 3500, 4000), samples=("1", "2"))
+		open_counts = []
+		def counting_open(*args, **kwargs):
+			open_counts.append( len( os.listdir("/proc/self/fd") ) )
+			return open(*args, **kwargs)
+		num_before = len( os.listdir("/proc/self/fd") )
+		streaming.open = counting_open
+		try:
+			with contextlib.redirect_stdout( io.StringIO() ):
+				streaming.extract_rlgc_streaming( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "stream"), chunk_points=32)
+		finally:
+			del streaming.open
+		assert max(open_counts) - num_before <= 8
+
+
+def test_csv_to_s2p_round_trip():
+	# converted files read back through the Touchstone reader as the CSV data, at the port impedance written into them
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		filename_list = synthetic.write_measurement_set(tmp_dir, num_points=101, widths_um=[3])
+		for (jobs, port_impedance) in [ (1, 50.0), (2, 75.0) ]:
+			s2p_list = csv_to_s2p.convert_csv_files(filename_list, os.path.join(tmp_dir, "s2p"), port_impedance, jobs, block_lines=16)
+			for (filename, s2p_filename) in zip(filename_list, s2p_list):
+				(freq_csv, Sdb_csv, Sdeg_csv) = rfs.get_sdb_from_file(filename)
+				(freq_s2p, Sdb_s2p, Sdeg_s2p) = rfs.get_sdb_from_file(s2p_filename, z0=port_impedance)
+				np.testing.assert_allclose( freq_s2p, freq_csv, rtol=1e-12)
+				np.testing.assert_allclose( rfs.sdb2sri(Sdb_s2p, Sdeg_s2p), rfs.sdb2sri(Sdb_csv, Sdeg_csv), rtol=1e-9, atol=1e-12)
+
+
+def test_joint_extraction_recovers_synthetic_line():
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=201)
+		with contextlib.redirect_stdout( io.StringIO() ):
+			(width_vec, freq_mat, R_mat, L_mat, G_mat, C_mat, residual_list) = ex.extract_rlgc_joint( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "extract") )
+		assert width_vec == [3, 5]
+		assert_rlgc_close(R_mat, L_mat, G_mat, C_mat)
+		assert np.max( np.abs(residual_list[0]) ) < 1e-6
+
+
+def test_coarse_pad_sweep():
+	# pads measured on 101 points de-embed structures measured on 801 points (the pad is interpolated)
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(os.path.join(tmp_dir, "pads"), num_points=101, lengths_um=[500, 1000], widths_um=[3])
+		synthetic.write_measurement_set(os.path.join(tmp_dir, "lines"), num_points=801, lengths_um=[2000], widths_um=[3, 5])
+		for jobs in [1, 2]:
+			with contextlib.redirect_stdout( io.StringIO() ):
+				(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc( os.path.join(tmp_dir, "pads", "500_3um_1.csv"), os.path.join(tmp_dir, "pads", "1000_3um_1.csv"), skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "lines", "*.csv"), output_dir=os.path.join(tmp_dir, "extract"), jobs=jobs)
+			assert np.shape(R_mat) == (2, 801)
+			# interpolating the pad costs some accuracy, L most at the lowest frequencies where it is a tiny part of the series impedance
+			high_freq = freq_mat[0] > 1e9
+			assert_rlgc_close( np.array(R_mat), np.array(L_mat)[:, high_freq], np.array(G_mat), np.array(C_mat), rtol=1e-3 )
+
+
+def test_profile_summary():
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=101, widths_um=[3])
+		profile_json = os.path.join(tmp_dir, "extract", "profile.json")
+		with contextlib.redirect_stdout( io.StringIO() ):
+			ex.extract_rlgc( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "extract"), profile_json=profile_json)
+		with open(profile_json) as infile:
+			summary = json.load(infile)
+		for stage in ["parse", "pad extraction", "de-embed", "distributed extraction", "structure outputs", "aggregate outputs"]:
+			assert summary["stages"][stage]["calls"] >= 1
+		assert summary["stages"]["distributed extraction"]["points"] == 3*101
+		assert len(summary["files"]) == 3
+
+
+def test_pad_model_matches_pad_files():
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=101, widths_um=[3])
+		pad_L = os.path.join(tmp_dir, "500_3um_1.csv")
+		pad_2L = os.path.join(tmp_dir, "1000_3um_1.csv")
+		library_dir = os.path.join(tmp_dir, "pads")
+		(freq_pad, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = ex.get_pad_abcd(pad_L, pad_2L)
+		pad_library.save_pad_model("probe_a", freq_pad, abcd_pad, abcd_pad_inv, complex(50.0, 0), pad_L, pad_2L, library_dir)
+		assert [ name for (name, meta) in pad_library.list_pad_models(library_dir) ] == ["probe_a"]
+		with contextlib.redirect_stdout( io.StringIO() ):
+			from_files = ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "files") )
+			from_model = ex.extract_rlgc(None, None, skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "model"), pad_model="probe_a", pad_library_dir=library_dir)
+		for (data_files, data_model) in zip(from_files[0:5], from_model[0:5]):
+			np.testing.assert_array_equal( np.array(data_files), np.array(data_model) )
+		try:
+			pad_library.load_pad_model("probe_a", library_dir, z0_probe=complex(25.0, 0))
+			assert False, "a pad model extracted at another z0 must be rejected"
+		except ValueError:
+			pass
+
+
+def test_unwrap_long_lines():
+	# 5-20 mm lines are several wavelengths long at 20 GHz, and the sweep starts above the first wrap
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=201, lengths_um=[5000, 10000, 20000], widths_um=[3], freq_min=5e9)
+		pad_L = os.path.join(tmp_dir, "5000_3um_1.csv")
+		pad_2L = os.path.join(tmp_dir, "10000_3um_1.csv")
+		with contextlib.redirect_stdout( io.StringIO() ):
+			(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "extract"), branch="unwrap")
+			(width_vec, freq_mat, R_joint, L_joint, G_joint, C_joint, residual_list) = ex.extract_rlgc_joint(pad_L, pad_2L, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "extract"), branch="unwrap")
+		assert_rlgc_close(R_mat, L_mat, G_mat, C_mat)
+		assert_rlgc_close(R_joint, L_joint, G_joint, C_joint)
+
+
+def test_monte_carlo_uncertainty():
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=101, widths_um=[3], freq_min=1e9)
+		pad_L = os.path.join(tmp_dir, "500_3um_1.csv")
+		pad_2L = os.path.join(tmp_dir, "1000_3um_1.csv")
+		with contextlib.redirect_stdout( io.StringIO() ):
+			(name_vec, freq, nominal, mean, std, percentile_mat) = uncertainty.extract_rlgc_uncertainty(pad_L, pad_2L, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "extract"), num_draws=200, sigma_db=0.002, sigma_deg=0.02, sigma_length_um=0.5, seed=1)
+		assert np.shape(percentile_mat) == (3, 4, 3, 101)
+		assert_rlgc_close(*nominal)
+		assert np.all( std > 0 )
+		assert np.all( (percentile_mat[0] <= percentile_mat[1]) & (percentile_mat[1] <= percentile_mat[2]) )
+		# small noise: the spread brackets the noise free value
+		assert np.mean( (percentile_mat[0] <= nominal) & (nominal <= percentile_mat[2]) ) > 0.9
+		assert os.path.isfile( os.path.join(tmp_dir, "extract", "rlgc_mc_L2000um_W3um_1.csv") )
+
+
+def test_monte_carlo_nominal_matches_extract_rlgc():
+	# away from 50 Ohm too, and with pads measured on a coarser sweep than the structures,
+	# the noise free draw is exactly what extract_rlgc gives
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set( os.path.join(tmp_dir, "same"), num_points=101, widths_um=[3], freq_min=1e9)
+		synthetic.write_measurement_set( os.path.join(tmp_dir, "coarse_pads"), num_points=101, lengths_um=[500, 1000], widths_um=[3], freq_min=1e9)
+		synthetic.write_measurement_set( os.path.join(tmp_dir, "dense_lines"), num_points=401, widths_um=[3], freq_min=1e9)
+		for (pad_dir, line_dir) in [ ("same", "same"), ("coarse_pads", "dense_lines") ]:
+			pad_L = os.path.join(tmp_dir, pad_dir, "500_3um_1.csv")
+			pad_2L = os.path.join(tmp_dir, pad_dir, "1000_3um_1.csv")
+			struct_csv_name = os.path.join(tmp_dir, line_dir, "*.csv")
+			with contextlib.redirect_stdout( io.StringIO() ):
+				(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_L, pad_2L, complex(45, 0), skip_plots=True, struct_csv_name=struct_csv_name, output_dir=os.path.join(tmp_dir, "extract") )
+				(mc_names, freq, nominal, mean, std, percentile_mat) = uncertainty.extract_rlgc_uncertainty(pad_L, pad_2L, complex(45, 0), struct_csv_name=struct_csv_name, output_dir=os.path.join(tmp_dir, "mc"), num_draws=4, seed=1)
+			np.testing.assert_array_equal( freq, freq_mat[0] )
+			order = [ mc_names.index(name) for name in name_vec ]
+			for (idx, data) in enumerate([R_mat, L_mat, G_mat, C_mat]):
+				np.testing.assert_allclose( nominal[idx][order], np.array(data), rtol=1e-9)
+
+
+def test_service_picks_up_new_files():
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		filename_list = synthetic.write_measurement_set( os.path.join(tmp_dir, "data"), num_points=101, widths_um=[3, 5] )
+		watch_dir = os.path.join(tmp_dir, "watch")
+		os.makedirs(watch_dir)
+		for filename in filename_list[0:2]:
+			os.replace(filename, os.path.join( watch_dir, os.path.basename(filename) ))
+		output_dir = os.path.join(tmp_dir, "extract")
+		with contextlib.redirect_stdout( io.StringIO() ):
+			extraction_service = service.ExtractionService(watch_dir, os.path.join(watch_dir, "500_3um_1.csv"), os.path.join(watch_dir, "1000_3um_1.csv"), output_dir=output_dir)
+			server = extraction_service.serve(0)
+			assert extraction_service.poll() == [] # new files settle for one poll first
+			assert len( extraction_service.poll() ) == 2
+			os.replace(filename_list[2], os.path.join( watch_dir, os.path.basename(filename_list[2]) ))
+			request = urllib.request.Request("http://127.0.0.1:{0:d}/submit".format(server.server_address[1]), data=json.dumps( { "filename": filename_list[3] } ).encode("utf-8"), method="POST")
+			urllib.request.urlopen(request).close()
+			extraction_service.poll()
+			extraction_service.poll()
+			with urllib.request.urlopen("http://127.0.0.1:{0:d}/status".format(server.server_address[1])) as response:
+				status = json.load(response)
+			server.shutdown()
+		assert status["structures"] == ["L1000um_W3um_1", "L2000um_W3um_1", "L500um_W3um_1", "L500um_W5um_1"]
+		with open( os.path.join(output_dir, "R.csv") ) as infile:
+			assert infile.readline().count(",") == 4
+
+
+def test_service_drops_deleted_files_and_aggregate_errors():
+	# a failed R/L/G/C.csv write is recorded and retried instead of stopping the service; deleted files leave the aggregates
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		watch_dir = os.path.join(tmp_dir, "watch")
+		filename_list = synthetic.write_measurement_set(watch_dir, num_points=101, widths_um=[3])
+		output_dir = os.path.join(tmp_dir, "extract")
+		with contextlib.redirect_stdout( io.StringIO() ):
+			extraction_service = service.ExtractionService(watch_dir, filename_list[0], filename_list[1], output_dir=output_dir)
+			os.makedirs( os.path.join(output_dir, "R.csv") ) # can't be written over
+			extraction_service.poll()
+			assert len( extraction_service.poll() ) == 3
+			assert service.aggregates_error_key in extraction_service.status()["errors"]
+			os.rmdir( os.path.join(output_dir, "R.csv") )
+			assert extraction_service.poll() == []
+			assert extraction_service.status()["errors"] == {}
+			with open( os.path.join(output_dir, "R.csv") ) as infile:
+				assert infile.readline().count(",") == 3
+
+			os.remove(filename_list[2])
+			extraction_service.poll()
+		assert extraction_service.status()["structures"] == ["L1000um_W3um_1", "L500um_W3um_1"]
+		with open( os.path.join(output_dir, "R.csv") ) as infile:
+			assert infile.readline().count(",") == 2
+
+
+def test_multiport_recovers_coupled_lines():
+	# 4-port measurements of a coupled pair give back the 2x2 RLGC matrices; one conductor matches the 2-port method
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_multiport_set(tmp_dir, num_points=201)
+		with contextlib.redirect_stdout( io.StringIO() ):
+			(name_vec, freq_mat, R_mat, L_mat, G_mat, C_mat) = multiport.extract_rlgc_multiport( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "extract") )
+		assert len(name_vec) == 3
+		for (data, value) in zip( [R_mat, L_mat, G_mat, C_mat], synthetic.default_mtl_rlgc ):
+			np.testing.assert_allclose( np.array(data), np.broadcast_to(value, np.shape(data)), rtol=rel_tol, atol=rel_tol*np.max(np.abs(value)) )
+
+	freq = np.linspace(10e6, 20e9, 101)
+	abcd = synthetic.line_abcd(freq, 1e-3)
+	(freq_2port, R, L, G, C) = ex.distributed_rlgc_from_abcd(1e-3, freq, abcd)[0:5]
+	(freq_mtl, R_mtl, L_mtl, G_mtl, C_mtl, gamma) = multiport.mtl_rlgc_from_abcd(1e-3, freq, abcd)
+	for (data, data_mtl) in zip( [R, L, G, C], [R_mtl, L_mtl, G_mtl, C_mtl] ):
+		np.testing.assert_allclose( data_mtl[:, 0, 0], data, rtol=1e-9)
+
+
+def test_z0_sweep_matches_single_runs():
+	# one broadcast pass gives what separate runs at each z0 give, and the true z0 has the lowest R/L spread
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=101)
+		pad_L = os.path.join(tmp_dir, "500_3um_1.csv")
+		pad_2L = os.path.join(tmp_dir, "1000_3um_1.csv")
+		z0_vec = [45.0, 50.0, 55.0 + 2j]
+		with contextlib.redirect_stdout( io.StringIO() ):
+			(freq, R_sweep, L_sweep, G_sweep, C_sweep, name_vec, spread, best_idx) = ex.extract_rlgc_z0_sweep(pad_L, pad_2L, z0_vec, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "sweep"), select=True)
+			(freq_mat, R_mat, L_mat, G_mat, C_mat, single_names, length_vec, width_vec) = ex.extract_rlgc(pad_L, pad_2L, complex(z0_vec[2]), skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "single") )
+		assert np.shape(R_sweep) == (3, 6, 101)
+		assert best_idx == 1
+		assert_rlgc_close(R_sweep[1], L_sweep[1], G_sweep[1], C_sweep[1])
+		order = [ name_vec.index(name) for name in single_names ]
+		for (data, sweep) in zip( [R_mat, L_mat, G_mat, C_mat], [R_sweep, L_sweep, G_sweep, C_sweep] ):
+			np.testing.assert_allclose( sweep[2][order], np.array(data), rtol=1e-12)
+		assert os.path.isfile( os.path.join(tmp_dir, "sweep", "R_z0_55+2j.csv") )
+		assert os.path.isfile( os.path.join(tmp_dir, "sweep", "R.csv") )
+
+
+def test_catalog_scan_and_query():
+	# incremental scans, queries instead of globs, and the run recorded against its structures
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		catalog_file = os.path.join(tmp_dir, "catalog.sqlite")
+		for wafer in ["w1", "w2"]:
+			synthetic.write_measurement_set( os.path.join(tmp_dir, "wafers", wafer), num_points=51)
+		with contextlib.redirect_stdout( io.StringIO() ):
+			assert catalog.scan(catalog_file, [ os.path.join(tmp_dir, "wafers") ]) == (12, 0, 0, 0)
+			os.remove( os.path.join(tmp_dir, "wafers", "w1", "2000_5um_1.csv") )
+			assert catalog.scan(catalog_file, [ os.path.join(tmp_dir, "wafers") ]) == (0, 0, 11, 1)
+		row = catalog.lookup(catalog_file, [ os.path.join(tmp_dir, "wafers", "w2", "500_3um_1.csv") ]).popitem()[1]
+		assert (row["length_um"], row["width_um"], row["sample"], row["num_points"], row["num_ports"]) == (500, 3, "1", 51, 2)
+		assert len( catalog.query_files(catalog_file, "width=5") ) == 5
+		assert len( catalog.query_files(catalog_file, "width=3 length=500,2000 path=*/w2/*") ) == 2
+
+		pad_L = os.path.join(tmp_dir, "wafers", "w2", "500_3um_1.csv")
+		pad_2L = os.path.join(tmp_dir, "wafers", "w2", "1000_3um_1.csv")
+		with contextlib.redirect_stdout( io.StringIO() ):
+			(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, output_dir=os.path.join(tmp_dir, "extract"), catalog=catalog_file, catalog_query="width=3 path=*/w2/*")
+		assert len(name_vec) == 3
+		assert_rlgc_close(R_mat, L_mat, G_mat, C_mat)
+		run_list = catalog.list_runs(catalog_file, pad_2L)
+		assert (len(run_list), run_list[0]["num_structures"]) == (1, 3)
+		assert run_list[0]["pad_L_sha1"] == row["sha1"]
+
+
+def test_catalog_mixed_port_counts():
+	# 4-port coupled line files next to 2-port ones are cataloged, but extract_rlgc only gets the 2-port ones
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		catalog_file = os.path.join(tmp_dir, "catalog.sqlite")
+		synthetic.write_measurement_set( os.path.join(tmp_dir, "wafers", "lines"), num_points=51, widths_um=[3])
+		synthetic.write_multiport_set( os.path.join(tmp_dir, "wafers", "pairs"), num_points=51, widths_um=[3])
+		with contextlib.redirect_stdout( io.StringIO() ):
+			catalog.scan(catalog_file, [ os.path.join(tmp_dir, "wafers") ])
+		assert len( catalog.query_files(catalog_file, "width=3") ) == 6
+		assert len( catalog.query_files(catalog_file, "width=3 ports=4") ) == 3
+		assert len( catalog.query_files(catalog_file, "width=3", num_ports=2) ) == 3
+
+		pad_L = os.path.join(tmp_dir, "wafers", "lines", "500_3um_1.csv")
+		pad_2L = os.path.join(tmp_dir, "wafers", "lines", "1000_3um_1.csv")
+		with contextlib.redirect_stdout( io.StringIO() ):
+			(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, output_dir=os.path.join(tmp_dir, "extract"), catalog=catalog_file, catalog_query="width=3")
+		assert len(name_vec) == 3
+		assert_rlgc_close(R_mat, L_mat, G_mat, C_mat)
+		try:
+			catalog.query_files(catalog_file, "ports=4", num_ports=2)
+			assert False, "a 4-port query can't be used for 2-port extraction"
+		except ValueError:
+			pass
+
+
+def test_lumped_matches_line_totals():
+	# electrically short, the lumped R, L, G, C of a structure are the line's per unit length values times its length
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=201, widths_um=[3])
+		with contextlib.redirect_stdout( io.StringIO() ):
+			(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), method="lumped", skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, "extract") )
+		for (idx, length_um) in enumerate(length_vec):
+			for (data, value) in zip( [R_mat, L_mat, G_mat, C_mat], synthetic.default_rlgc ):
+				np.testing.assert_allclose( data[idx][0], value * length_um*1e-6, rtol=1e-3)
+
+
+def test_result_cache_hits_and_invalidation():
+	# A rerun is served from the cache with byte-identical outputs; changing a structure, a pad file, z0 or the method
+	# misses; past result_cache_max_mb the least recently used entries go first
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		# one width, so no two structure files have the same contents (and hence the same entry)
+		synthetic.write_measurement_set(tmp_dir, num_points=51, lengths_um=(500, 1000, 2000, 3000), widths_um=[3])
+		cache_dir = os.path.join(tmp_dir, "cache")
+
+		def run_cached(output_name, z0_probe=complex(50.0,0), method="distributed", max_mb=1024):
+			# number of structures served from the cache
+			stdout = io.StringIO()
+			with contextlib.redirect_stdout(stdout):
+				ex.extract_rlgc( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), z0_probe, method, skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=os.path.join(tmp_dir, output_name), result_cache_dir=cache_dir, result_cache_max_mb=max_mb)
+			return int( stdout.getvalue().split("Result cache: ")[1].split(" ")[0] )
+
+		assert run_cached("first") == 0
+		assert run_cached("second") == 4
+		for name in sorted( os.listdir( os.path.join(tmp_dir, "first") ) ):
+			with open( os.path.join(tmp_dir, "first", name), 'rb') as infile:
+				first_bytes = infile.read()
+			with open( os.path.join(tmp_dir, "second", name), 'rb') as infile:
+				assert infile.read() == first_bytes, name
+
+		with open( os.path.join(tmp_dir, "2000_3um_1.csv"), 'a') as outfile:
+			outfile.write("! edited\n")
+		assert run_cached("structure") == 3
+		with open( os.path.join(tmp_dir, "1000_3um_1.csv"), 'a') as outfile:
+			outfile.write("! edited\n")
+		assert run_cached("pad") == 0
+		assert run_cached("z0", z0_probe=complex(45.0,0)) == 0
+		assert run_cached("method", method="lumped") == 0
+		assert run_cached("again", method="lumped") == 4
+
+		# room for 2 entries: only entries from the latest run may survive
+		entry_bytes = max( [ os.path.getsize( os.path.join(cache_dir, name) ) for name in os.listdir(cache_dir) ] )
+		run_cached("evict", max_mb=2.5*entry_bytes/1e6)
+		num_left = len( [ name for name in os.listdir(cache_dir) if name.endswith(result_cache.entry_suffix) ] )
+		assert 0 < num_left <= 2
+		assert run_cached("after_evict") == num_left
+
+
+def test_result_cache_mixed_sweeps():
+	# entries stay on each file's own sweep, so a run with a 15 GHz structure among 20 GHz ones doesn't leave
+	# trimmed results behind for a later run of the 20 GHz files alone
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=201, widths_um=[3])
+		synthetic.write_measurement_set(tmp_dir, num_points=101, lengths_um=[3000], widths_um=[3], samples=("b",), freq_max=15e9)
+		(pad_L, pad_2L) = ( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv") )
+		cache_dir = os.path.join(tmp_dir, "cache")
+		with contextlib.redirect_stdout( io.StringIO() ):
+			ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*_3um_*.csv"), output_dir=os.path.join(tmp_dir, "mixed"), result_cache_dir=cache_dir)
+			cached = ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*_3um_1.csv"), output_dir=os.path.join(tmp_dir, "cached"), result_cache_dir=cache_dir)
+			fresh = ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*_3um_1.csv"), output_dir=os.path.join(tmp_dir, "fresh") )
+		assert len(cached[0][0]) == 201
+		for (data_cached, data_fresh) in zip(cached[0:5], fresh[0:5]):
+			np.testing.assert_array_equal( np.array(data_cached), np.array(data_fresh) )
+		for name in ["R.csv", "rlgc_L2000um_W3um_1.csv"]:
+			with open( os.path.join(tmp_dir, "cached", name), 'rb') as cached_file, open( os.path.join(tmp_dir, "fresh", name), 'rb') as fresh_file:
+				assert cached_file.read() == fresh_file.read(), name
+
+
+def test_result_store_round_trip():
+	# npz and columnar stores read back to the R/L/G/C extract_rlgc returns; rewriting a store replaces it cleanly
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=51)
+		output_dir = os.path.join(tmp_dir, "extract")
+		for output_format in ["npz", "columnar"]:
+			for dummy in range(2):
+				with contextlib.redirect_stdout( io.StringIO() ):
+					(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec) = ex.extract_rlgc( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv"), skip_plots=True, struct_csv_name=os.path.join(tmp_dir, "*.csv"), output_dir=output_dir, output_format=output_format)
+			store_filename = result_store.result_store_path(output_format, "", output_dir)
+			assert not any( [ os.path.exists(store_filename + suffix) for suffix in [".tmp", ".old"] ] )
+			for mmap in [False, True]:
+				result = result_store.read_result_store(store_filename, mmap)
+				for (column_name, data_mat) in zip(result_store.data_columns, [freq_mat, R_mat, L_mat, G_mat, C_mat]):
+					np.testing.assert_array_equal( result[column_name], np.array(data_mat) )
+				assert result["name"] == list(name_vec)
+				np.testing.assert_array_equal( result["length_um"], length_vec)
+				np.testing.assert_array_equal( result["width_um"], width_vec)
+
+
+def test_touchstone_pads_at_probe_z0():
+	# Touchstone pads referenced to the probe z0 give the same pad as the same S parameters in a CSV run at that z0
+	z0_probe = complex(75, 0)
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=51, widths_um=[3])
+		pad_files = [ os.path.join(tmp_dir, name) for name in ["500_3um_1.csv", "1000_3um_1.csv"] ]
+		s2p_files = []
+		for filename in pad_files:
+			(freq_hz, Sdb, Sdeg) = rfs.get_sdb_from_file(filename)
+			S = rfs.sdb2sri(Sdb, Sdeg)
+			s2p_files.append( filename.replace(".csv", ".s2p") )
+			with open(s2p_files[-1], 'w') as outfile:
+				outfile.write("# HZ S RI R 75\n")
+				for idx in range(len(freq_hz)):
+					values = [ S[idx, 0, 0], S[idx, 1, 0], S[idx, 0, 1], S[idx, 1, 1] ]
+					outfile.write("{0:.17g} ".format(freq_hz[idx]) + " ".join( [ "{0:.17g} {1:.17g}".format(value.real, value.imag) for value in values ] ) + "\n")
+		abcd_csv = ex.get_pad_abcd(pad_files[0], pad_files[1], z0_probe)[1]
+		cache_dir = os.path.join(tmp_dir, "cache")
+		for dummy in range(2):
+			np.testing.assert_allclose( ex.get_pad_abcd(s2p_files[0], s2p_files[1], z0_probe, cache_dir)[1], abcd_csv, rtol=1e-9, atol=1e-12)
+		measurements = MeasurementSet.from_files(s2p_files)
+		np.testing.assert_allclose( measurements.get_pad_abcd(s2p_files[0], s2p_files[1], z0_probe)[1], abcd_csv, rtol=1e-9, atol=1e-12)
+
+
+def test_stacked_sweeps_with_same_point_count():
+	# sweeps with the same number of points over different ranges aren't stacked as one grid: from_files refuses them,
+	# and a set holding both anyway is extracted per sweep, each structure as if it were run alone
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=201, lengths_um=(500, 1000, 2000), widths_um=[3])
+		synthetic.write_measurement_set(tmp_dir, num_points=201, lengths_um=[2000], widths_um=[3], samples=("b",), freq_max=15e9)
+		(pad_L, pad_2L) = ( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "1000_3um_1.csv") )
+		file_list = [ os.path.join(tmp_dir, "2000_3um_1.csv"), os.path.join(tmp_dir, "2000_3um_b.csv") ]
+		try:
+			MeasurementSet.from_files(file_list)
+			assert False, "from_files stacked two different sweeps"
+		except ValueError:
+			pass
+
+		set_list = [ MeasurementSet.from_files( [filename] ) for filename in file_list ]
+		loaded_files = dict(set_list[0].loaded_files, **set_list[1].loaded_files)
+		measurements = MeasurementSet(file_list, *[ np.concatenate( [ getattr(ms, name) for ms in set_list ] ) for name in ["freq_hz", "Sdb", "Sdeg", "abcd"] ], loaded_files=loaded_files)
+		with contextlib.redirect_stdout( io.StringIO() ):
+			ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, measurements=measurements, output_dir=os.path.join(tmp_dir, "stacked") )
+			for filename in file_list:
+				ex.extract_rlgc(pad_L, pad_2L, skip_plots=True, struct_csv_name=filename, output_dir=os.path.join(tmp_dir, "alone") )
+		for name in ["rlgc_L2000um_W3um_1.csv", "rlgc_L2000um_W3um_b.csv"]:
+			with open( os.path.join(tmp_dir, "stacked", name), 'rb') as stacked_file, open( os.path.join(tmp_dir, "alone", name), 'rb') as alone_file:
+				assert stacked_file.read() == alone_file.read(), name
+
+
+def test_measurement_set_load_and_select():
+	# pad copies that aren't named like structures are skipped; differing sweeps are aligned with align=True
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		synthetic.write_measurement_set(tmp_dir, num_points=101, widths_um=[3])
+		synthetic.write_measurement_set(tmp_dir, num_points=151, widths_um=[5])
+		shutil.copy( os.path.join(tmp_dir, "500_3um_1.csv"), os.path.join(tmp_dir, "pad_L.csv") )
+		with contextlib.redirect_stdout( io.StringIO() ):
+			measurements = MeasurementSet.load(tmp_dir, align=True)
+		assert len(measurements) == 6
+		assert np.shape(measurements.abcd) == (6, 151, 2, 2) # the densest sweep
+		subset = measurements.select(width=5, length=[1000, 2000])
+		assert sorted( subset.lengths_um.tolist() ) == [1000, 2000]
+		assert subset.widths_um.tolist() == [5, 5]
+		np.testing.assert_array_equal( subset.abcd[0], measurements.abcd[ measurements.filenames.index(subset.filenames[0]) ] )
+		try:
+			MeasurementSet.load(tmp_dir)
+			assert False, "sweeps of different lengths can't be stacked without align"
+		except ValueError:
+			pass
+
+
+def test_quick_extract_runs_per_width():
+	# pad files named pad_*.csv and widths measured on different sweeps, as in a typical measurement folder
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		data_dir = os.path.join(tmp_dir, "run1")
+		synthetic.write_measurement_set(data_dir, num_points=101, widths_um=[3])
+		synthetic.write_measurement_set(data_dir, num_points=151, widths_um=[5])
+		shutil.copy( os.path.join(data_dir, "500_3um_1.csv"), os.path.join(data_dir, "pad_L.csv") )
+		shutil.copy( os.path.join(data_dir, "1000_3um_1.csv"), os.path.join(data_dir, "pad_2L.csv") )
+		argv = sys.argv
+		sys.argv = ["quick_extract.py", "pad_L.csv", "pad_2L.csv"]
+		try:
+			with contextlib.chdir(data_dir), contextlib.redirect_stdout( io.StringIO() ):
+				quick_extract.main()
+		finally:
+			sys.argv = argv
+		for variant in ["_3um_no_deembed", "_5um_no_deembed", "_3um", "_5um"]:
+			output_dir = os.path.join(data_dir, "extract_run1" + variant)
+			assert os.path.isfile( os.path.join(output_dir, "R_plot" + variant + ".pdf") )
+			with open( os.path.join(output_dir, "R" + variant + ".csv") ) as infile:
+				assert infile.readline().count(",") == 3
+		with open( os.path.join(data_dir, "extract_run1_5um", "R_5um.csv") ) as infile:
+			assert len( infile.readlines() ) == 152
+
+
+if (__name__ == "__main__"):
+	test_extract_rlgc_recovers_synthetic_line()
+	test_parallel_jobs_match_serial()
+	test_plot_rendering()
+	test_streaming_matches_extract_rlgc()
+	test_streaming_open_files_bounded()
+	test_csv_to_s2p_round_trip()
+	test_joint_extraction_recovers_synthetic_line()
+	test_coarse_pad_sweep()
+	test_profile_summary()
+	test_pad_model_matches_pad_files()
+	test_unwrap_long_lines()
+	test_monte_carlo_uncertainty()
+	test_monte_carlo_nominal_matches_extract_rlgc()
+	test_service_picks_up_new_files()
+	test_service_drops_deleted_files_and_aggregate_errors()
+	test_multiport_recovers_coupled_lines()
+	test_z0_sweep_matches_single_runs()
+	test_catalog_scan_and_query()
+	test_catalog_mixed_port_counts()
+	test_lumped_matches_line_totals()
+	test_result_cache_hits_and_invalidation()
+	test_result_cache_mixed_sweeps()
+	test_result_store_round_trip()
+	test_touchstone_pads_at_probe_z0()
+	test_stacked_sweeps_with_same_point_count()
+	test_measurement_set_load_and_select()
+	test_quick_extract_runs_per_width()
+	print("All extraction tests passed")
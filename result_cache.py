@@ -0,0 +1,107 @@
+import numpy as np
+import hashlib
+import os
+import os.path
+
+# Persistent cache of per-structure extraction results
+# An entry is keyed by the hash of the structure file's contents together with everything else that
+# changes the result: the contents of the pad L/2L files, z0, the extraction method (and arccosh branch) and skip_deembed.
+# extract_rlgc looks every structure up before doing any work and only parses/extracts the misses,
+# so dropping one new file into a directory of hundreds costs one extraction.
+#
+# Entries are plain .npz files (freq, R, L, G, C and the measured Sdb/Sdeg for plotting). A hit refreshes
+# the entry's mtime, and evict_results trims the least recently used entries once the cache grows past
+# its size limit.
+
+# Bump when the extraction math changes so stale results aren't reused
+result_cache_version = 1
+entry_suffix = ".rlgc.npz"
+
+
+def file_digest(filename, chunk_bytes=1<<20):
+	# sha1 of the file contents
+	digest = hashlib.sha1()
+	with open(filename, 'rb') as infile:
+		for chunk in iter(lambda: infile.read(chunk_bytes), b""):
+			digest.update(chunk)
+
+	return digest.hexdigest()
+
+
+def pad_digest(pad_L_filename, pad_2L_filename, skip_deembed=False):
+	# Part of the key describing the pad de-embedding; pad files don't matter when de-embedding is skipped
+	if skip_deembed:
+		return "no_deembed"
+	return file_digest(pad_L_filename) + file_digest(pad_2L_filename)
+
+
+def structure_key(filename, pad_key, z0_probe, method, skip_deembed, branch="principal"):
+	key_parts = [ str(result_cache_version), file_digest(filename), pad_key, repr(complex(z0_probe)), method, str(bool(skip_deembed)) ]
+	if branch != "principal": # principal branch keys stay as they were before branches were an option
+		key_parts.append(branch)
+	key_str = "|".join(key_parts)
+	return hashlib.sha1( key_str.encode("utf-8") ).hexdigest()
+
+
+def entry_path(cache_dir, key):
+	return os.path.join(cache_dir, key + entry_suffix)
+
+
+def load_result(cache_dir, key):
+	# (freq, R, L, G, C, Sdb, Sdeg) for key, or None on a miss
+	filename = entry_path(cache_dir, key)
+	try:
+		with np.load(filename) as data:
+			result = ( data["freq"], data["R"], data["L"], data["G"], data["C"], data["Sdb"], data["Sdeg"] )
+	except (OSError, KeyError, ValueError):
+		return None
+
+	try:
+		os.utime(filename) # mark as recently used
+	except OSError:
+		pass
+
+	return result
+
+
+def store_result(cache_dir, key, freq, R, L, G, C, Sdb, Sdeg):
+	if not os.path.exists(cache_dir):
+		os.makedirs(cache_dir, exist_ok=True)
+
+	# write to a temporary file first so a concurrent reader never sees a partial entry
+	filename = entry_path(cache_dir, key)
+	tmp_filename = "{0:s}.{1:d}.tmp".format(filename, os.getpid())
+	with open(tmp_filename, 'wb') as outfile:
+		np.savez(outfile, freq=freq, R=R, L=L, G=G, C=C, Sdb=Sdb, Sdeg=Sdeg)
+	os.replace(tmp_filename, filename)
+
+
+def evict_results(cache_dir, max_bytes):
+	# Deletes least recently used entries until the cache is no bigger than max_bytes
+	# Returns the number of entries removed
+	if (max_bytes is None) or not os.path.isdir(cache_dir):
+		return 0
+
+	entry_list = []
+	for name in os.listdir(cache_dir):
+		if not name.endswith(entry_suffix):
+			continue
+		try:
+			stat = os.stat( os.path.join(cache_dir, name) )
+		except OSError:
+			continue
+		entry_list.append( (stat.st_mtime, stat.st_size, name) )
+
+	total_bytes = sum( [ entry[1] for entry in entry_list ] )
+	num_removed = 0
+	for (mtime, size, name) in sorted(entry_list):
+		if total_bytes <= max_bytes:
+			break
+		try:
+			os.remove( os.path.join(cache_dir, name) )
+		except OSError:
+			continue
+		total_bytes -= size
+		num_removed += 1
+
+	return num_removed
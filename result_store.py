@@ -0,0 +1,93 @@
+import numpy as np
+import json
+import os
+import os.path
+import shutil
+
+# Binary result stores for extract_rlgc
+# Every structure's freq/R/L/G/C plus the run metadata is written in one bulk write, in one of two layouts:
+#	npz		rlgc<tag>.npz, a single NumPy archive
+#	columnar	rlgc<tag>.cols/, one raw .npy file per column plus meta.json (HDF5-like; columns can be memory-mapped)
+# In both, freq/R/L/G/C are (N, F) matrices with one row per structure, and per-structure metadata
+# (name, length_um, width_um, sample) are length N. read_result_store reads either back into a dict.
+
+store_formats = ["npz", "columnar"]
+data_columns = ["freq", "R", "L", "G", "C"]
+
+
+def result_store_path(output_format, output_tag="", output_dir=""):
+	if output_format == "npz":
+		return os.path.join(output_dir, "rlgc" + output_tag + ".npz")
+	elif output_format == "columnar":
+		return os.path.join(output_dir, "rlgc" + output_tag + ".cols")
+	else:
+		raise ValueError("Unknown result store format: {0:s}".format(output_format))
+
+
+def write_result_store(filename, output_format, freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec, sample_vec, metadata=None):
+	# metadata: dict of run settings (z0, method, skip_deembed, pad files, ...). Must be JSON serializable.
+	if metadata is None:
+		metadata = {}
+
+	columns = {}
+	for (column_name, data_mat) in zip(data_columns, [freq_mat, R_mat, L_mat, G_mat, C_mat]):
+		data_mat = np.asarray(data_mat, dtype=float)
+		if data_mat.ndim != 2:
+			raise ValueError("Result stores need every structure on the same number of frequency points")
+		columns[column_name] = data_mat
+	columns["length_um"] = np.asarray(length_vec, dtype=int)
+	columns["width_um"] = np.asarray(width_vec, dtype=int)
+
+	meta = dict(metadata)
+	meta["name"] = list(name_vec)
+	meta["sample"] = list(sample_vec)
+	meta["num_structures"] = len(name_vec)
+	meta["num_freqs"] = columns["freq"].shape[1] if len(name_vec) > 0 else 0
+
+	if output_format == "npz":
+		# written next to the store and renamed over it, so readers see the old or the new archive, never part of one
+		tmp_filename = filename + ".tmp"
+		with open(tmp_filename, 'wb') as outfile:
+			np.savez(outfile, meta=json.dumps(meta), **columns)
+		os.replace(tmp_filename, filename)
+	elif output_format == "columnar":
+		# build in a scratch directory and swap it in, so readers never see a half-written store.
+		# A directory can't be renamed over a non-empty one, so the old store is moved aside first and only removed
+		# once the new one is in place
+		tmp_dirname = filename + ".tmp"
+		old_dirname = filename + ".old"
+		for dirname in [tmp_dirname, old_dirname]:
+			if os.path.exists(dirname):
+				shutil.rmtree(dirname)
+		os.makedirs(tmp_dirname)
+		for (column_name, data) in columns.items():
+			np.save( os.path.join(tmp_dirname, column_name + ".npy"), data)
+		with open( os.path.join(tmp_dirname, "meta.json"), 'w') as outfile:
+			json.dump(meta, outfile, indent=1)
+		if os.path.exists(filename):
+			os.rename(filename, old_dirname)
+		os.rename(tmp_dirname, filename)
+		if os.path.exists(old_dirname):
+			shutil.rmtree(old_dirname)
+	else:
+		raise ValueError("Unknown result store format: {0:s}".format(output_format))
+
+	return filename
+
+
+def read_result_store(filename, mmap=False):
+	# Returns a dict with freq/R/L/G/C (N, F), length_um/width_um (N) and everything from the metadata
+	# (name, sample, z0, method, ...). mmap=True memory-maps columnar stores instead of reading them.
+	if os.path.isdir(filename):
+		with open( os.path.join(filename, "meta.json"), 'r') as infile:
+			result = json.load(infile)
+		mmap_mode = "r" if mmap else None
+		for column_name in data_columns + ["length_um", "width_um"]:
+			result[column_name] = np.load( os.path.join(filename, column_name + ".npy"), mmap_mode=mmap_mode)
+	else:
+		with np.load(filename) as data:
+			result = json.loads( str(data["meta"]) )
+			for column_name in data_columns + ["length_um", "width_um"]:
+				result[column_name] = data[column_name]
+
+	return result
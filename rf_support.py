@@ -1,259 +1,586 @@
 import numpy as np
-import scipy.linalg as la
 import re
+import os
+import hashlib
 
 
-def get_rf_params_from_vna_csv(filename, z0=50.0 + 0.0j):
-	(freq_hz, Sdb, Sdeg)	 = get_sdb_from_vna_csv(filename)
+def get_rf_params_from_vna_csv(filename, z0=50.0 + 0.0j, cache_dir=None):
+	# Also takes Touchstone .s2p files, see get_sdb_from_file
+	(freq_hz, Sdb, Sdeg)	 = get_sdb_from_file(filename, cache_dir, z0)
 	S = sdb2sri(Sdb, Sdeg)
 	Z = s2z(S, z0)
 	T = s2abcd(S, z0)
 	
 	return (freq_hz, S, Z, T, Sdb, Sdeg)
 
-def get_sdb_from_vna_csv(filename):
+def get_sdb_from_vna_csv(filename, cache_dir=None):
 	# Reads CSV generated by VNA
 	# Extracts S params in DB/DEG form and returns freq, Sdb, Sdeg
+	# If cache_dir is given, the parsed arrays are stored there as .npz and reused
+	# as long as the CSV's path, modification time and size are unchanged
 	
-	infile = open(filename, 'r')
+	if cache_dir:
+		cache_filename = vna_csv_cache_path(filename, cache_dir, "vna_csv")
+		if os.path.isfile(cache_filename):
+			with np.load(cache_filename) as cached:
+				return (cached["freq_hz"], cached["Sdb"], cached["Sdeg"])
 	
-	header_found = False
-	Sdb_list = []
-	Sdeg_list = []
-	freq_hz_list = []
-	for line in infile:
-		nline = line.strip()
-		nline_arr = nline.split(",")
-		
-		if not header_found:
-			m = re.search("Freq", nline_arr[0])
-			if (m): # found header
-				header_found = True
-		elif len(nline_arr) == 9:
-			freq_hz_list.append( float(nline_arr[0]) )
-			Sdb_f = np.array( [ [float(nline_arr[1]), float(nline_arr[3])], [float(nline_arr[5]), float(nline_arr[7]) ] ] )
-			Sdeg_f = np.array( [ [float(nline_arr[2]), float(nline_arr[4])], [float(nline_arr[6]), float(nline_arr[8]) ] ] )
-			Sdb_list.append(Sdb_f)
-			Sdeg_list.append(Sdeg_f)
-	
-	Sdb = np.array(Sdb_list)
-	Sdeg = np.array(Sdeg_list)
-	freq_hz = np.array(freq_hz_list)
+	with open(filename, 'r') as infile:
+		lines = infile.read().splitlines()
+	
+	# Header row is the first one whose first column mentions Freq; data rows follow it
+	header_idx = len(lines)
+	for idx, line in enumerate(lines):
+		if re.search("Freq", line.split(",", 1)[0]):
+			header_idx = idx
+			break
+	if (header_idx < len(lines)) and (lines[header_idx].count(",") != 8):
+		raise ValueError("{0:s}: {1:d} columns, a 2-port export has 9 (see get_sdb_nport_from_vna_csv)".format(filename, lines[header_idx].count(",") + 1) )
+	data_lines = [ line for line in lines[header_idx+1:] if line.count(",") == 8 ]
+	data = parse_csv_block(data_lines, 9)
+	
+	freq_hz = data[:, 0].copy()
+	Sdb = data[:, 1::2].reshape(-1, 2, 2) # S11, S12, S21, S22 in DB
+	Sdeg = data[:, 2::2].reshape(-1, 2, 2) # S11, S12, S21, S22 in DEG
+	
+	if cache_dir:
+		write_vna_csv_cache(cache_filename, freq_hz, Sdb, Sdeg)
 	
 	return(freq_hz, Sdb, Sdeg)	
 
+
+def get_sdb_nport_from_vna_csv(filename, cache_dir=None):
+	# Same as get_sdb_from_vna_csv for a VNA export with any number of ports (e.g. 33 columns for 4 ports)
+	# Returns freq, Sdb and Sdeg as (F, N, N) stacks in matrix order; columns are placed by their Sij header names,
+	# or taken row by row (S11, S12, ... S1N, S21, ...) if the header doesn't name them
+	
+	if cache_dir:
+		cache_filename = vna_csv_cache_path(filename, cache_dir, "vna_csv_nport")
+		if os.path.isfile(cache_filename):
+			with np.load(cache_filename) as cached:
+				return (cached["freq_hz"], cached["Sdb"], cached["Sdeg"])
+	
+	with open(filename, 'r') as infile:
+		lines = infile.read().splitlines()
+	
+	header_idx = len(lines)
+	for idx, line in enumerate(lines):
+		if re.search("Freq", line.split(",", 1)[0]):
+			header_idx = idx
+			break
+	if header_idx == len(lines):
+		raise ValueError("{0:s}: no Freq header row".format(filename) )
+	header_list = lines[header_idx].split(",")
+	num_cols = len(header_list)
+	num_ports = int( round( np.sqrt( (num_cols - 1) / 2 ) ) )
+	if 2*num_ports*num_ports + 1 != num_cols:
+		raise ValueError("{0:s}: {1:d} columns is not freq plus DB/DEG pairs of a square S matrix".format(filename, num_cols) )
+	data_lines = [ line for line in lines[header_idx+1:] if line.count(",") == num_cols - 1 ]
+	data = parse_csv_block(data_lines, num_cols)
+	
+	# column of each S parameter, in row-major matrix order
+	pair_cols = np.arange(num_ports*num_ports)
+	named_list = [ re.match(r"\s*S(\d)(\d)\s*\(DB\)", header_list[1 + 2*idx], flags=re.IGNORECASE) for idx in range(num_ports*num_ports) ]
+	if all(named_list):
+		pair_cols = np.zeros( (num_ports*num_ports), dtype=int )
+		for (idx, named) in enumerate(named_list):
+			pair_cols[ (int(named.group(1)) - 1)*num_ports + int(named.group(2)) - 1 ] = idx
+	
+	freq_hz = data[:, 0].copy()
+	Sdb = data[:, 1 + 2*pair_cols].reshape(-1, num_ports, num_ports)
+	Sdeg = data[:, 2 + 2*pair_cols].reshape(-1, num_ports, num_ports)
+	
+	if cache_dir:
+		write_vna_csv_cache(cache_filename, freq_hz, Sdb, Sdeg)
+	
+	return (freq_hz, Sdb, Sdeg)
+
+
+def get_sdb_nport_from_file(filename, cache_dir=None, z0=50.0):
+	# (freq_hz, Sdb, Sdeg) as (F, N, N) stacks from a VNA CSV or a Touchstone .sNp file with any number of ports
+	# z0 as for get_sdb_from_file
+	if touchstone_ports(filename) is not None:
+		return get_sdb_from_touchstone(filename, cache_dir, z0)
+	return get_sdb_nport_from_vna_csv(filename, cache_dir)
+
+
+def get_sdb_from_file(filename, cache_dir=None, z0=50.0):
+	# (freq_hz, Sdb, Sdeg) from either a VNA CSV or a Touchstone .s2p file, picked by extension
+	# z0: the reference impedance the caller treats the data as measured against (i.e. converts it at).
+	# Touchstone data is renormalized from the R of its option line to z0; a VNA CSV carries no reference impedance
+	# and is returned as stored
+	if is_touchstone_file(filename):
+		return get_sdb_from_touchstone(filename, cache_dir, z0)
+	return get_sdb_from_vna_csv(filename, cache_dir)
+
+
+def is_touchstone_file(filename):
+	return os.path.splitext(filename)[1].lower() == ".s2p"
+
+
+def touchstone_ports(filename):
+	# Number of ports from a Touchstone .sNp extension, None for anything else
+	match = re.match(r"^\.s(\d+)p$", os.path.splitext(filename)[1].lower())
+	return int(match.group(1)) if match else None
+
+
+# Touchstone frequency units, in Hz
+touchstone_freq_units = { "HZ": 1.0, "KHZ": 1e3, "MHZ": 1e6, "GHZ": 1e9 }
+
+
+def get_sdb_from_touchstone(filename, cache_dir=None, z0=50.0):
+	# Reads a Touchstone v1 file (RI, MA or DB data, any frequency unit), 2-port or .sNp with any number of ports
+	# Returns freq in Hz and S in DB/DEG with S12/S21 in the same places as get_sdb_from_vna_csv.
+	# Data measured against another reference impedance (the R in the option line) is renormalized to z0.
+	# cache_dir works the same as for get_sdb_from_vna_csv (entries are kept per z0)
+	
+	if cache_dir:
+		cache_filename = vna_csv_cache_path(filename, cache_dir, "touchstone", z0)
+		if os.path.isfile(cache_filename):
+			with np.load(cache_filename) as cached:
+				return (cached["freq_hz"], cached["Sdb"], cached["Sdeg"])
+	
+	(freq_hz, S_a, S_b, data_format, z0_ref) = read_touchstone(filename)
+	if z0_ref != complex(z0):
+		Sri = touchstone_pairs_to_sri(S_a, S_b, data_format)
+		(Sdb, Sdeg) = sri2sdb( z2s( s2z(Sri, z0_ref), z0) )
+	elif data_format == "DB":
+		(Sdb, Sdeg) = (S_a, S_b)
+	elif data_format == "MA":
+		with np.errstate(divide='ignore'):
+			(Sdb, Sdeg) = (20*np.log10(S_a), S_b)
+	else:
+		(Sdb, Sdeg) = sri2sdb( touchstone_pairs_to_sri(S_a, S_b, data_format) )
+	
+	if cache_dir:
+		write_vna_csv_cache(cache_filename, freq_hz, Sdb, Sdeg)
+	
+	return (freq_hz, Sdb, Sdeg)
+
+
+def read_touchstone(filename):
+	# (freq_hz, S_a, S_b, data_format, z0_ref) = read_touchstone(filename)
+	# S_a/S_b are the two numbers of each S parameter as stored (RI: real/imag, MA: mag/deg, DB: db/deg),
+	# as (F, N, N) stacks in matrix order [[S11, S12], [S21, S22]] (N from the .sNp extension, 2 if there is none)
+	with open(filename, 'r') as infile:
+		text = infile.read()
+	
+	# Strip comments and pull out the option line with whole-text regexes, then parse the body in one go
+	text = re.sub("!.*", "", text)
+	option_list = re.findall("^[ \t]*#(.*)$", text, flags=re.MULTILINE)
+	body = re.sub("^[ \t]*#.*$", "", text, flags=re.MULTILINE)
+	
+	freq_unit_str = "GHZ" # Touchstone defaults
+	data_format = "MA"
+	z0_ref = 50.0
+	option_tokens = option_list[0].upper().split() if len(option_list) > 0 else []
+	idx = 0
+	while idx < len(option_tokens):
+		token = option_tokens[idx]
+		if token in touchstone_freq_units:
+			freq_unit_str = token
+		elif token in ["RI", "MA", "DB"]:
+			data_format = token
+		elif token == "R":
+			z0_ref = float(option_tokens[idx+1])
+			idx += 1
+		elif token != "S":
+			raise ValueError("{0:s}: only S parameter Touchstone files are supported (option line has {1:s})".format(filename, token) )
+		idx += 1
+	
+	try:
+		data = np.fromstring( body.replace("\n", " "), dtype=float, sep=" " )
+	except ValueError:
+		data = np.array( body.split(), dtype=float ) # slow path, but reports the offending value
+	num_ports = touchstone_ports(filename) or 2
+	point_size = 2*num_ports*num_ports + 1
+	if (data.size == 0) or (data.size % point_size != 0):
+		raise ValueError("{0:s}: expected {1:d} numbers per frequency point for a {2:d}-port file, found {3:d} numbers".format(filename, point_size, num_ports, data.size) )
+	data = data.reshape(-1, point_size)
+	
+	freq_hz = data[:, 0] * touchstone_freq_units[freq_unit_str]
+	S_a = data[:, 1::2].reshape(-1, num_ports, num_ports)
+	S_b = data[:, 2::2].reshape(-1, num_ports, num_ports)
+	if num_ports == 2:
+		# 2-port order is S11, S21, S12, S22 -- reshaping gives the transposed matrix (more ports are row by row)
+		S_a = np.swapaxes(S_a, -1, -2).copy()
+		S_b = np.swapaxes(S_b, -1, -2).copy()
+	
+	return (freq_hz, S_a, S_b, data_format, z0_ref)
+
+
+def touchstone_pairs_to_sri(S_a, S_b, data_format):
+	# Complex S from the two stored numbers of each parameter
+	if data_format == "RI":
+		return S_a + 1j*S_b
+	elif data_format == "MA":
+		return S_a * np.exp( 1j * np.deg2rad(S_b) )
+	elif data_format == "DB":
+		return sdb2sri(S_a, S_b)
+	else:
+		raise ValueError("Unknown Touchstone data format: {0:s}".format(data_format))
+
+
+def parse_csv_block(data_lines, num_cols):
+	# Parses a list of comma separated numeric rows into a (rows, num_cols) float array in one pass
+	if len(data_lines) == 0:
+		return np.zeros( (0, num_cols) )
+	
+	try:
+		data = np.fromstring( ",".join(data_lines), dtype=float, sep="," )
+	except ValueError:
+		data = np.zeros( (0) )
+	if data.size != len(data_lines) * num_cols:
+		# something in the block isn't a plain number -- let loadtxt do the slow parse and report it
+		data = np.loadtxt(data_lines, delimiter=",", ndmin=2)
+	
+	return data.reshape(-1, num_cols)
+
+
+def vna_csv_cache_path(filename, cache_dir, reader="vna_csv", z0=None):
+	# Cache entry name depends on the absolute path, mtime and size of the source file, on the reader (the 2-port and
+	# N-port readers give differently shaped arrays for the same file) and on z0 for readers that renormalize
+	stat = os.stat(filename)
+	key_str = "{0:s}|{1:d}|{2:d}|{3:s}".format( os.path.abspath(filename), stat.st_mtime_ns, stat.st_size, reader )
+	if z0 is not None:
+		key_str += "|" + repr(complex(z0))
+	key = hashlib.sha1( key_str.encode("utf-8") ).hexdigest()[0:16]
+	base_name = os.path.splitext( os.path.basename(filename) )[0]
+	
+	return os.path.join(cache_dir, "{0:s}.{1:s}.npz".format(base_name, key))
+
+
+def write_vna_csv_cache(cache_filename, freq_hz, Sdb, Sdeg):
+	# Write to a temporary file first so a concurrent reader never sees a partial cache entry
+	cache_dir = os.path.dirname(cache_filename)
+	if cache_dir and not os.path.exists(cache_dir):
+		os.makedirs(cache_dir, exist_ok=True)
+	
+	tmp_filename = "{0:s}.{1:d}.tmp".format(cache_filename, os.getpid())
+	with open(tmp_filename, 'wb') as outfile:
+		np.savez(outfile, freq_hz=freq_hz, Sdb=Sdb, Sdeg=Sdeg)
+	os.replace(tmp_filename, cache_filename)
+
 	
 def s2z(S, z0):
 	# Converts real/imag S params to z params
-	Z = np.zeros( np.shape(S), dtype=complex)
-	I = np.eye(2)
-	for idx, SS in enumerate(S):
-		ZZ = np.dot( la.inv( I - SS ), (I + SS) ) * z0
-		Z[idx] = ZZ
+	# Works on the whole (..., N, N) stack at once: Z = (I - S)^-1 (I + S) z0
+	S = np.asarray(S, dtype=complex)
+	I = np.eye( S.shape[-1] )
+	Z = np.linalg.solve( I - S, I + S ) * z0
 		
 	return(Z)
 	
 
 def z2s(Z, z0):
 	# converts impedance matrix to scattering matrix
-	S = np.zeros( np.shape(Z), dtype=complex)
-	I = np.eye(2)
-	for idx, ZZ in enumerate(Z):
-		SS = np.dot( Z - z0*I, la.inv( Z + z0*I) )
-		S[idx] = SS
+	# S = (Z - z0 I) (Z + z0 I)^-1, batched over the leading axes
+	Z = np.asarray(Z, dtype=complex)
+	I = np.eye( Z.shape[-1] )
+	S = np.matmul( Z - z0*I, np.linalg.inv( Z + z0*I ) )
 	
 	return(S)
 
 
 def z2y(Z):
 	# converts impedance matrix to admittance matrix
-	Y = np.zeros( np.shape(Z), dtype=complex)
-	for idx, ZZ in enumerate(Z):
-		YY = la.inv(ZZ)
-		Y[idx] = YY
+	Y = np.linalg.inv( np.asarray(Z, dtype=complex) )
 	
 	return(Y)
 		
 
 def z2abcd(Z):
 	# Converts impedance matrix to transfer matrix (ABCD matrix)
-	T = np.zeros( np.shape(Z), dtype=complex)
-	for idx, ZZ in enumerate(Z):
-		Z11 = ZZ[0][0]
-		Z12 = ZZ[0][1]
-		Z21 = ZZ[1][0]
-		Z22 = ZZ[1][1]
-		A = Z11 / Z21
-		B = (Z11*Z22 - Z12*Z21) / Z21
-		C = 1 / Z21
-		D = Z22/ Z21
-		
-		
-		Tf = np.array( [ [A, B], [C, D] ])
-		T[idx] = Tf
+	Z = np.asarray(Z, dtype=complex)
+	Z11 = Z[..., 0, 0]
+	Z12 = Z[..., 0, 1]
+	Z21 = Z[..., 1, 0]
+	Z22 = Z[..., 1, 1]
+
+	A = Z11 / Z21
+	B = (Z11*Z22 - Z12*Z21) / Z21
+	C = 1 / Z21
+	D = Z22/ Z21
+	
+	T = stack_2x2(A, B, C, D)
 	
 	return(T)
 
 
-#def abcd2s(T, z0):
-#	
-#	S = np.zeros( np.shape(T), dtype=complex)
-#	for idx, TT in enumerate(T):
-#		A = TT[0][0]
-#		B = TT[0][1]
-#		C = TT[1][0]
-#		D = TT[1][1]
-#		
-#		denom = A + B/z0 + C*z0 + D
-#		S11 = (A + B/z0 - C*z0 + D) / denom
-#		S12 = 2*(A*D - B*C) / denom
-#		S21 = 2/denom
-#		S22 = (-A + B/z0-C*z0 + D ) / denom
-#		
-#		SS = np.array( [[S11, S12] , [S21, S22] ])
-#		S[idx] = SS
-#	
-#	return(S)
-#	
+def abcd2z(abcd_struct):
+	# Converts transfer matrix (ABCD matrix) to impedance matrix, batched over the leading axes
+	abcd_struct = np.asarray(abcd_struct, dtype=complex)
+	A = abcd_struct[..., 0, 0]
+	B = abcd_struct[..., 0, 1]
+	C = abcd_struct[..., 1, 0]
+	D = abcd_struct[..., 1, 1]
+
+	Z = stack_2x2(A/C, (A*D - B*C)/C, 1/C, D/C)
+
+	return(Z)
+
+
+def abcd2y(abcd_struct):
+	# Converts transfer matrix (ABCD matrix) to admittance matrix, batched over the leading axes
+	# (direct form, so it stays accurate where Z blows up, e.g. a series element with little shunt path)
+	abcd_struct = np.asarray(abcd_struct, dtype=complex)
+	A = abcd_struct[..., 0, 0]
+	B = abcd_struct[..., 0, 1]
+	C = abcd_struct[..., 1, 0]
+	D = abcd_struct[..., 1, 1]
+
+	Y = stack_2x2(D/B, -(A*D - B*C)/B, -1/B, A/B)
+
+	return(Y)
+
+
 def abcd2s(abcd_struct, Z01, Z02):
 	# convert ABCD matrix to S matrix in real/imag format
+	# abcd_struct may be any (..., 2, 2) stack; all frequencies are converted in one pass
 
-	R01 = Z01.real
-	R02 = Z02.real
-	num_freqs = len(abcd_struct)
-	S = np.zeros( (num_freqs, 2, 2), dtype=complex )
-	for idx, mat in enumerate(abcd_struct):
-		mat = abcd_struct[idx]
-		A = mat[0][0]
-		B = mat[0][1]
-		C = mat[1][0]
-		D = mat[1][1]
+	abcd_struct = np.asarray(abcd_struct, dtype=complex)
+	R01 = np.real(Z01)
+	R02 = np.real(Z02)
+	A = abcd_struct[..., 0, 0]
+	B = abcd_struct[..., 0, 1]
+	C = abcd_struct[..., 1, 0]
+	D = abcd_struct[..., 1, 1]
 
-		denom = (A*Z02 + B + C*Z01*Z02 + D*Z01)
+	denom = (A*Z02 + B + C*Z01*Z02 + D*Z01)
 
-		S11 = ( A*Z02 + B - C*np.conj(Z01)*Z02 - D*np.conj(Z01) ) / denom
-		S12 = ( 2*(A*D - B*C)*np.sqrt(R01*R02) ) / denom
-		S21 = ( 2*np.sqrt(R01*R02) ) / denom
-		S22 = (-A*np.conj(Z02) + B - C*Z01*np.conj(Z02) + D*Z01 ) / denom
-
-		S[idx][0][0] = S11
-		S[idx][0][1] = S12
-		S[idx][1][0] = S21
-		S[idx][1][1] = S22
+	S11 = ( A*Z02 + B - C*np.conj(Z01)*Z02 - D*np.conj(Z01) ) / denom
+	S12 = ( 2*(A*D - B*C)*np.sqrt(R01*R02) ) / denom
+	S21 = ( 2*np.sqrt(R01*R02) ) / denom
+	S22 = (-A*np.conj(Z02) + B - C*Z01*np.conj(Z02) + D*Z01 ) / denom
 
+	S = stack_2x2(S11, S12, S21, S22)
 
 	return S	
 	
 	
-	
-#def s2abcd( S, z0):
-#	Z = s2z(S, z0)
-#	T = z2abcd(Z)
-#	
-#	return(T)
-	
 def s2abcd(S, Z01=50, Z02=50):
 	# Convert Sparams in Real/Imag format to ABCD matrix
-	R01 = Z01.real
-	R02 = Z02.real
-	abcd = np.zeros( np.shape(S), dtype=complex )
-	for idx, SS in enumerate(S):
-		S11 = SS[0][0]
-		S12 = SS[0][1]
-		S21 = SS[1][0]
-		S22 = SS[1][1]
-
-		denom = 2*S21*np.sqrt(R01*R02)
-		
-		
-		A = ( (np.conj(Z01) + S11*Z01)*(1-S22)+S12*S21*Z01 ) / denom
-		B = ( (np.conj(Z01) + S11*Z01)*(np.conj(Z02)+S22*Z02)-S12*S21*Z01*Z02 ) / denom
-		C = ( (1-S11)*(1-S22)-S12*S21 ) / denom
-		D = ( (1-S11)*(np.conj(Z02)+S22*Z02) + S12*S21*Z02 ) / denom
+	# S may be any (..., 2, 2) stack; all frequencies are converted in one pass
+	S = np.asarray(S, dtype=complex)
+	R01 = np.real(Z01)
+	R02 = np.real(Z02)
+	S11 = S[..., 0, 0]
+	S12 = S[..., 0, 1]
+	S21 = S[..., 1, 0]
+	S22 = S[..., 1, 1]
 
-		abcd[idx][0][0] = A
-		abcd[idx][0][1] = B
-		abcd[idx][1][0] = C
-		abcd[idx][1][1] = D
+	denom = 2*S21*np.sqrt(R01*R02)
+	
+	A = ( (np.conj(Z01) + S11*Z01)*(1-S22)+S12*S21*Z01 ) / denom
+	B = ( (np.conj(Z01) + S11*Z01)*(np.conj(Z02)+S22*Z02)-S12*S21*Z01*Z02 ) / denom
+	C = ( (1-S11)*(1-S22)-S12*S21 ) / denom
+	D = ( (1-S11)*(np.conj(Z02)+S22*Z02) + S12*S21*Z02 ) / denom
 
+	abcd = stack_2x2(A, B, C, D)
 
 	return abcd
 	
 	
+# N-port networks
+# A 2N-port made of N conductors has ports 1..N at the near end and N+1..2N at the far end (reorder measured
+# ports with reorder_ports first if the VNA numbers them otherwise). Its ABCD (chain) matrix is the (2N, 2N) matrix
+# of N x N blocks [[A, B], [C, D]] with [V1; I1] = [[A, B], [C, D]] [V2; -I2], which reduces to the 2-port
+# functions above for N = 1. Every function takes (..., 2N, 2N) stacks and works on all of them at once.
+
+def reorder_ports(M, port_order):
+	# M with its ports permuted: port_order lists, for each new port, the (0-based) old port it is
+	port_order = np.asarray(port_order, dtype=int)
+	return np.asarray(M)[..., port_order, :][..., :, port_order]
+
+
+def split_blocks(M):
+	# (A, B, C, D) N x N blocks of a (..., 2N, 2N) stack
+	n = M.shape[-1] // 2
+	return ( M[..., :n, :n], M[..., :n, n:], M[..., n:, :n], M[..., n:, n:] )
+
+
+def join_blocks(A, B, C, D):
+	# (..., 2N, 2N) stack from four (..., N, N) blocks
+	return np.concatenate( ( np.concatenate( (A, B), axis=-1 ), np.concatenate( (C, D), axis=-1 ) ), axis=-2 )
+
+
+def z2abcd_nport(Z):
+	# A = Z11 Z21^-1, B = Z11 Z21^-1 Z22 - Z12, C = Z21^-1, D = Z21^-1 Z22
+	(Z11, Z12, Z21, Z22) = split_blocks( np.asarray(Z, dtype=complex) )
+	Z21_inv = np.linalg.inv(Z21)
+	A = Z11 @ Z21_inv
+	
+	return join_blocks(A, A @ Z22 - Z12, Z21_inv, Z21_inv @ Z22)
+
+
+def abcd2z_nport(abcd_struct):
+	# Z11 = A C^-1, Z12 = A C^-1 D - B, Z21 = C^-1, Z22 = C^-1 D
+	(A, B, C, D) = split_blocks( np.asarray(abcd_struct, dtype=complex) )
+	C_inv = np.linalg.inv(C)
+	Z11 = A @ C_inv
+	
+	return join_blocks(Z11, Z11 @ D - B, C_inv, C_inv @ D)
+
+
+def abcd2y_nport(abcd_struct):
+	# Direct form (as abcd2y): Y11 = D B^-1, Y12 = C - D B^-1 A, Y21 = -B^-1, Y22 = B^-1 A
+	(A, B, C, D) = split_blocks( np.asarray(abcd_struct, dtype=complex) )
+	B_inv = np.linalg.inv(B)
+	DB_inv = D @ B_inv
+	
+	return join_blocks(DB_inv, C - DB_inv @ A, -B_inv, B_inv @ A)
+
+
+def s2abcd_nport(S, z0=50.0):
+	# S (real/imag, every port referenced to z0) to the ABCD matrix
+	return z2abcd_nport( s2z(S, z0) )
+
+
+def abcd2s_nport(abcd_struct, z0=50.0):
+	return z2s( abcd2z_nport(abcd_struct), z0 )
+
+
+def sqrtm_nport(M):
+	# Principal square root of every matrix in a (..., N, N) stack, by batched eigendecomposition
+	# (same branch as sqrtm_2x2; the matrices have to be diagonalizable)
+	(eig_vals, eig_vecs) = np.linalg.eig( np.asarray(M, dtype=complex) )
+	
+	return (eig_vecs * np.sqrt(eig_vals)[..., None, :]) @ np.linalg.inv(eig_vecs)
+
+
 def sdb2sri(Sdb, Sdeg):
 	# convert DB/DEG to real/imag
-	num_freqs = len(Sdb)
-	Sri = np.zeros( (num_freqs, 2, 2), dtype=complex)
-
-	for idx in range(len(Sdb)):
-		db_mat = Sdb[idx]
-		S11_db = db_mat[0][0]
-		S12_db = db_mat[0][1]
-		S21_db = db_mat[1][0]
-		S22_db = db_mat[1][1]
-
-		deg_mat = Sdeg[idx]
-		S11_deg = deg_mat[0][0]
-		S12_deg = deg_mat[0][1]
-		S21_deg = deg_mat[1][0]
-		S22_deg = deg_mat[1][1]
-
-		S11 = 10**(S11_db/20) * np.complex( np.cos(S11_deg*np.pi/180), np.sin(S11_deg*np.pi/180) )
-		S12 = 10**(S12_db/20) * np.complex( np.cos(S12_deg*np.pi/180), np.sin(S12_deg*np.pi/180) )
-		S21 = 10**(S21_db/20) * np.complex( np.cos(S21_deg*np.pi/180), np.sin(S21_deg*np.pi/180) )
-		S22 = 10**(S22_db/20) * np.complex( np.cos(S22_deg*np.pi/180), np.sin(S22_deg*np.pi/180) )
-
-		Sri[idx][0][0] = S11
-		Sri[idx][0][1] = S12
-		Sri[idx][1][0] = S21
-		Sri[idx][1][1] = S22
+	Sdb = np.asarray(Sdb, dtype=float)
+	Sdeg = np.asarray(Sdeg, dtype=float)
+	Sri = 10**(Sdb/20) * np.exp( 1j * np.deg2rad(Sdeg) )
 
 	return Sri
 	
 	
 def sri2sdb(sri_struct):
 	# convert S params from Real/Imag to DB/Deg
-	num_freqs = len(sri_struct)
-	Sdb = np.zeros( (num_freqs, 2, 2))
-	Sdeg = np.zeros( (num_freqs, 2, 2))
-
-	for idx in range(len(sri_struct)):
-		ri_mat = sri_struct[idx]
-		S11_ri = ri_mat[0][0]
-		S12_ri = ri_mat[0][1]
-		S21_ri = ri_mat[1][0]
-		S22_ri = ri_mat[1][1]
-
-		S11_db = 20*np.log10( np.abs(S11_ri) )
-		S12_db = 20*np.log10( np.abs(S12_ri) )
-		S21_db = 20*np.log10( np.abs(S21_ri) )
-		S22_db = 20*np.log10( np.abs(S22_ri) )
-
-		S11_deg = np.arcsin( S11_ri.imag / np.abs(S11_ri) ) * 180/np.pi
-		S12_deg = np.arcsin( S12_ri.imag / np.abs(S12_ri) ) * 180/np.pi
-		S21_deg = np.arcsin( S21_ri.imag / np.abs(S21_ri) ) * 180/np.pi
-		S22_deg = np.arcsin( S22_ri.imag / np.abs(S22_ri) ) * 180/np.pi
-		
-		if ( S11_ri.real < 0 ) and (S11_ri.imag > 0):
-			S11_deg = 180 - S11_deg
-		if ( S12_ri.real < 0 ) and (S12_ri.imag > 0):
-			S12_deg = 180 - S12_deg
-		if ( S21_ri.real < 0 ) and (S21_ri.imag > 0):
-			S21_deg = 180 - S21_deg
-		if ( S22_ri.real < 0 ) and (S22_ri.imag > 0):
-			S22_deg = 180 - S22_deg
-		
+	# Phase is the four-quadrant angle in (-180, 180]
+	sri_struct = np.asarray(sri_struct, dtype=complex)
+	Sdb = 20*np.log10( np.abs(sri_struct) )
+	Sdeg = np.angle(sri_struct, deg=True)
 
-		Sdb[idx][0][0] = S11_db
-		Sdb[idx][0][1] = S12_db
-		Sdb[idx][1][0] = S21_db
-		Sdb[idx][1][1] = S22_db
+	return (Sdb, Sdeg)
 
-		Sdeg[idx][0][0] = S11_deg
-		Sdeg[idx][0][1] = S12_deg
-		Sdeg[idx][1][0] = S21_deg
-		Sdeg[idx][1][1] = S22_deg
 
-	return (Sdb, Sdeg)
+def stack_2x2(M11, M12, M21, M22):
+	# Assemble four (...) shaped element arrays into a (..., 2, 2) matrix stack
+	row1 = np.stack( (M11, M12), axis=-1 )
+	row2 = np.stack( (M21, M22), axis=-1 )
+
+	return np.stack( (row1, row2), axis=-2 )
+
+
+def matmul_2x2(A, B):
+	# Closed-form A @ B for broadcasting (..., 2, 2) stacks; several times faster than np.matmul on 2x2 matrices
+	A = np.asarray(A)
+	B = np.asarray(B)
+	return stack_2x2( A[..., 0, 0]*B[..., 0, 0] + A[..., 0, 1]*B[..., 1, 0], A[..., 0, 0]*B[..., 0, 1] + A[..., 0, 1]*B[..., 1, 1], A[..., 1, 0]*B[..., 0, 0] + A[..., 1, 1]*B[..., 1, 0], A[..., 1, 0]*B[..., 0, 1] + A[..., 1, 1]*B[..., 1, 1] )
+
+
+def inv_2x2(M):
+	# Closed-form inverse of every matrix in a (..., 2, 2) stack
+	M = np.asarray(M, dtype=complex)
+	det = M[..., 0, 0]*M[..., 1, 1] - M[..., 0, 1]*M[..., 1, 0]
 	
-	
\ No newline at end of file
+	return stack_2x2( M[..., 1, 1], -M[..., 0, 1], -M[..., 1, 0], M[..., 0, 0] ) / det[..., None, None]
+
+
+def sqrtm_2x2(M, rel_tol=1e-8):
+	# Closed-form principal square root of every matrix in a (..., 2, 2) stack
+	# For eigenvalues l1, l2 and principal roots r1 = sqrt(l1), r2 = sqrt(l2):
+	#	sqrt(M) = (M + r1*r2*I) / (r1 + r2)
+	# which is the same branch scipy.linalg.sqrtm returns (eigenvalues of the root in the right half plane).
+	# Points where r1 + r2 is ~0 relative to the matrix scale (near-singular M) fall back to scipy.linalg.sqrtm.
+	M = np.asarray(M, dtype=complex)
+	tr = M[..., 0, 0] + M[..., 1, 1]
+	det = M[..., 0, 0]*M[..., 1, 1] - M[..., 0, 1]*M[..., 1, 0]
+	disc = np.sqrt( tr*tr/4 - det )
+	r1 = np.sqrt( tr/2 + disc )
+	r2 = np.sqrt( tr/2 - disc )
+	s = r1*r2
+	t = r1 + r2
+	
+	scale = np.sqrt( np.max( np.abs(M), axis=(-2, -1) ) )
+	bad = ~( np.abs(t) > rel_tol * scale )
+	t_safe = np.where(bad, 1, t)
+	
+	root = ( M + s[..., None, None]*np.eye(2) ) / t_safe[..., None, None]
+	
+	if np.any(bad):
+		import scipy.linalg as la
+		for idx in zip(*np.nonzero(bad)):
+			root[idx] = la.sqrtm(M[idx])
+	
+	return root
+
+
+def grids_match(freq_a, freq_b, rtol=1e-9):
+	# True when two frequency sweeps are the same point for point
+	freq_a = np.asarray(freq_a)
+	freq_b = np.asarray(freq_b)
+	return (freq_a.shape == freq_b.shape) and np.allclose(freq_a, freq_b, rtol=rtol, atol=0)
+
+
+def common_freq_grid(freq_list):
+	# Grid every sweep in freq_list can be resampled onto without extrapolating: the densest sweep,
+	# trimmed to the range all sweeps cover
+	freq_list = [ np.asarray(freq) for freq in freq_list ]
+	freq_ref = max(freq_list, key=len)
+	freq_lo = max( [ freq[0] for freq in freq_list ] )
+	freq_hi = min( [ freq[-1] for freq in freq_list ] )
+	tol = 1e-9 * max( abs(freq_lo), abs(freq_hi) )
+
+	return freq_ref[ (freq_ref >= freq_lo - tol) & (freq_ref <= freq_hi + tol) ]
+
+
+def interp_weights(freq_src, freq_dst):
+	# (lower index, weight of the upper point) for linear interpolation from freq_src (increasing) onto freq_dst
+	# Points outside freq_src take the nearest end value, like np.interp
+	freq_src = np.asarray(freq_src, dtype=float)
+	freq_dst = np.asarray(freq_dst, dtype=float)
+	if len(freq_src) < 2:
+		return ( np.zeros(freq_dst.shape, dtype=int), np.zeros(freq_dst.shape) )
+	idx = np.clip( np.searchsorted(freq_src, freq_dst, side="right") - 1, 0, len(freq_src) - 2 )
+	weight = (freq_dst - freq_src[idx]) / (freq_src[idx+1] - freq_src[idx])
+
+	return (idx, np.clip(weight, 0, 1))
+
+
+def resample_mag_phase(freq_src, M, freq_dst, axis=-3):
+	# Resamples complex data (frequency along axis, -3 for (..., F, 2, 2) stacks) from freq_src onto freq_dst,
+	# interpolating magnitude and unwrapped phase linearly. Every element of the stack is done in one pass.
+	M = np.asarray(M, dtype=complex)
+	axis = axis % M.ndim
+	(idx, weight) = interp_weights(freq_src, freq_dst)
+	idx_hi = idx + 1 if M.shape[axis] > 1 else idx
+	weight = np.reshape( weight, [-1] + [1] * (M.ndim - axis - 1) )
+
+	mag = np.abs(M)
+	phase = np.unwrap( np.angle(M), axis=axis )
+	mag_dst = np.take(mag, idx, axis=axis) * (1 - weight) + np.take(mag, idx_hi, axis=axis) * weight
+	phase_dst = np.take(phase, idx, axis=axis) * (1 - weight) + np.take(phase, idx_hi, axis=axis) * weight
+
+	return mag_dst * np.exp(1j * phase_dst)
+
+
+def resample_real(freq_src, data, freq_dst, axis=-1):
+	# Linear interpolation of real data (frequency along axis) from freq_src onto freq_dst
+	data = np.asarray(data, dtype=float)
+	axis = axis % data.ndim
+	(idx, weight) = interp_weights(freq_src, freq_dst)
+	idx_hi = idx + 1 if data.shape[axis] > 1 else idx
+	weight = np.reshape( weight, [-1] + [1] * (data.ndim - axis - 1) )
+
+	return np.take(data, idx, axis=axis) * (1 - weight) + np.take(data, idx_hi, axis=axis) * weight
+
+
+def resample_real_imag(freq_src, M, freq_dst, axis=-3):
+	# Same as resample_mag_phase, interpolating real and imaginary parts instead. Better suited to lumped
+	# element data such as pad ABCD matrices, whose entries are low-order polynomials in j*omega.
+	M = np.asarray(M, dtype=complex)
+	return resample_real(freq_src, M.real, freq_dst, axis) + 1j*resample_real(freq_src, M.imag, freq_dst, axis)
@@ -0,0 +1,294 @@
+# Regression tests for the batched network conversions in rf_support
+# The reference functions below are the original per-frequency loop implementations.
+# Run with pytest, or directly with python.
+import numpy as np
+import numpy.linalg as la
+import os.path
+import tempfile
+import rf_support as rfs
+
+rtol = 1e-9
+atol = 1e-12
+
+
+def random_sri(num_freqs, seed=0):
+	rng = np.random.default_rng(seed)
+	mag = rng.uniform(0.05, 0.95, (num_freqs, 2, 2))
+	phase = rng.uniform(-np.pi, np.pi, (num_freqs, 2, 2))
+	return mag * np.exp(1j*phase)
+
+
+def loop_s2z(S, z0):
+	Z = np.zeros( np.shape(S), dtype=complex)
+	I = np.eye(2)
+	for idx, SS in enumerate(S):
+		Z[idx] = np.dot( la.inv( I - SS ), (I + SS) ) * z0
+	return(Z)
+
+
+def loop_z2s(Z, z0):
+	S = np.zeros( np.shape(Z), dtype=complex)
+	I = np.eye(2)
+	for idx, ZZ in enumerate(Z):
+		S[idx] = np.dot( ZZ - z0*I, la.inv( ZZ + z0*I) )
+	return(S)
+
+
+def loop_z2y(Z):
+	Y = np.zeros( np.shape(Z), dtype=complex)
+	for idx, ZZ in enumerate(Z):
+		Y[idx] = la.inv(ZZ)
+	return(Y)
+
+
+def loop_z2abcd(Z):
+	T = np.zeros( np.shape(Z), dtype=complex)
+	for idx, ZZ in enumerate(Z):
+		Z11 = ZZ[0][0]
+		Z12 = ZZ[0][1]
+		Z21 = ZZ[1][0]
+		Z22 = ZZ[1][1]
+		T[idx] = np.array( [ [Z11/Z21, (Z11*Z22 - Z12*Z21)/Z21], [1/Z21, Z22/Z21] ])
+	return(T)
+
+
+def loop_abcd2s(abcd_struct, Z01, Z02):
+	R01 = Z01.real
+	R02 = Z02.real
+	S = np.zeros( (len(abcd_struct), 2, 2), dtype=complex )
+	for idx, mat in enumerate(abcd_struct):
+		A = mat[0][0]
+		B = mat[0][1]
+		C = mat[1][0]
+		D = mat[1][1]
+		denom = (A*Z02 + B + C*Z01*Z02 + D*Z01)
+		S[idx][0][0] = ( A*Z02 + B - C*np.conj(Z01)*Z02 - D*np.conj(Z01) ) / denom
+		S[idx][0][1] = ( 2*(A*D - B*C)*np.sqrt(R01*R02) ) / denom
+		S[idx][1][0] = ( 2*np.sqrt(R01*R02) ) / denom
+		S[idx][1][1] = (-A*np.conj(Z02) + B - C*Z01*np.conj(Z02) + D*Z01 ) / denom
+	return S
+
+
+def loop_s2abcd(S, Z01=50, Z02=50):
+	R01 = Z01.real
+	R02 = Z02.real
+	abcd = np.zeros( np.shape(S), dtype=complex )
+	for idx, SS in enumerate(S):
+		S11 = SS[0][0]
+		S12 = SS[0][1]
+		S21 = SS[1][0]
+		S22 = SS[1][1]
+		denom = 2*S21*np.sqrt(R01*R02)
+		abcd[idx][0][0] = ( (np.conj(Z01) + S11*Z01)*(1-S22)+S12*S21*Z01 ) / denom
+		abcd[idx][0][1] = ( (np.conj(Z01) + S11*Z01)*(np.conj(Z02)+S22*Z02)-S12*S21*Z01*Z02 ) / denom
+		abcd[idx][1][0] = ( (1-S11)*(1-S22)-S12*S21 ) / denom
+		abcd[idx][1][1] = ( (1-S11)*(np.conj(Z02)+S22*Z02) + S12*S21*Z02 ) / denom
+	return abcd
+
+
+def loop_sdb2sri(Sdb, Sdeg):
+	Sri = np.zeros( (len(Sdb), 2, 2), dtype=complex)
+	for idx in range(len(Sdb)):
+		for row in range(2):
+			for col in range(2):
+				db = Sdb[idx][row][col]
+				deg = Sdeg[idx][row][col]
+				Sri[idx][row][col] = 10**(db/20) * complex( np.cos(deg*np.pi/180), np.sin(deg*np.pi/180) )
+	return Sri
+
+
+def loop_sri2sdb(sri_struct):
+	Sdb = np.zeros( (len(sri_struct), 2, 2))
+	Sdeg = np.zeros( (len(sri_struct), 2, 2))
+	for idx in range(len(sri_struct)):
+		for row in range(2):
+			for col in range(2):
+				s = sri_struct[idx][row][col]
+				Sdb[idx][row][col] = 20*np.log10( np.abs(s) )
+				deg = np.arcsin( s.imag / np.abs(s) ) * 180/np.pi
+				if ( s.real < 0 ) and ( s.imag > 0 ):
+					deg = 180 - deg
+				Sdeg[idx][row][col] = deg
+	return (Sdb, Sdeg)
+
+
+def test_sdb_sri_round_trip():
+	S = random_sri(500)
+	(Sdb, Sdeg) = rfs.sri2sdb(S)
+	np.testing.assert_allclose( rfs.sdb2sri(Sdb, Sdeg), S, rtol=rtol, atol=atol)
+	np.testing.assert_allclose( rfs.sdb2sri(Sdb, Sdeg), loop_sdb2sri(Sdb, Sdeg), rtol=rtol, atol=atol)
+
+
+def test_sri2sdb_matches_loop():
+	S = random_sri(500, seed=1)
+	(Sdb, Sdeg) = rfs.sri2sdb(S)
+	(Sdb_ref, Sdeg_ref) = loop_sri2sdb(S)
+	np.testing.assert_allclose(Sdb, Sdb_ref, rtol=rtol, atol=atol)
+
+	# The loop version never handled the third quadrant (it returned the mirrored angle),
+	# so only compare phases where it was correct
+	valid = ~( (S.real < 0) & (S.imag < 0) )
+	np.testing.assert_allclose(Sdeg[valid], Sdeg_ref[valid], rtol=rtol, atol=1e-9)
+
+
+def test_s_abcd_match_loop():
+	S = random_sri(500, seed=2)
+	for z0 in [complex(50,0), complex(45,3)]:
+		abcd = rfs.s2abcd(S, z0, z0)
+		np.testing.assert_allclose( abcd, loop_s2abcd(S, z0, z0), rtol=rtol, atol=atol)
+		np.testing.assert_allclose( rfs.abcd2s(abcd, z0, z0), loop_abcd2s(abcd, z0, z0), rtol=rtol, atol=atol)
+
+	z0 = complex(50,0)
+	np.testing.assert_allclose( rfs.abcd2s( rfs.s2abcd(S, z0, z0), z0, z0), S, rtol=1e-8, atol=1e-10)
+
+
+def test_z_conversions_match_loop():
+	S = random_sri(500, seed=3)
+	z0 = 50.0
+	Z = rfs.s2z(S, z0)
+	np.testing.assert_allclose( Z, loop_s2z(S, z0), rtol=rtol, atol=1e-9)
+	np.testing.assert_allclose( rfs.z2s(Z, z0), loop_z2s(Z, z0), rtol=rtol, atol=atol)
+	np.testing.assert_allclose( rfs.z2s(Z, z0), S, rtol=1e-8, atol=1e-10)
+	np.testing.assert_allclose( rfs.z2y(Z), loop_z2y(Z), rtol=rtol, atol=atol)
+	np.testing.assert_allclose( rfs.z2abcd(Z), loop_z2abcd(Z), rtol=rtol, atol=1e-9)
+
+
+def test_abcd_z_y_round_trip():
+	S = random_sri(50, seed=4)
+	Z = loop_s2z(S, 50.0)
+	abcd = rfs.z2abcd(Z)
+	np.testing.assert_allclose( rfs.abcd2z(abcd), Z, rtol=1e-9, atol=1e-9)
+	np.testing.assert_allclose( rfs.abcd2y(abcd), loop_z2y(Z), rtol=1e-9, atol=1e-12)
+
+
+def test_resample_mag_phase():
+	# a delay line (constant magnitude, phase linear in frequency, wrapping many times) is resampled exactly
+	freq_src = np.linspace(1e9, 20e9, 97)
+	freq_dst = np.linspace(1e9, 20e9, 1001)
+	delay = np.array( [ [10e-12, 250e-12], [250e-12, 10e-12] ] )
+	M_src = 0.5 * np.exp( -2j*np.pi*freq_src[:, None, None]*delay )
+	M_dst = 0.5 * np.exp( -2j*np.pi*freq_dst[:, None, None]*delay )
+	np.testing.assert_allclose( rfs.resample_mag_phase(freq_src, M_src, freq_dst), M_dst, rtol=1e-9, atol=1e-12)
+	np.testing.assert_allclose( rfs.resample_mag_phase(freq_src, np.stack( (M_src, 2*M_src) ), freq_dst)[1], 2*M_dst, rtol=1e-9, atol=1e-12)
+	np.testing.assert_allclose( rfs.common_freq_grid( [freq_src, freq_dst[5:-5]] ), freq_dst[5:-5] )
+
+
+def test_closed_form_2x2_matches_scipy():
+	import scipy.linalg as sla
+	rng = np.random.default_rng(4)
+	M = rng.normal(size=(300, 2, 2)) + 1j*rng.normal(size=(300, 2, 2))
+	M[0] = np.zeros((2, 2)) # singular point takes the scipy fallback path
+	root = rfs.sqrtm_2x2(M)
+	root_ref = np.array([ sla.sqrtm(mm) for mm in M[1:] ])
+	np.testing.assert_allclose( root[1:], root_ref, rtol=1e-8, atol=1e-12)
+	np.testing.assert_allclose( root[0], np.zeros((2, 2)), atol=atol)
+	np.testing.assert_allclose( rfs.inv_2x2(M[1:]), la.inv(M[1:]), rtol=1e-8, atol=1e-12)
+
+
+
+def test_touchstone_formats():
+	S = random_sri(7, seed=5)
+	freq_ghz = np.linspace(1, 7, 7)
+	Sdb_ref = rfs.sri2sdb(S)[0]
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		for (option_line, S_a, S_b, z0_ref) in [ ("# GHZ S RI R 50", S.real, S.imag, 50), ("# ghz s ma r 50", np.abs(S), np.angle(S, deg=True), 50), ("# GHz S DB R 50", Sdb_ref, np.angle(S, deg=True), 50) ]:
+			filename = os.path.join(tmp_dir, "test.s2p")
+			with open(filename, 'w') as outfile:
+				outfile.write("! comment\n" + option_line + "\n")
+				for idx in range(len(freq_ghz)):
+					# Touchstone order is S11, S21, S12, S22, split over two lines here
+					values = [ S_a[idx, 0, 0], S_b[idx, 0, 0], S_a[idx, 1, 0], S_b[idx, 1, 0], S_a[idx, 0, 1], S_b[idx, 0, 1], S_a[idx, 1, 1], S_b[idx, 1, 1] ]
+					outfile.write("{0:.15g} ".format(freq_ghz[idx]) + " ".join( [ "{0:.15g}".format(value) for value in values[0:4] ] ) + " ! trailing\n")
+					outfile.write(" ".join( [ "{0:.15g}".format(value) for value in values[4:] ] ) + "\n")
+			(freq_hz, Sdb, Sdeg) = rfs.get_sdb_from_file(filename)
+			np.testing.assert_allclose( freq_hz, freq_ghz*1e9, rtol=rtol)
+			np.testing.assert_allclose( rfs.sdb2sri(Sdb, Sdeg), S, rtol=1e-9, atol=atol)
+
+		# data against another reference impedance is renormalized to 50 Ohms
+		S_25 = rfs.z2s( rfs.s2z(S, 50.0), 25.0)
+		with open(filename, 'w') as outfile:
+			outfile.write("# HZ S RI R 25\n")
+			for idx in range(len(freq_ghz)):
+				values = [ S_25[idx, 0, 0], S_25[idx, 1, 0], S_25[idx, 0, 1], S_25[idx, 1, 1] ]
+				outfile.write("{0:.15g} ".format(freq_ghz[idx]) + " ".join( [ "{0:.15g} {1:.15g}".format(value.real, value.imag) for value in values ] ) + "\n")
+		(freq_hz, Sdb, Sdeg) = rfs.get_sdb_from_file(filename)
+		np.testing.assert_allclose( rfs.sdb2sri(Sdb, Sdeg), S, rtol=1e-9, atol=1e-12)
+
+		# or to the z0 asked for, cached separately per z0
+		cache_dir = os.path.join(tmp_dir, "cache")
+		for (z0, S_expected) in [ (50.0, S), (25.0, S_25), (50.0, S) ]:
+			(freq_hz, Sdb, Sdeg) = rfs.get_sdb_from_file(filename, cache_dir, z0)
+			np.testing.assert_allclose( rfs.sdb2sri(Sdb, Sdeg), S_expected, rtol=1e-9, atol=1e-12)
+
+
+def test_nport_conversions():
+	# 2N-port conversions reduce to the 2-port ones and round trip for 4 ports
+	S = random_sri(50)
+	np.testing.assert_allclose( rfs.s2abcd_nport(S, 50.0), rfs.s2abcd(S, 50.0), rtol=rtol, atol=atol)
+	np.testing.assert_allclose( rfs.abcd2s_nport(rfs.s2abcd(S, 50.0), 50.0), S, rtol=rtol, atol=atol)
+	rng = np.random.default_rng(1)
+	S4 = 0.2 * rng.uniform(0.05, 0.95, (50, 4, 4)) * np.exp(1j*rng.uniform(-np.pi, np.pi, (50, 4, 4)))
+	np.testing.assert_allclose( rfs.abcd2s_nport( rfs.s2abcd_nport(S4, 50.0), 50.0), S4, rtol=rtol, atol=atol)
+	abcd = rfs.s2abcd_nport(S4, 50.0)
+	np.testing.assert_allclose( rfs.sqrtm_nport(abcd) @ rfs.sqrtm_nport(abcd), abcd, rtol=1e-8, atol=1e-10)
+	S4_swapped = rfs.reorder_ports(S4, [0, 2, 1, 3])
+	assert S4_swapped[3, 1, 2] == S4[3, 2, 1]
+
+
+def test_nport_readers():
+	# A 4-port VNA CSV (named S columns in any order) and the same data as a .s4p file
+	rng = np.random.default_rng(2)
+	freq_hz = np.linspace(1e9, 2e9, 5)
+	S = 0.2 * rng.uniform(0.05, 0.95, (5, 4, 4)) * np.exp(1j*rng.uniform(-np.pi, np.pi, (5, 4, 4)))
+	(Sdb, Sdeg) = rfs.sri2sdb(S)
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		filename = os.path.join(tmp_dir, "500_3um_1.csv")
+		with open(filename, 'w') as outfile:
+			outfile.write("!CSV A.01.01\nBEGIN CH1_DATA\nFreq(Hz)")
+			for col in range(4):
+				for row in range(4):
+					outfile.write(",S{0:d}{1:d}(DB),S{0:d}{1:d}(DEG)".format(row+1, col+1))
+			outfile.write("\n")
+			for idx in range(len(freq_hz)):
+				values = [ "{0:.15g},{1:.15g}".format(Sdb[idx, row, col], Sdeg[idx, row, col]) for col in range(4) for row in range(4) ]
+				outfile.write("{0:.15g},".format(freq_hz[idx]) + ",".join(values) + "\n")
+			outfile.write("END\n")
+		(freq_csv, Sdb_csv, Sdeg_csv) = rfs.get_sdb_nport_from_file(filename)
+		np.testing.assert_allclose( rfs.sdb2sri(Sdb_csv, Sdeg_csv), S, rtol=1e-9, atol=1e-12)
+
+		# the 2-port reader refuses it, and leaves nothing in the cache the N-port reader would pick up
+		cache_dir = os.path.join(tmp_dir, "cache")
+		try:
+			rfs.get_sdb_from_file(filename, cache_dir)
+			assert False, "2-port reader accepted a 4-port CSV"
+		except ValueError:
+			pass
+		(freq_csv, Sdb_csv, Sdeg_csv) = rfs.get_sdb_nport_from_file(filename, cache_dir)
+		np.testing.assert_allclose( rfs.sdb2sri(Sdb_csv, Sdeg_csv), S, rtol=1e-9, atol=1e-12)
+		(freq_csv, Sdb_csv, Sdeg_csv) = rfs.get_sdb_nport_from_file(filename, cache_dir)
+		np.testing.assert_allclose( rfs.sdb2sri(Sdb_csv, Sdeg_csv), S, rtol=1e-9, atol=1e-12)
+
+		filename = os.path.join(tmp_dir, "500_3um_1.s4p")
+		with open(filename, 'w') as outfile:
+			outfile.write("# HZ S RI R 50\n")
+			for idx in range(len(freq_hz)):
+				outfile.write("{0:.15g}".format(freq_hz[idx]))
+				for row in range(4):
+					outfile.write(" " + " ".join( [ "{0:.15g} {1:.15g}".format(S[idx, row, col].real, S[idx, row, col].imag) for col in range(4) ] ) + "\n")
+		(freq_s4p, Sdb_s4p, Sdeg_s4p) = rfs.get_sdb_nport_from_file(filename)
+		np.testing.assert_allclose( freq_s4p, freq_hz)
+		np.testing.assert_allclose( rfs.sdb2sri(Sdb_s4p, Sdeg_s4p), S, rtol=1e-9, atol=1e-12)
+
+
+if (__name__ == "__main__"):
+	test_sdb_sri_round_trip()
+	test_sri2sdb_matches_loop()
+	test_s_abcd_match_loop()
+	test_z_conversions_match_loop()
+	test_abcd_z_y_round_trip()
+	test_resample_mag_phase()
+	test_closed_form_2x2_matches_scipy()
+	test_touchstone_formats()
+	test_nport_conversions()
+	test_nport_readers()
+	print("All conversion tests passed")
@@ -0,0 +1,293 @@
+import numpy as np
+import argparse
+import glob
+import json
+import os
+import os.path
+import queue
+import re
+import threading
+import time
+import extraction as ex
+import pad_library
+import plot_render
+import result_cache
+
+# Resident extraction service for a folder the probe station keeps writing measurements into
+#	python service.py 500_3um_1.csv 1000_3um_1.csv --watch_dir . --port 8765
+#	python service.py --pad_model gsg100_wafer3 --watch_dir /data/wafer3
+# The pads are extracted (or loaded from the pad library) once at startup and the libraries stay imported.
+# The watch directory is polled every --interval seconds for $LENGTH_$WIDTHum_$SAMPLE.csv/.s2p files; a new or changed
+# file is extracted once its size and mtime have held still for one poll (so half written files are skipped), its
+# rlgc_*.csv is written, and the aggregate R/L/G/C.csv and averaged R outputs are rewritten from the results held in
+# memory. Nothing already extracted is redone. A file deleted from the watch directory is dropped from the aggregates.
+#
+# With --port, a local HTTP endpoint (bound to 127.0.0.1) takes
+#	GET  /status				JSON: structures extracted, files waiting to settle, errors, last update
+#	POST /submit {"filename": "..."}	extract that file on the next poll, even from outside the watch directory
+#
+# Stop with Ctrl-C.
+
+structure_name_re = re.compile(r"^\d+_\d+um_.+\.(csv|s2p)$", re.IGNORECASE)
+aggregates_error_key = "write_aggregates" # errors entry for the last failed R/L/G/C.csv write
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("pad_L_csv_file", nargs="?", default=None, help="Filename for L structure measurement to be used for pad extraction. Not needed with --pad_model or --skip_deembed")
+	parser.add_argument("pad_2L_csv_file", nargs="?", default=None, help="Filename for 2L structure measurement to be used for pad extraction. Not needed with --pad_model or --skip_deembed")
+	parser.add_argument("--watch_dir", default=".", help="Directory to watch for new measurements. Default is the current directory")
+	parser.add_argument("--interval", type=float, default=0.25, help="Seconds between polls of the watch directory. Default is 0.25")
+	parser.add_argument("--port", type=int, default=0, help="Serve status and job submission on http://127.0.0.1:PORT. Default is 0 (no endpoint)")
+	parser.add_argument("--pad_model", default=None, help="Stored pad model (name or .pad.npz path, see pad_library.py) to de-embed with")
+	parser.add_argument("--pad_library", default=None, help="Pad library directory. Default is $RLGC_PAD_LIBRARY, or ~/.rlgc_pad_library")
+	parser.add_argument("--skip_deembed", default=False, action='store_true', help="Skip pad deembedding")
+	parser.add_argument("--z0_real", type=float, default=50, help="Real portion of probe impedance. Default is 50 Ohms")
+	parser.add_argument("--z0_imag", type=float, default=0, help="Imaginary portion of probe impedance. Default is 0 Ohms")
+	parser.add_argument("--method", default="distributed", choices=["distributed", "lumped"], help="Type of RLGC extraction to perform. Default is distributed")
+	parser.add_argument("--branch", default="principal", choices=["principal", "unwrap"], help="arccosh branch for distributed extraction (see extraction.py)")
+	parser.add_argument("--plots", action="store_true", default=False, help="Render the plots of every new structure as it is extracted")
+	parser.add_argument("--tag", default="", help="Output file tag")
+	parser.add_argument("--output_dir", default="extract", help="Directory to store outputs")
+	parser.add_argument("--cache_dir", default=None, help="Directory for cached parsed measurements")
+	parser.add_argument("--result_cache_dir", default=None, help="Directory for cached extraction results, so a restarted service doesn't extract everything again")
+	args = parser.parse_args()
+
+	if (args.pad_model is None) and not args.skip_deembed and ((args.pad_L_csv_file is None) or (args.pad_2L_csv_file is None)):
+		parser.error("the pad L/2L files are required unless --pad_model or --skip_deembed is given")
+
+	service = ExtractionService(args.watch_dir, args.pad_L_csv_file, args.pad_2L_csv_file, complex(args.z0_real, args.z0_imag), args.method, args.skip_deembed, args.tag, args.output_dir, args.cache_dir, args.result_cache_dir, args.pad_model, args.pad_library, args.branch, args.plots)
+	if args.port:
+		server = service.serve(args.port)
+		print("Serving on http://{0:s}:{1:d}".format(*server.server_address[0:2]) )
+	print("Watching {0:s} (Ctrl-C to stop)".format( os.path.abspath(args.watch_dir) ) )
+	try:
+		service.run(args.interval)
+	except KeyboardInterrupt:
+		pass
+
+
+class ExtractionService:
+
+	def __init__(self, watch_dir, pad_L_csv_filename=None, pad_2L_csv_filename=None, z0_probe=complex(50.0,0), method="distributed", skip_deembed=False, output_tag="", output_dir="extract", cache_dir=None, result_cache_dir=None, pad_model=None, pad_library_dir=None, branch="principal", plots=False):
+		self.watch_dir = watch_dir
+		self.z0_probe = z0_probe
+		self.method = method
+		self.skip_deembed = skip_deembed
+		self.output_tag = output_tag
+		self.output_dir = output_dir
+		self.cache_dir = cache_dir
+		self.result_cache_dir = result_cache_dir
+		self.branch = branch
+		self.plots = plots
+		if not os.path.exists(output_dir):
+			os.makedirs(output_dir)
+
+		# Pads once, for the life of the service
+		self.freq_pad = None
+		self.abcd_pad_inv = []
+		self.pad_key = "no_deembed"
+		if skip_deembed:
+			pass
+		elif pad_model is not None:
+			(self.freq_pad, abcd_pad, self.abcd_pad_inv, model_z0, model_meta) = pad_library.load_pad_model(pad_model, pad_library_dir, z0_probe)
+			self.pad_key = "pad_model" + result_cache.file_digest( pad_library.pad_model_path(pad_model, pad_library_dir) )
+		else:
+			(self.freq_pad, abcd_pad, self.abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = ex.get_pad_abcd(pad_L_csv_filename, pad_2L_csv_filename, z0_probe, cache_dir)
+			if result_cache_dir:
+				self.pad_key = result_cache.pad_digest(pad_L_csv_filename, pad_2L_csv_filename)
+
+		self.results = {} # abs filename -> (name, length_um, width_um, sample, freq, R, L, G, C)
+		self.seen = {} # abs filename -> (size, mtime) it was extracted at
+		self.settling = {} # abs filename -> (size, mtime) at the last poll, for files not yet extracted
+		self.errors = {} # abs filename (or aggregates_error_key) -> message
+		self.aggregates_stale = False # results changed since R/L/G/C.csv were last written
+		self.submitted = queue.Queue()
+		self.lock = threading.Lock()
+		self.last_update = None
+
+	def poll(self):
+		# One pass over the watch directory and the submitted jobs; returns the files extracted
+		todo_list = []
+		for filename in sorted( glob.glob( os.path.join(self.watch_dir, "*") ) ):
+			if not structure_name_re.match( os.path.basename(filename) ):
+				continue
+			abs_filename = os.path.abspath(filename)
+			try:
+				stat = os.stat(abs_filename)
+			except OSError:
+				continue
+			state = (stat.st_size, stat.st_mtime)
+			if self.seen.get(abs_filename) == state:
+				continue
+			# extract once the file stopped changing between two polls
+			if self.settling.get(abs_filename) == state:
+				todo_list.append(abs_filename)
+			else:
+				with self.lock:
+					self.settling[abs_filename] = state
+
+		while True:
+			try:
+				abs_filename = self.submitted.get_nowait()
+			except queue.Empty:
+				break
+			if abs_filename not in todo_list:
+				todo_list.append(abs_filename)
+
+		if self.drop_deleted() > 0:
+			self.aggregates_stale = True
+		done_list = [ abs_filename for abs_filename in todo_list if self.extract_file(abs_filename) ]
+		if len(done_list) > 0:
+			self.aggregates_stale = True
+		if self.aggregates_stale:
+			# like extract_file, a failure is recorded and the write tried again on the next poll
+			try:
+				self.write_aggregates()
+			except Exception as err:
+				with self.lock:
+					self.errors[aggregates_error_key] = "{0:s}: {1:s}".format(type(err).__name__, str(err))
+				print("Failed writing aggregates: {0:s}".format(self.errors[aggregates_error_key]) )
+			else:
+				with self.lock:
+					self.errors.pop(aggregates_error_key, None)
+				self.aggregates_stale = False
+
+		return done_list
+
+	def drop_deleted(self):
+		# Forgets files that no longer exist; returns the number of extracted results dropped
+		with self.lock:
+			deleted_list = [ abs_filename for abs_filename in set(self.results) | set(self.seen) | set(self.settling) | set(self.errors) if (abs_filename != aggregates_error_key) and not os.path.isfile(abs_filename) ]
+			num_dropped = 0
+			for abs_filename in deleted_list:
+				if self.results.pop(abs_filename, None) is not None:
+					num_dropped += 1
+				for state_dict in [self.seen, self.settling, self.errors]:
+					state_dict.pop(abs_filename, None)
+			if num_dropped > 0:
+				self.last_update = time.time()
+
+		return num_dropped
+
+	def extract_file(self, abs_filename):
+		# Extracts (or takes from the result cache) one structure; errors are recorded, not raised
+		# A file that failed is tried again once it changes
+		try:
+			stat = os.stat(abs_filename)
+		except OSError as err:
+			with self.lock:
+				self.errors[abs_filename] = str(err)
+			return False
+		try:
+			(length_um, width_um, sample) = ex.parse_structure_filename(abs_filename)
+			name = "L{0:d}um_W{1:d}um_{2:s}".format(length_um, width_um, sample)
+			plot_name = name + self.output_tag
+			rlgc_filename = "rlgc_" + plot_name + ".csv"
+			cache_key = None
+			cached = None
+			if self.result_cache_dir:
+				cache_key = result_cache.structure_key(abs_filename, self.pad_key, self.z0_probe, self.method, self.skip_deembed, self.branch)
+				cached = result_cache.load_result(self.result_cache_dir, cache_key)
+			if cached is not None:
+				(freq, R, L, G, C, Sdb, Sdeg) = cached
+				ex.write_structure_outputs(freq, R, L, G, C, Sdb, Sdeg, rlgc_filename, plot_name, self.output_dir, not self.plots)
+			else:
+				(freq, R, L, G, C) = ex.extract_structure(self.abcd_pad_inv, abs_filename, length_um*1e-6, self.z0_probe, self.method, self.skip_deembed, not self.plots, rlgc_filename, plot_name, self.output_dir, self.cache_dir, None, self.result_cache_dir, cache_key, self.freq_pad, self.branch)
+			if self.plots:
+				plot_render.render_plot_data( plot_render.plot_data_path(plot_name, self.output_dir), self.output_dir )
+		except Exception as err:
+			with self.lock:
+				self.errors[abs_filename] = "{0:s}: {1:s}".format(type(err).__name__, str(err))
+				self.settling.pop(abs_filename, None)
+				self.seen[abs_filename] = (stat.st_size, stat.st_mtime)
+			print("Failed {0:s}: {1:s}".format(abs_filename, self.errors[abs_filename]) )
+			return False
+
+		with self.lock:
+			self.results[abs_filename] = (name, length_um, width_um, sample, freq, R, L, G, C)
+			self.seen[abs_filename] = (stat.st_size, stat.st_mtime)
+			self.settling.pop(abs_filename, None)
+			self.errors.pop(abs_filename, None)
+			self.last_update = time.time()
+		print("Extracted {0:s}".format(name) )
+
+		return True
+
+	def write_aggregates(self):
+		# R/L/G/C.csv and the averaged R file over every structure extracted so far, in filename order
+		with self.lock:
+			result_list = [ self.results[abs_filename] for abs_filename in sorted(self.results) ]
+		if len(result_list) == 0:
+			return
+		(name_vec, length_vec, width_vec, sample_vec, freq_mat, R_mat, L_mat, G_mat, C_mat) = [ list(column) for column in zip(*result_list) ]
+		if not all( [ len(freq) == len(freq_mat[0]) and np.allclose(freq, freq_mat[0], rtol=1e-9, atol=0) for freq in freq_mat ] ):
+			(freq_mat, R_mat, L_mat, G_mat, C_mat) = ex.align_results_to_grid(freq_mat, R_mat, L_mat, G_mat, C_mat)
+		ex.write_aggregate_outputs(freq_mat, R_mat, L_mat, G_mat, C_mat, name_vec, length_vec, width_vec, sample_vec, self.output_tag, self.output_dir)
+
+	def submit(self, filename):
+		# Queues filename for the next poll
+		abs_filename = os.path.abspath(filename)
+		if not os.path.isfile(abs_filename):
+			raise FileNotFoundError(filename)
+		if not structure_name_re.match( os.path.basename(abs_filename) ):
+			raise ValueError("{0:s} is not named $LENGTH_$WIDTHum_$SAMPLE.csv".format(filename) )
+		self.submitted.put(abs_filename)
+
+	def status(self):
+		with self.lock:
+			return { "watch_dir": os.path.abspath(self.watch_dir), "output_dir": os.path.abspath(self.output_dir), "structures": sorted( [ result[0] for result in self.results.values() ] ), "settling": sorted(self.settling), "queued": self.submitted.qsize(), "errors": dict(self.errors), "last_update": self.last_update }
+
+	def run(self, interval=0.25, stop_event=None):
+		# Polls until stop_event (a threading.Event) is set, or forever
+		while (stop_event is None) or not stop_event.is_set():
+			start = time.time()
+			self.poll()
+			time.sleep( max(0.0, interval - (time.time() - start)) )
+
+	def serve(self, port, host="127.0.0.1"):
+		# Starts the HTTP endpoint in a background thread, returns the server
+		from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+		service = self
+
+		class Handler(BaseHTTPRequestHandler):
+
+			def send_json(self, code, data):
+				body = json.dumps(data).encode("utf-8")
+				self.send_response(code)
+				self.send_header("Content-Type", "application/json")
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def do_GET(self):
+				if self.path.rstrip("/") == "/status":
+					self.send_json(200, service.status())
+				else:
+					self.send_json(404, { "error": "unknown path " + self.path })
+
+			def do_POST(self):
+				if self.path.rstrip("/") != "/submit":
+					self.send_json(404, { "error": "unknown path " + self.path })
+					return
+				try:
+					request = json.loads( self.rfile.read( int(self.headers.get("Content-Length", 0)) ) )
+					service.submit(request["filename"])
+				except FileNotFoundError as err:
+					self.send_json(404, { "error": "no such file: " + str(err) })
+				except (ValueError, KeyError, TypeError) as err:
+					self.send_json(400, { "error": str(err) })
+				else:
+					self.send_json(202, { "queued": request["filename"] })
+
+			def log_message(self, format, *args):
+				pass # keep the console for extraction messages
+
+		server = ThreadingHTTPServer( (host, port), Handler )
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+
+		return server
+
+
+if (__name__ == "__main__"):
+	main()
@@ -0,0 +1,48 @@
+# Startup-time benchmark / regression guard for the command line scripts
+# Imports each module in a fresh interpreter with python -X importtime and checks that the heavy
+# plotting and SciPy packages are not pulled in at import time (they should only load when used).
+# Run with pytest, or directly with python to print the timing summary.
+import os.path
+import subprocess
+import sys
+
+repo_dir = os.path.dirname( os.path.abspath(__file__) )
+script_modules = ["rf_support", "extraction", "quick_extract", "measurement_set", "plot_render", "streaming", "csv_to_s2p", "synthetic", "benchmark", "profiling", "pad_library", "uncertainty", "service", "multiport", "catalog"]
+heavy_packages = ["matplotlib", "scipy"]
+
+
+def import_times(module_name):
+	# Returns (total import time in us, {module: cumulative us}) for importing module_name in a clean interpreter
+	proc = subprocess.run( [sys.executable, "-X", "importtime", "-c", "import " + module_name], cwd=repo_dir, capture_output=True, text=True)
+	if proc.returncode != 0:
+		raise RuntimeError("importing {0:s} failed:\n{1:s}".format(module_name, proc.stderr))
+
+	cumulative_us = {}
+	for line in proc.stderr.splitlines():
+		if not line.startswith("import time:"):
+			continue
+		fields = line[len("import time:"):].split("|")
+		if (len(fields) != 3) or not fields[1].strip().isdigit():
+			continue # column header
+		cumulative_us[ fields[2].strip() ] = int(fields[1])
+
+	return (cumulative_us.get(module_name, 0), cumulative_us)
+
+
+def heavy_imports(cumulative_us):
+	return sorted( [ name for name in cumulative_us if name.split(".")[0] in heavy_packages ] )
+
+
+def test_no_heavy_imports_at_startup():
+	for module_name in script_modules:
+		(total_us, cumulative_us) = import_times(module_name)
+		assert heavy_imports(cumulative_us) == [], "{0:s} imports {1:s} at startup".format(module_name, ", ".join(heavy_imports(cumulative_us)[0:5]))
+
+
+if (__name__ == "__main__"):
+	for module_name in script_modules:
+		(total_us, cumulative_us) = import_times(module_name)
+		slowest = sorted( [ (us, name) for (name, us) in cumulative_us.items() if name != module_name and "." not in name ], reverse=True )[0:3]
+		slowest_str = ", ".join( [ "{0:s} {1:.1f}ms".format(name, us/1e3) for (us, name) in slowest ] )
+		heavy_str = ", ".join( heavy_imports(cumulative_us)[0:3] ) or "none"
+		print("{0:16s} {1:8.1f} ms   heavy: {2:s}   slowest: {3:s}".format(module_name, total_us/1e3, heavy_str, slowest_str) )
@@ -0,0 +1,149 @@
+import numpy as np
+import glob
+import re
+import os
+import os.path
+import itertools
+import rf_support as rfs
+import extraction as ex
+
+# Streaming (chunked) RLGC extraction for sweeps too large to hold in memory
+# The pad L/2L files and every structure file are read together, chunk_points frequency points at a time.
+# Each chunk goes through the same conversion, pad extraction, de-embedding and RLGC extraction as
+# extract_rlgc, and its rows are appended straight to the output CSVs, so memory use depends on the chunk
+# size and the number of structures, never on the length of the sweep. Every step is per frequency point,
+# so the results are the same as a normal run.
+#
+#	python extraction.py pad_L.csv pad_2L.csv --stream_chunk 100000
+#
+# Only the CSV outputs (rlgc_*.csv, R/L/G/C.csv and the averaged R file) are written; no plots or result stores,
+# since those need whole sweeps in memory.
+#
+# Input files are reopened for every chunk at the offset where the previous one ended, and rlgc_*.csv are appended
+# to one at a time, so the number of open files doesn't grow with the number of structures either.
+
+
+def iter_vna_csv_chunks(filename, chunk_points=65536):
+	# Yields (freq_hz, Sdb, Sdeg) for consecutive blocks of at most chunk_points frequency points of a VNA CSV
+	# (same layout as rf_support.get_sdb_from_vna_csv)
+	# The file is only open while a chunk is read; the next one starts from the saved byte offset
+	with open(filename, 'rb') as infile:
+		# Header row is the first one whose first column mentions Freq; data rows follow it
+		for line in infile:
+			if re.search("Freq", line.decode().split(",", 1)[0]):
+				break
+		offset = infile.tell()
+
+	while True:
+		with open(filename, 'rb') as infile:
+			infile.seek(offset)
+			lines = list( itertools.islice(infile, chunk_points) )
+			offset = infile.tell()
+		if len(lines) == 0:
+			break
+		data_lines = [ line.decode().rstrip("\r\n") for line in lines if line.count(b",") == 8 ]
+		if len(data_lines) == 0:
+			continue
+		data = rfs.parse_csv_block(data_lines, 9)
+
+		freq_hz = data[:, 0].copy()
+		Sdb = data[:, 1::2].reshape(-1, 2, 2) # S11, S12, S21, S22 in DB
+		Sdeg = data[:, 2::2].reshape(-1, 2, 2) # S11, S12, S21, S22 in DEG
+		yield (freq_hz, Sdb, Sdeg)
+
+
+def iter_aligned_chunks(filename_list, chunk_points=65536):
+	# Yields a list of (freq_hz, Sdb, Sdeg), one per file, for each chunk of frequency points
+	# Every file must be on the same frequency grid
+	iter_list = [ iter_vna_csv_chunks(filename, chunk_points) for filename in filename_list ]
+	for chunk_list in itertools.zip_longest(*iter_list):
+		for (idx, chunk) in enumerate(chunk_list):
+			if (chunk is None) or (len(chunk[0]) != len(chunk_list[0][0])):
+				raise ValueError("{0:s} has a different number of frequency points than {1:s}".format(filename_list[idx], filename_list[0]) )
+			if not np.allclose(chunk[0], chunk_list[0][0], rtol=1e-9, atol=0):
+				raise ValueError("{0:s} is not on the same frequency grid as {1:s}".format(filename_list[idx], filename_list[0]) )
+		yield chunk_list
+
+
+def extract_rlgc_streaming(pad_L_csv_filename, pad_2L_csv_filename, z0_probe=complex(50.0,0), method="distributed", struct_csv_name="*.csv", skip_deembed=False, output_tag="", output_dir="extract", chunk_points=65536):
+	# Same outputs as extraction.extract_rlgc with output_format="csv" and skip_plots=True
+	# Returns (name_vec, length_vec, width_vec, R_avg_vec) -- the full R/L/G/C matrices are never held in memory
+
+	file_list = glob.glob(struct_csv_name)
+	for filename in [pad_L_csv_filename, pad_2L_csv_filename] + file_list:
+		if rfs.is_touchstone_file(filename):
+			raise ValueError("Streaming extraction reads VNA CSV files only, not {0:s}".format(filename))
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+
+	print("Pad Deembedding file (L):  {0:s}".format(pad_L_csv_filename) )
+	print("Pad Deembedding file (2L): {0:s}".format(pad_2L_csv_filename) )
+	print("Extracting RLGC using {0:s} method, {1:d} points at a time...".format(method, chunk_points))
+	name_vec = []
+	length_vec = []
+	width_vec = []
+	rlgc_filename_list = []
+	for filename in file_list:
+		(trace_length_um, trace_width_um, data_final_str) = ex.parse_structure_filename(filename)
+		print("\tL: {0:d}um \t W: {1:d}um \t Sample: {2:s}".format(trace_length_um, trace_width_um, data_final_str) )
+
+		structure_string = "L{0:d}um_W{1:d}um_{2:s}".format(trace_length_um, trace_width_um, data_final_str)
+		name_vec.append(structure_string)
+		length_vec.append(trace_length_um)
+		width_vec.append(trace_width_um)
+		rlgc_filename_list.append( os.path.join(output_dir, "rlgc_" + structure_string + output_tag + ".csv") )
+	length_m_vec = np.array(length_vec, dtype=float) * 1e-6
+
+	# the pad files are read alongside the structures, so they only need one chunk in memory too
+	if skip_deembed:
+		read_list = list(file_list)
+	else:
+		read_list = [pad_L_csv_filename, pad_2L_csv_filename] + file_list
+	num_pad_files = len(read_list) - len(file_list)
+
+	R_sum = np.zeros( (len(file_list)) )
+	R_count = 0
+	for filename in rlgc_filename_list:
+		open(filename, 'w').close()
+	data_outfiles = {}
+	try:
+		for data_name in ["R", "L", "C", "G"]:
+			data_outfiles[data_name] = open( os.path.join(output_dir, data_name + output_tag + ".csv"), 'w')
+			data_outfiles[data_name].write("{0:s},{1:s}\n".format("Freq (Hz)", ",".join(name_vec)) )
+
+		for chunk_list in iter_aligned_chunks(read_list, chunk_points):
+			if skip_deembed:
+				abcd_pad_inv = []
+			else:
+				(freq_L, Sdb_L, Sdeg_L) = chunk_list[0]
+				(freq_2L, Sdb_2L, Sdeg_2L) = chunk_list[1]
+				(freq, abcd_pad, abcd_pad_inv, Sri_pad, Sdb_pad, Sdeg_pad) = ex.get_pad_abcd_from_sdb(freq_L, Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, z0_probe)
+
+			struct_chunks = chunk_list[num_pad_files:]
+			if len(struct_chunks) == 0:
+				continue
+			freq = struct_chunks[0][0]
+			Sdb = np.array( [ chunk[1] for chunk in struct_chunks ] )
+			Sdeg = np.array( [ chunk[2] for chunk in struct_chunks ] )
+			abcd_meas = rfs.s2abcd( rfs.sdb2sri(Sdb, Sdeg), 50.0 + 0.0j ) # same reference impedance as MeasurementSet/get_rf_params_from_vna_csv
+
+			(freq_stack, R_stack, L_stack, G_stack, C_stack) = ex.extract_rlgc_stacked(freq, length_m_vec, abcd_pad_inv, abcd_meas, z0_probe, method, skip_deembed)
+
+			for (idx, filename) in enumerate(rlgc_filename_list):
+				with open(filename, 'a') as outfile:
+					ex.write_csv_block(outfile, np.column_stack( (freq, R_stack[idx], L_stack[idx], G_stack[idx], C_stack[idx]) ) )
+			for (data_name, data_stack) in [ ("R", R_stack), ("L", L_stack), ("C", C_stack), ("G", G_stack) ]:
+				ex.write_csv_block(data_outfiles[data_name], np.column_stack( (freq, data_stack.T) ) )
+
+			freq_mask = (freq >= ex.avg_freq_min) & (freq <= ex.avg_freq_max)
+			R_sum += np.sum(R_stack[:, freq_mask], axis=1)
+			R_count += np.count_nonzero(freq_mask)
+	finally:
+		for outfile in data_outfiles.values():
+			outfile.close()
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		R_avg_vec = R_sum / R_count
+	ex.write_averaged_R_outputs(length_vec, R_avg_vec, output_tag, output_dir)
+
+	return (name_vec, length_vec, width_vec, R_avg_vec)
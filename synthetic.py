@@ -0,0 +1,164 @@
+import numpy as np
+import argparse
+import os
+import os.path
+import rf_support as rfs
+import extraction as ex
+
+# Synthetic VNA measurements of transmission lines with known RLGC, for tests and benchmarks
+# Each structure is pad -> uniform line -> pad, written in the same CSV layout the VNA exports, and named
+# $LENGTH_$WIDTHum_$SAMPLE.csv so extraction.py picks up the length and width:
+#	python synthetic.py synth_dir --points 20001 --lengths 500 1000 2000 --widths 3 5
+#	cd synth_dir; python ../extraction.py 500_3um_1.csv 1000_3um_1.csv
+
+
+# Line and pad parameters used unless others are given
+default_rlgc = (2e3, 4e-7, 1e-3, 1.5e-10) # R (Ohm/m), L (H/m), G (S/m), C (F/m)
+default_pad = (1.0, 20e-12, 30e-15) # series R (Ohm), series L (H), shunt C (F)
+# Coupled pair for multiconductor (4-port) data: per unit length R, L, G, C matrices
+default_mtl_rlgc = ( np.array( [[2e3, 2e2], [2e2, 2e3]] ), np.array( [[4e-7, 1e-7], [1e-7, 4e-7]] ), np.array( [[1e-3, -2e-4], [-2e-4, 1e-3]] ), np.array( [[1.5e-10, -3e-11], [-3e-11, 1.5e-10]] ) )
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("output_dir", help="Directory to write the synthetic CSVs to")
+	parser.add_argument("--points", type=int, default=401, help="Number of frequency points. Default is 401")
+	parser.add_argument("--freq_min", type=float, default=10e6, help="First frequency in Hz. Default is 10 MHz")
+	parser.add_argument("--freq_max", type=float, default=20e9, help="Last frequency in Hz. Default is 20 GHz")
+	parser.add_argument("--lengths", type=int, nargs="+", default=[500, 1000, 2000], help="Structure lengths in um. Default is 500 1000 2000")
+	parser.add_argument("--widths", type=int, nargs="+", default=[3, 5], help="Structure widths in um. Default is 3 5")
+	parser.add_argument("--samples", type=int, default=1, help="Number of copies (samples) of every length/width. Default is 1")
+	args = parser.parse_args()
+
+	samples = [ str(idx+1) for idx in range(args.samples) ]
+	filename_list = write_measurement_set(args.output_dir, args.points, args.lengths, args.widths, samples, args.freq_min, args.freq_max)
+	print("Wrote {0:d} files of {1:d} points to {2:s}".format(len(filename_list), args.points, args.output_dir) )
+
+
+def line_abcd(freq, length_m, rlgc=default_rlgc):
+	# ABCD matrices (F, 2, 2) of a uniform line with per unit length (R, L, G, C)
+	(R, L, G, C) = rlgc
+	omega = 2*np.pi*np.asarray(freq, dtype=float)
+	Z = R + 1j*omega*L
+	Y = G + 1j*omega*C
+	gamma_l = np.sqrt(Z*Y) * length_m
+	Zc = np.sqrt(Z/Y)
+
+	return rfs.stack_2x2( np.cosh(gamma_l), Zc*np.sinh(gamma_l), np.sinh(gamma_l)/Zc, np.cosh(gamma_l) )
+
+
+def pad_abcd(freq, pad=default_pad):
+	# ABCD matrices (F, 2, 2) of a probe pad: series R + L followed by a shunt C
+	(R_s, L_s, C_p) = pad
+	omega = 2*np.pi*np.asarray(freq, dtype=float)
+	ones = np.ones( omega.shape, dtype=complex )
+	zeros = np.zeros( omega.shape, dtype=complex )
+	series = rfs.stack_2x2( ones, R_s + 1j*omega*L_s, zeros, ones )
+	shunt = rfs.stack_2x2( ones, zeros, 1j*omega*C_p, ones )
+
+	return series @ shunt
+
+
+def structure_abcd(freq, length_m, rlgc=default_rlgc, pad=default_pad):
+	# pad -> line -> pad, the same pad on both ends (what get_pad_abcd assumes)
+	abcd_pad = pad_abcd(freq, pad)
+	return abcd_pad @ line_abcd(freq, length_m, rlgc) @ abcd_pad
+
+
+def write_vna_csv(filename, freq, abcd, z0=50.0):
+	# Writes ABCD matrices as a VNA CSV (freq, then S11, S12, S21, S22 in DB/DEG)
+	(Sdb, Sdeg) = rfs.sri2sdb( rfs.abcd2s(abcd, complex(z0), complex(z0)) )
+	num_freqs = len(freq)
+	s_columns = np.stack( (Sdb.reshape(num_freqs, 4), Sdeg.reshape(num_freqs, 4)), axis=-1 ).reshape(num_freqs, 8)
+
+	with open(filename, 'w') as outfile:
+		outfile.write("!CSV A.01.01\nBEGIN CH1_DATA\n")
+		outfile.write("Freq(Hz),S11(DB),S11(DEG),S12(DB),S12(DEG),S21(DB),S21(DEG),S22(DB),S22(DEG)\n")
+		ex.write_csv_block(outfile, np.column_stack( (freq, s_columns) ), fmt="%.12g")
+		outfile.write("END\n")
+
+
+def write_measurement_set(output_dir, num_points=401, lengths_um=(500, 1000, 2000), widths_um=(3, 5), samples=("1",), freq_min=10e6, freq_max=20e9, rlgc=default_rlgc, pad=default_pad):
+	# Writes one CSV per length/width/sample combination, returns the filenames
+	# Every structure has the same line parameters, so widths only differ by name
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+
+	freq = np.linspace(freq_min, freq_max, num_points)
+	filename_list = []
+	for width_um in widths_um:
+		for length_um in lengths_um:
+			abcd = structure_abcd(freq, length_um*1e-6, rlgc, pad)
+			for sample in samples:
+				filename = os.path.join(output_dir, "{0:d}_{1:d}um_{2:s}.csv".format(length_um, width_um, sample))
+				write_vna_csv(filename, freq, abcd)
+				filename_list.append(filename)
+
+	return filename_list
+
+
+def mtl_abcd(freq, length_m, rlgc=default_mtl_rlgc):
+	# (F, 2N, 2N) ABCD matrices of N uniform coupled lines with per unit length (R, L, G, C) N x N matrices
+	# A = cosh(sqrt(ZY) l), B = F(ZY) Z, C = Y F(ZY), D = Y A Y^-1 with F(x) = sinh(sqrt(x) l) / sqrt(x),
+	# through the modes of ZY (see rf_support for the port numbering)
+	(R, L, G, C) = rlgc
+	omega = 2*np.pi*np.asarray(freq, dtype=float)[:, None, None]
+	Z = R + 1j*omega*L
+	Y = G + 1j*omega*C
+	(eig_vals, T) = np.linalg.eig(Z @ Y)
+	gamma = np.sqrt(eig_vals)
+	T_inv = np.linalg.inv(T)
+	A = (T * np.cosh(gamma*length_m)[..., None, :]) @ T_inv
+	F = (T * (np.sinh(gamma*length_m)/gamma)[..., None, :]) @ T_inv
+
+	return rfs.join_blocks( A, F @ Z, Y @ F, Y @ A @ np.linalg.inv(Y) )
+
+
+def pad_abcd_nport(freq, num_lines, pad=default_pad):
+	# (F, 2N, 2N) ABCD matrices of N uncoupled pads (as pad_abcd) side by side
+	(R_s, L_s, C_p) = pad
+	omega = 2*np.pi*np.asarray(freq, dtype=float)[:, None, None]
+	I = np.broadcast_to( np.eye(num_lines, dtype=complex), omega.shape[0:1] + (num_lines, num_lines) )
+	zeros = np.zeros( I.shape, dtype=complex )
+	series = rfs.join_blocks( I, (R_s + 1j*omega*L_s) * I, zeros, I )
+	shunt = rfs.join_blocks( I, zeros, 1j*omega*C_p * I, I )
+
+	return series @ shunt
+
+
+def write_vna_csv_nport(filename, freq, abcd, z0=50.0):
+	# Writes (F, 2N, 2N) ABCD matrices as a multiport VNA CSV: freq, then S11, S12, ... S(2N)(2N) in DB/DEG
+	(Sdb, Sdeg) = rfs.sri2sdb( rfs.abcd2s_nport(abcd, z0) )
+	num_freqs = len(freq)
+	num_ports = Sdb.shape[-1]
+	s_columns = np.stack( (Sdb.reshape(num_freqs, -1), Sdeg.reshape(num_freqs, -1)), axis=-1 ).reshape(num_freqs, -1)
+	header_list = [ "S{0:d}{1:d}({2:s})".format(row+1, col+1, unit) for row in range(num_ports) for col in range(num_ports) for unit in ["DB", "DEG"] ]
+
+	with open(filename, 'w') as outfile:
+		outfile.write("!CSV A.01.01\nBEGIN CH1_DATA\n")
+		outfile.write("Freq(Hz)," + ",".join(header_list) + "\n")
+		ex.write_csv_block(outfile, np.column_stack( (freq, s_columns) ), fmt="%.12g")
+		outfile.write("END\n")
+
+
+def write_multiport_set(output_dir, num_points=401, lengths_um=(500, 1000, 2000), widths_um=(3,), samples=("1",), freq_min=10e6, freq_max=20e9, rlgc=default_mtl_rlgc, pad=default_pad):
+	# write_measurement_set for coupled lines: one 2N-port CSV per length/width/sample, pads on every conductor
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+
+	freq = np.linspace(freq_min, freq_max, num_points)
+	abcd_pad = pad_abcd_nport(freq, np.shape(rlgc[0])[0], pad)
+	filename_list = []
+	for width_um in widths_um:
+		for length_um in lengths_um:
+			abcd = abcd_pad @ mtl_abcd(freq, length_um*1e-6, rlgc) @ abcd_pad
+			for sample in samples:
+				filename = os.path.join(output_dir, "{0:d}_{1:d}um_{2:s}.csv".format(length_um, width_um, sample))
+				write_vna_csv_nport(filename, freq, abcd)
+				filename_list.append(filename)
+
+	return filename_list
+
+
+if (__name__ == "__main__"):
+	main()
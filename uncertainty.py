@@ -0,0 +1,228 @@
+import numpy as np
+import argparse
+import glob
+import os
+import os.path
+import rf_support as rfs
+import extraction as ex
+import profiling
+
+# Monte Carlo uncertainty of extracted RLGC
+# The measured Sdb/Sdeg of the pad L/2L files and of every structure get K independent draws of Gaussian noise
+# (and optionally of structure length and probe z0), and every draw goes through the same pad extraction,
+# de-embedding and RLGC extraction as extract_rlgc. As there, z0 only enters the pad L/2L conversion to ABCD:
+# structures are always converted at structure_z0 (MeasurementSet's default), so z0 draws perturb the pads, and
+# pads measured on another sweep are extracted on their own grid and then interpolated onto the structures'.
+# The draws are one more leading batch axis on the (N, F, 2, 2) stacks, so the work is a handful of array
+# operations per block of frequencies, not K reruns.
+# Every step is per frequency point, so the sweep is taken in blocks sized to keep draws x structures x block
+# points under block_elements, which bounds memory for any K.
+#
+#	python uncertainty.py pad_L.csv pad_2L.csv --draws 1000 --sigma_db 0.02 --sigma_deg 0.2 --sigma_length_um 2
+#
+# Writes rlgc_mc_$STRUCTURE$TAG.csv per structure: freq, then for each of R, L, G, C the nominal (noise free)
+# value, the mean and standard deviation over the draws and the requested percentiles.
+
+rlgc_names = ["R", "L", "G", "C"]
+structure_z0 = 50.0 + 0.0j
+block_elements = 1 << 18
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("pad_L_csv_file", help="Filename for L structure measurement to be used for pad extraction")
+	parser.add_argument("pad_2L_csv_file", help="Filename for 2L structure measurement to be used for pad extraction")
+	parser.add_argument("--struct_csv_name", default="*.csv", help="Structures to extract (glob). Default is *.csv")
+	parser.add_argument("--skip_deembed", default=False, action='store_true', help="Skip pad deembedding")
+	parser.add_argument("--z0_real", type=float, default=50, help="Real portion of probe impedance. Default is 50 Ohms")
+	parser.add_argument("--z0_imag", type=float, default=0, help="Imaginary portion of probe impedance. Default is 0 Ohms")
+	parser.add_argument("--method", default="distributed", choices=["distributed", "lumped"], help="Type of RLGC extraction to perform. Default is distributed")
+	parser.add_argument("--branch", default="principal", choices=["principal", "unwrap"], help="arccosh branch for distributed extraction (see extraction.py). With unwrap every draw follows the branch of the unwrapped nominal")
+	parser.add_argument("--draws", type=int, default=1000, help="Number of Monte Carlo draws. Default is 1000")
+	parser.add_argument("--sigma_db", type=float, default=0.02, help="Standard deviation of the magnitude noise added to every S parameter, in dB. Default is 0.02")
+	parser.add_argument("--sigma_deg", type=float, default=0.2, help="Standard deviation of the phase noise added to every S parameter, in degrees. Default is 0.2")
+	parser.add_argument("--sigma_length_um", type=float, default=0, help="Standard deviation of the structure lengths (probe placement), in um. Default is 0")
+	parser.add_argument("--sigma_z0", type=float, default=0, help="Standard deviation of the real part of the probe impedance, in Ohms. Default is 0")
+	parser.add_argument("--percentiles", type=float, nargs="+", default=[2.5, 50, 97.5], help="Percentiles to report. Default is 2.5 50 97.5")
+	parser.add_argument("--seed", type=int, default=None, help="Random seed, for repeatable draws")
+	parser.add_argument("--tag", default="", help="Output file tag")
+	parser.add_argument("--output_dir", default="extract", help="Directory to store outputs")
+	parser.add_argument("--cache_dir", default=None, help="Directory for cached parsed measurements")
+	args = parser.parse_args()
+
+	z0_probe = complex(args.z0_real, args.z0_imag)
+	extract_rlgc_uncertainty(args.pad_L_csv_file, args.pad_2L_csv_file, z0_probe, args.method, args.struct_csv_name, args.skip_deembed, args.tag, args.output_dir, args.cache_dir, num_draws=args.draws, sigma_db=args.sigma_db, sigma_deg=args.sigma_deg, sigma_length_um=args.sigma_length_um, sigma_z0=args.sigma_z0, percentiles=args.percentiles, seed=args.seed, branch=args.branch)
+
+
+def extract_rlgc_uncertainty(pad_L_csv_filename, pad_2L_csv_filename, z0_probe=complex(50.0,0), method="distributed", struct_csv_name="*.csv", skip_deembed=False, output_tag="", output_dir="extract", cache_dir=None, measurements=None, num_draws=1000, sigma_db=0.02, sigma_deg=0.2, sigma_length_um=0.0, sigma_z0=0.0, percentiles=(2.5, 50, 97.5), seed=None, branch="principal"):
+	# Monte Carlo extraction of every structure in struct_csv_name (or measurements, a MeasurementSet)
+	# Returns (name_vec, freq, nominal, mean, std, percentile_mat):
+	# nominal, mean and std are (4, N, F) with R, L, G, C along the first axis; percentile_mat is (P, 4, N, F)
+
+	if measurements is None:
+		measurements = ex.load_measurement_stack( sorted( glob.glob(struct_csv_name) ), cache_dir)
+		if measurements is None:
+			raise ValueError("Uncertainty extraction needs every structure on the same frequency grid")
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+
+	freq_pad = None
+	if skip_deembed:
+		(Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L) = (None, None, None, None)
+	else:
+		(freq_L, Sdb_L, Sdeg_L) = measurements.get_sdb(pad_L_csv_filename, cache_dir, z0_probe)
+		(freq_2L, Sdb_2L, Sdeg_2L) = measurements.get_sdb(pad_2L_csv_filename, cache_dir, z0_probe)
+		if not rfs.grids_match(freq_L, freq_2L):
+			raise ValueError("{0:s} and {1:s} are not on the same frequency grid".format(pad_L_csv_filename, pad_2L_csv_filename) )
+		# as in extract_rlgc, structures are only kept where the pad sweep covers them (the pad is never extrapolated)
+		freq_pad = freq_L
+		if not rfs.grids_match(freq_pad, measurements.freq_hz[0]):
+			measurements = measurements.take_freqs( ex.pad_range_mask(freq_pad, measurements.freq_hz[0]) )
+
+	name_vec = [ "L{0:d}um_W{1:d}um_{2:s}".format(length_um, width_um, sample) for (length_um, width_um, sample) in zip(measurements.lengths_um, measurements.widths_um, measurements.samples) ]
+	print("Monte Carlo RLGC extraction: {0:d} structures, {1:d} draws".format(len(name_vec), num_draws) )
+
+	(freq, nominal, mean, std, percentile_mat) = monte_carlo_rlgc(measurements.freq_hz[0], measurements.Sdb, measurements.Sdeg, measurements.lengths_um*1e-6, Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, z0_probe, method, skip_deembed, num_draws, sigma_db, sigma_deg, sigma_length_um*1e-6, sigma_z0, percentiles, seed, branch, freq_pad)
+
+	with profiling.stage("uncertainty outputs", points=np.size(mean[0])):
+		for (idx, name) in enumerate(name_vec):
+			write_rlgc_uncertainty(freq, nominal[:, idx], mean[:, idx], std[:, idx], percentile_mat[:, :, idx], percentiles, "rlgc_mc_" + name + output_tag + ".csv", output_dir)
+
+	return (name_vec, freq, nominal, mean, std, percentile_mat)
+
+
+def monte_carlo_rlgc(freq, Sdb, Sdeg, length_m_vec, Sdb_L=None, Sdeg_L=None, Sdb_2L=None, Sdeg_2L=None, z0_probe=complex(50,0), method="distributed", skip_deembed=False, num_draws=1000, sigma_db=0.02, sigma_deg=0.2, sigma_length_m=0.0, sigma_z0=0.0, percentiles=(2.5, 50, 97.5), seed=None, branch="principal", freq_pad=None):
+	# freq:		(F)		shared frequency grid in Hz
+	# Sdb, Sdeg:	(N, F, 2, 2)	structure measurements
+	# length_m_vec:	(N)		structure lengths in m
+	# Sdb_L ...:	(Fp, 2, 2)	pad L/2L measurements (unused with skip_deembed)
+	# freq_pad:	(Fp)		pad sweep, covering freq (None if the pads are on freq)
+	# Length and z0 draws hold for a whole sweep; the S parameter noise is independent at every point.
+	# Returns (freq, nominal, mean, std, percentile_mat), see extract_rlgc_uncertainty
+
+	rng = np.random.default_rng(seed)
+	freq = np.asarray(freq, dtype=float)
+	length_m_vec = np.asarray(length_m_vec, dtype=float)
+	(num_structures, num_freqs) = np.shape(Sdb)[0:2]
+	if freq_pad is None:
+		freq_pad = freq
+	freq_pad = np.asarray(freq_pad, dtype=float)
+
+	# Noise free extraction, and the branch every draw follows when unwrapping
+	z0_nominal = np.full( (1), complex(z0_probe) )
+	nominal_draw = extract_draws(freq, Sdb[None], Sdeg[None], length_m_vec[None], z0_nominal, pad_draws(Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, None, 0, 0, 1), freq_pad, method, skip_deembed, branch)
+	nominal = nominal_draw[:, 0]
+	draw_branch = branch
+	if (method == "distributed") and (branch != "principal"):
+		draw_branch = nominal_gamma_l(freq, Sdb, Sdeg, z0_nominal, pad_draws(Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, None, 0, 0, 1), freq_pad, skip_deembed, branch)
+
+	length_draws = length_m_vec[None, :] + sigma_length_m * rng.standard_normal( (num_draws, num_structures) )
+	z0_draws = complex(z0_probe) + sigma_z0 * rng.standard_normal( (num_draws) )
+
+	mean = np.zeros( (4, num_structures, num_freqs) )
+	std = np.zeros( (4, num_structures, num_freqs) )
+	percentile_mat = np.zeros( (len(percentiles), 4, num_structures, num_freqs) )
+	block_points = max(1, block_elements // max(1, num_draws*num_structures) )
+	for start in range(0, num_freqs, block_points):
+		block = slice(start, min(start + block_points, num_freqs))
+		block_shape = (num_draws,) + np.shape(Sdb[:, block])
+		pad_block = pad_points(freq_pad, freq[block])
+		with profiling.stage("noise draws", points=num_draws*np.size(Sdb[:, block])//4):
+			Sdb_draws = Sdb[None, :, block] + sigma_db * rng.standard_normal(block_shape)
+			Sdeg_draws = Sdeg[None, :, block] + sigma_deg * rng.standard_normal(block_shape)
+			pads = pad_draws(Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, pad_block, sigma_db, sigma_deg, num_draws, rng)
+
+		block_branch = draw_branch if isinstance(draw_branch, str) else draw_branch[:, block]
+		draws = extract_draws(freq[block], Sdb_draws, Sdeg_draws, length_draws, z0_draws, pads, freq_pad[pad_block], method, skip_deembed, block_branch)
+
+		with profiling.stage("draw statistics", points=np.size(draws)//4):
+			mean[..., block] = np.mean(draws, axis=1)
+			std[..., block] = np.std(draws, axis=1, ddof=1) if num_draws > 1 else 0
+			percentile_mat[..., block] = np.percentile(draws, percentiles, axis=1)
+
+	return (freq, nominal, mean, std, percentile_mat)
+
+
+def pad_points(freq_pad, freq):
+	# Slice of the pad sweep the pad is interpolated from over freq: the points bracketing it
+	# (interpolation is linear, so this gives the same values as the whole sweep)
+	lo = np.searchsorted(freq_pad, freq[0], side="right") - 1
+	hi = np.searchsorted(freq_pad, freq[-1], side="left") + 1
+	lo = min( max(lo, 0), max(len(freq_pad) - 2, 0) )
+	hi = min( max(hi, lo + 2), len(freq_pad) )
+
+	return slice(lo, hi)
+
+
+def pad_draws(Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L, block, sigma_db, sigma_deg, num_draws, rng=None):
+	# (Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L) for num_draws noisy copies of the pad measurements over the points in block,
+	# each (K, Fb, 2, 2); None when there are no pads
+	if Sdb_L is None:
+		return None
+	if block is None:
+		block = slice(None)
+
+	pad_list = []
+	for data in [Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L]:
+		pad_list.append( np.broadcast_to(data[block], (num_draws,) + np.shape(data[block])) )
+	if rng is not None:
+		for (idx, sigma) in enumerate([sigma_db, sigma_deg, sigma_db, sigma_deg]):
+			pad_list[idx] = pad_list[idx] + sigma * rng.standard_normal( np.shape(pad_list[idx]) )
+
+	return tuple(pad_list)
+
+
+def pad_inv_draws(freq, pads, freq_pad, z0_draws):
+	# (K, Fb, 2, 2) pad inverses on freq, one per draw, from pads measured on freq_pad
+	# Like extract_rlgc, the pad is extracted on its own sweep and then interpolated (extraction.align_pad_to_grid)
+	(Sdb_L, Sdeg_L, Sdb_2L, Sdeg_2L) = pads
+	with profiling.stage("pad extraction", points=np.size(Sdb_L)//4):
+		z0_col = z0_draws[:, None]
+		abcd_L = rfs.s2abcd( rfs.sdb2sri(Sdb_L, Sdeg_L), z0_col )
+		abcd_2L = rfs.s2abcd( rfs.sdb2sri(Sdb_2L, Sdeg_2L), z0_col )
+		(abcd_pad, abcd_pad_inv) = ex.pad_abcd_from_abcd(abcd_L, abcd_2L, rfs.matmul_2x2)
+
+	return ex.align_pad_to_grid(freq_pad, abcd_pad_inv, freq)
+
+
+def extract_draws(freq, Sdb_draws, Sdeg_draws, length_draws, z0_draws, pads, freq_pad, method, skip_deembed, branch):
+	# (4, K, N, Fb) R/L/G/C for (K, N, Fb, 2, 2) structure draws, lengths (K, N) and pad z0 (K); pads are on freq_pad
+	with profiling.stage("S -> ABCD", points=np.size(Sdb_draws)//4):
+		abcd_draws = rfs.s2abcd( rfs.sdb2sri(Sdb_draws, Sdeg_draws), structure_z0 )
+	if not skip_deembed:
+		abcd_pad_inv = pad_inv_draws(freq, pads, freq_pad, z0_draws)[:, None]
+		with profiling.stage("de-embed", points=np.size(abcd_draws)//4):
+			# same as extraction.deembed_abcd, with the closed-form 2x2 product (np.matmul is slow on this many tiny matrices)
+			abcd_draws = rfs.matmul_2x2( abcd_pad_inv, rfs.matmul_2x2(abcd_draws, abcd_pad_inv) )
+
+	(freq, R, L, G, C) = ex.extract_rlcg_from_measurement(freq, length_draws[..., None], [], abcd_draws, z0_draws[:, None, None], method, True, branch)
+
+	return np.stack( np.broadcast_arrays(R, L, G, C) )
+
+
+def nominal_gamma_l(freq, Sdb, Sdeg, z0_nominal, pads, freq_pad, skip_deembed, branch):
+	# (N, F) gamma*length of the noise free structures on the requested branch
+	abcd = rfs.s2abcd( rfs.sdb2sri(Sdb, Sdeg), structure_z0 )
+	if not skip_deembed:
+		abcd = ex.deembed_abcd( pad_inv_draws(freq, pads, freq_pad, z0_nominal)[0], abcd)
+
+	return ex.arccosh_branch(freq, abcd[..., 1, 1], branch)
+
+
+def write_rlgc_uncertainty(freq, nominal, mean, std, percentile_mat, percentiles, filename, output_dir=""):
+	# nominal, mean, std: (4, F); percentile_mat: (P, 4, F)
+	filename = os.path.join(output_dir, filename)
+
+	header_list = ["Freq (Hz)"]
+	column_list = [freq]
+	for (idx, name) in enumerate(rlgc_names):
+		header_list += [ name + " nominal", name + " mean", name + " std" ] + [ "{0:s} p{1:g}".format(name, percentile) for percentile in percentiles ]
+		column_list += [ nominal[idx], mean[idx], std[idx] ] + [ percentile_mat[pct_idx, idx] for pct_idx in range(len(percentiles)) ]
+
+	with open(filename, 'w') as outfile:
+		outfile.write(",".join(header_list) + "\n")
+		ex.write_csv_block(outfile, np.column_stack(column_list) )
+
+
+if (__name__ == "__main__"):
+	main()